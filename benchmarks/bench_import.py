@@ -0,0 +1,222 @@
+"""
+Times every stage of variation_importer_utils.validate_vcf on synthetic VCFs
+with DataFileUtil, KBaseReport, the Workspace and GenomeAnnotationAPI replaced
+by local fakes, and reports the peak RSS of each import.
+
+Every combination of the comma separated sizes runs in its own process so the
+peak RSS of one import does not leak into the next, e.g.
+
+    PYTHONPATH=lib python benchmarks/bench_import.py \\
+        --samples 100,1000,10000 --variants 20000 --compression none,bgzf \\
+        --output results.json
+
+vcf_validator_linux is used when it is on the PATH; otherwise the validation
+stage is skipped and reported as such.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    from shutil import which  # py3
+except ImportError:
+    from distutils.spawn import find_executable as which  # py2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import (FakeDataFileUtil, FakeKBaseReport,  # noqa: E402
+                   FakeServiceResolver, FakeWorkspace)
+from synthetic_vcf import COMPRESSIONS, write_locations, write_synthetic_vcf  # noqa: E402
+
+from kb_variation_importer.Utils import variation_importer_utils as importer  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QC_PARAMS = {'maf_threshold': 5, 'geno_missingness': 10, 'indiv_missingness': 10,
+             'hwe_threshold': 1e-6}
+# Columns of the summary table, in pipeline order.
+SUMMARY_STAGES = ('scan', 'population', 'validation', 'sample_qc', 'variation_obj_ref',
+                  'stats', 'report')
+
+
+class BenchmarkImporter(importer.variation_importer_utils):
+    """The importer with every KBase service call answered locally."""
+
+    def __init__(self, utility_params, staging_dir, contigs, use_validator):
+        importer.variation_importer_utils.__init__(self, utility_params)
+        self.staging_dir = staging_dir
+        self.use_validator = use_validator
+        # Like DataFileUtil, downloads land in its own scratch directory.
+        self.dfu = FakeDataFileUtil(staging_dir, utility_params['scratch'])
+        self.kbr = FakeKBaseReport()
+        self.ws = FakeWorkspace(contigs)
+        self.services = FakeServiceResolver()
+        self.report_seconds = None
+
+    def pretend_download_staging_file(self, filename, scratch):
+        copy_file_path = os.path.join(scratch, filename)
+        shutil.copy(os.path.join(self.staging_dir, filename), copy_file_path)
+        return {'copy_file_path': copy_file_path}
+
+    def _validate_vcf(self, vcf_filepath, vcf_version):
+        if self.use_validator:
+            return importer.variation_importer_utils._validate_vcf(self, vcf_filepath,
+                                                                   vcf_version)
+        validation_filepath = os.path.join(self.scratch, 'validation_skipped.txt')
+        with open(validation_filepath, 'w') as validation:
+            validation.write('vcf_validator_linux not found; validation skipped.\n')
+        return validation_filepath, 0
+
+    def _generate_report(self, params, variation_results, stats_results):
+        start = time.time()
+        try:
+            return importer.variation_importer_utils._generate_report(
+                self, params, variation_results, stats_results)
+        finally:
+            self.report_seconds = time.time() - start
+
+
+def _peak_rss_mb(who):
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    scale = 1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0
+    return resource.getrusage(who).ru_maxrss / scale
+
+
+def run_import(config, work_dir, results):
+    staging_dir = os.path.join(work_dir, 'staging')
+    os.makedirs(staging_dir)
+    start = time.time()
+    vcf_filepath, samples, contigs = write_synthetic_vcf(
+        staging_dir, config['samples'], config['variants'], config['contigs'],
+        config['compression'], seed=config['seed'])
+    location_filepath = write_locations(staging_dir, samples, seed=config['seed'])
+    generate_seconds = time.time() - start
+
+    utility_params = {
+        'scratch': os.path.join(work_dir, 'scratch'),
+        'srv-wiz-url': 'http://localhost/service_wizard',
+        'workspace-url': 'http://localhost/ws',
+        'callback_url': 'http://localhost/callback',
+        'token': 'benchmark',
+        'scan-processes': config['scan_processes']
+    }
+    os.makedirs(utility_params['scratch'])
+    params = {
+        'workspace_name': 'benchmark',
+        'genome_ref': '1/1/1',
+        'variation_file_subdir_path': os.path.basename(vcf_filepath),
+        'variation_attributes_subdir_path': os.path.basename(location_filepath),
+        'variation_object_name': 'benchmark_variations'
+    }
+    if config['qc']:
+        params.update(QC_PARAMS)
+
+    use_validator = which('vcf_validator_linux') is not None
+    vu = BenchmarkImporter(utility_params, staging_dir, contigs, use_validator)
+    start = time.time()
+    vu.validate_vcf(params)
+    total_seconds = time.time() - start
+
+    stages = dict((name, timing['seconds']) for name, timing in vu.stage_timings.items())
+    stages['report'] = vu.report_seconds
+    results.put({
+        'config': config,
+        'vcf_bytes': os.path.getsize(vcf_filepath),
+        'generate_seconds': generate_seconds,
+        'total_seconds': total_seconds,
+        'stage_seconds': stages,
+        'validator': 'vcf_validator_linux' if use_validator else 'skipped',
+        'uploaded_bytes': sum(upload['size'] for upload in vu.dfu.uploads),
+        'reused_shock_nodes': len(vu.dfu.reused),
+        'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF),
+        # Largest of the scan worker processes, not their sum.
+        'peak_child_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    })
+
+
+def run_benchmark(config, keep=False):
+    work_dir = tempfile.mkdtemp(prefix='variation_importer_bench_')
+    results = multiprocessing.Queue()
+    try:
+        process = multiprocessing.Process(target=run_import, args=(config, work_dir, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError("Benchmark {} failed with exit code {}".format(
+                config, process.exitcode))
+        return results.get()
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def _format_row(cells, widths):
+    return '  '.join('{:>{}}'.format(cell, width) for cell, width in zip(cells, widths))
+
+
+def print_summary(runs):
+    header = (['samples', 'variants', 'contigs', 'compression', 'total'] +
+              list(SUMMARY_STAGES) + ['peak MB', 'workers MB'])
+    rows = []
+    for run in runs:
+        config = run['config']
+        stages = run['stage_seconds']
+        rows.append([str(config['samples']), str(config['variants']), str(config['contigs']),
+                     config['compression'], '{:.2f}'.format(run['total_seconds'])] +
+                    ['{:.2f}'.format(stages[name]) if stages.get(name) is not None else '-'
+                     for name in SUMMARY_STAGES] +
+                    ['{:.0f}'.format(run['peak_rss_mb']),
+                     '{:.0f}'.format(run['peak_child_rss_mb'])])
+    widths = [max(len(row[idx]) for row in [header] + rows) for idx in range(len(header))]
+    print(_format_row(header, widths))
+    for row in rows:
+        print(_format_row(row, widths))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=_int_list, default=[100, 1000])
+    parser.add_argument('--variants', type=_int_list, default=[10000])
+    parser.add_argument('--contigs', type=_int_list, default=[5])
+    parser.add_argument('--compression', default='none',
+                        help='comma separated subset of {}'.format(', '.join(COMPRESSIONS)))
+    parser.add_argument('--scan-processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--qc', action='store_true',
+                        help='also apply the QC filters: {}'.format(json.dumps(QC_PARAMS)))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='keep the work directories')
+    parser.add_argument('--output', help='write the full results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    # The HTML report template lives at the module's install path in the image.
+    importer.template_dir = os.path.join(REPO_DIR, 'lib', 'kb_variation_importer', 'Utils',
+                                         'invalid_report_template.html')
+    importer.log = lambda message, prefix_newline=False: None
+
+    runs = []
+    for samples, variants, contigs, compression in itertools.product(
+            args.samples, args.variants, args.contigs, args.compression.split(',')):
+        config = {'samples': samples, 'variants': variants, 'contigs': contigs,
+                  'compression': compression, 'scan_processes': args.scan_processes,
+                  'qc': args.qc, 'seed': args.seed}
+        runs.append(run_benchmark(config, args.keep))
+
+    print_summary(runs)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(runs, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
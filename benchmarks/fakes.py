@@ -0,0 +1,84 @@
+import os
+import shutil
+import uuid
+
+
+class FakeDataFileUtil(object):
+    """
+        Local stand-in for the DataFileUtil calls the importer makes.  Staging
+        files are copied from staging_dir; uploads are only recorded.
+    """
+
+    def __init__(self, staging_dir, scratch):
+        self.staging_dir = staging_dir
+        self.scratch = scratch
+        self.uploads = []
+        self.reused = []
+        self.saved_objects = []
+
+    def download_staging_file(self, params):
+        source = os.path.join(self.staging_dir, params['staging_file_subdir_path'])
+        copy_file_path = os.path.join(self.scratch, os.path.basename(source))
+        shutil.copy(source, copy_file_path)
+        return {'copy_file_path': copy_file_path}
+
+    def file_to_shock(self, params):
+        file_path = params['file_path']
+        if os.path.isdir(file_path):
+            size = sum(os.path.getsize(os.path.join(root, name))
+                       for root, dirs, files in os.walk(file_path) for name in files)
+        else:
+            size = os.path.getsize(file_path)
+        shock_id = str(uuid.uuid4())
+        self.uploads.append({'file_path': file_path, 'size': size, 'pack': params.get('pack')})
+        return {'shock_id': shock_id, 'handle': {'hid': 'KBH_0', 'id': shock_id}, 'size': size}
+
+    def own_shock_node(self, params):
+        self.reused.append(params['shock_id'])
+        return {'shock_id': params['shock_id'],
+                'handle': {'hid': 'KBH_0', 'id': params['shock_id']}}
+
+    def ws_name_to_id(self, name):
+        return 1
+
+    def save_objects(self, params):
+        infos = []
+        for obj in params['objects']:
+            self.saved_objects.append(obj)
+            infos.append([len(self.saved_objects), obj['name'], obj['type'], '', 1, 'benchmark',
+                          params['id'], 'benchmark', '', 0, obj.get('meta') or {}])
+        return infos
+
+
+class FakeKBaseReport(object):
+
+    def __init__(self):
+        self.reports = []
+
+    def create_extended_report(self, params):
+        self.reports.append(params)
+        return {'name': params['report_object_name'], 'ref': '1/{}/1'.format(len(self.reports))}
+
+
+class FakeWorkspace(object):
+    """Serves the synthetic Assembly's contig IDs and lengths through get_objects2."""
+
+    def __init__(self, contigs):
+        self.contigs = contigs
+
+    def get_objects2(self, params):
+        contigs = dict((contig, {'contig_id': contig, 'length': length})
+                       for contig, length in self.contigs.items())
+        return {'data': [{'data': {'contigs': contigs}}]}
+
+
+class FakeServiceResolver(object):
+    """Answers the GenomeAnnotationAPI.get_assembly call with a fixed Assembly ref."""
+
+    def __init__(self, assembly_ref='1/2/1'):
+        self.assembly_ref = assembly_ref
+
+    def call_method(self, method, params):
+        if method != 'GenomeAnnotationAPI.get_assembly':
+            raise ValueError("No fake for {}".format(method))
+        return self.assembly_ref
@@ -0,0 +1,102 @@
+import gzip
+import os
+
+import numpy as np
+
+from kb_variation_importer.Utils.bgzf import BgzfWriter
+
+COMPRESSIONS = ('none', 'gzip', 'bgzf')
+_GT_STRINGS = np.array(['0/0', '0/1', '1/1', './.'])
+_BLOCK_SIZE = 1000
+
+
+def sample_ids(num_samples):
+    return ['S{:06d}'.format(idx) for idx in range(num_samples)]
+
+
+def contig_lengths(num_contigs, contig_length=10000000):
+    return dict(('chr{}'.format(idx + 1), contig_length) for idx in range(num_contigs))
+
+
+class _TextSink(object):
+
+    def __init__(self, filepath, compression):
+        self.compression = compression
+        if compression == 'bgzf':
+            self.handle = BgzfWriter(filepath)
+        elif compression == 'gzip':
+            self.handle = gzip.open(filepath, 'wb')
+        else:
+            self.handle = open(filepath, 'wb')
+
+    def write(self, text):
+        self.handle.write(text.encode('utf-8'))
+
+    def close(self):
+        self.handle.close()
+
+
+def write_synthetic_vcf(output_dir, num_samples, num_variants, num_contigs=1,
+                        compression='none', missing_rate=0.01, seed=0):
+    """
+        Write a VCF 4.2 file of biallelic SNPs in Hardy-Weinberg proportions.
+
+        Variants are spread evenly over num_contigs contigs and sorted by
+        position.  Returns the VCF path together with the sample IDs and the
+        contig lengths, which the fakes serve as the matching Assembly.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression {}; expected one of {}".format(
+            compression, ', '.join(COMPRESSIONS)))
+    rng = np.random.RandomState(seed)
+    samples = sample_ids(num_samples)
+    contigs = contig_lengths(num_contigs)
+    contig_ids = sorted(contigs, key=lambda contig: int(contig[3:]))
+
+    filename = 'synthetic_{}x{}_{}contigs.vcf'.format(num_samples, num_variants, num_contigs)
+    if compression != 'none':
+        filename += '.gz'
+    vcf_filepath = os.path.join(output_dir, filename)
+
+    sink = _TextSink(vcf_filepath, compression)
+    sink.write('##fileformat=VCFv4.2\n')
+    sink.write('##source=kb_variation_importer synthetic benchmark\n')
+    for contig in contig_ids:
+        sink.write('##contig=<ID={},length={}>\n'.format(contig, contigs[contig]))
+    sink.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+    sink.write('\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO',
+                          'FORMAT'] + samples) + '\n')
+
+    per_contig = np.array_split(np.arange(num_variants), num_contigs)
+    for contig, variant_ids in zip(contig_ids, per_contig):
+        if not len(variant_ids):
+            continue
+        step = contigs[contig] // len(variant_ids)
+        positions = 1 + np.arange(len(variant_ids)) * step + rng.randint(0, max(1, step),
+                                                                         len(variant_ids))
+        for start in range(0, len(variant_ids), _BLOCK_SIZE):
+            block = variant_ids[start:start + _BLOCK_SIZE]
+            alt_freq = rng.uniform(0.01, 0.5, size=(len(block), 1))
+            codes = rng.binomial(2, alt_freq, size=(len(block), num_samples))
+            codes[rng.rand(len(block), num_samples) < missing_rate] = 3
+            genotypes = _GT_STRINGS[codes]
+            lines = []
+            for offset, variant_id in enumerate(block):
+                lines.append('\t'.join(
+                    [contig, str(positions[start + offset]), 'snp{}'.format(variant_id),
+                     'A', 'G', '.', 'PASS', '.', 'GT'] + genotypes[offset].tolist()))
+            sink.write('\n'.join(lines) + '\n')
+    sink.close()
+    return vcf_filepath, samples, contigs
+
+
+def write_locations(output_dir, samples, seed=0):
+    """Location file in the layout of data/population_locality.txt for the given samples."""
+    rng = np.random.RandomState(seed)
+    location_filepath = os.path.join(output_dir, 'synthetic_locations.txt')
+    with open(location_filepath, 'w') as locations:
+        locations.write('id\tlatitude\tlongitude\n')
+        for sample in samples:
+            locations.write('{}\t{:.4f}\t{:.4f}\n'.format(
+                sample, rng.uniform(-90, 90), rng.uniform(-180, 180)))
+    return location_filepath
@@ -25,8 +25,16 @@ module kb_variation_importer {
         geno_missingness: percent threshold to exclude SNPs based on missing calls
         indiv_missingness: percent threshold to remove individuals with missing calls
         hwe_threshold: p-value threshold to remove samples not in Hardy-Weinberg Equilibrium
+            When any of the four thresholds is given, the stored VCF has the
+            failing sites and samples removed; the removed ones are listed in
+            the downloadable results.
         plot_maf: generate histogram of minor allele frequencies
         plot_hwe: generate histogram of Hardy-Weinberg Equilibrium p-values
+        export_text_stats: add plink style .frq/.hwe text tables to the
+            downloadable results next to the binary per-variant columns
+        run_in_background: queue the import on the module's local worker
+            pool and return its job_id straight away; follow it with
+            get_import_status
 
 
 
@@ -38,15 +46,114 @@ module kb_variation_importer {
         string variation_file_subdir_path;
         string variation_attributes_subdir_path;
         string variation_object_name;
+        float maf_threshold;
+        float geno_missingness;
+        float indiv_missingness;
+        float hwe_threshold;
+        boolean export_text_stats;
+        boolean run_in_background;
     } import_variation_params;
 
+    /*
+        job_id: set instead of the other fields when run_in_background is set.
+    */
     typedef structure {
         string report_name;
         string report_ref;
         obj_ref variation_ref;
+        string job_id;
     } import_variation_results;
 
 
     funcdef import_variation(import_variation_params) 
         returns (import_variation_results) authentication required;
+
+    /*
+        required params:
+        variation_ref: KBaseGwasData.Variations object reference
+        regions: genomic regions as 'contig:start-end' (1-based, inclusive)
+            or a bare contig ID
+
+        optional params:
+        samples: sample IDs to return genotypes for; defaults to all samples
+        include_genotypes: return per-sample genotype codes (default 1)
+    */
+    typedef structure {
+        obj_ref variation_ref;
+        list<string> regions;
+        list<string> samples;
+        boolean include_genotypes;
+    } query_variation_regions_params;
+
+    /*
+        genotypes: one code per requested sample - 0 homozygous reference,
+            1 heterozygous, 2 homozygous alternate, -1 missing.
+    */
+    typedef structure {
+        string contig_id;
+        int position;
+        string id;
+        string ref;
+        string alt;
+        list<int> genotypes;
+    } variant_record;
+
+    typedef structure {
+        string region;
+        list<variant_record> variants;
+    } region_variants;
+
+    typedef structure {
+        list<string> samples;
+        list<region_variants> regions;
+    } query_variation_regions_results;
+
+    /*
+        Return the variants overlapping the given regions using the positional
+        index written at import time, reading only the matching parts of the
+        stored VCF.
+    */
+    funcdef query_variation_regions(query_variation_regions_params)
+        returns (query_variation_regions_results) authentication required;
+
+    typedef structure {
+        string job_id;
+    } get_import_status_params;
+
+    typedef structure {
+        string name;
+        float seconds;
+    } stage_timing;
+
+    /*
+        state: queued, running, completed or error.
+        running_stages: import stages in progress, oldest first.
+        bytes_processed, records_processed: how far the VCF scan has got;
+            total_bytes is the VCF's size on disk.
+        bytes_per_second, records_per_second: scan throughput so far.
+        eta_seconds: estimated time for the scan to finish.
+        result: the import's results once completed.
+        error: why the import failed.
+    */
+    typedef structure {
+        string job_id;
+        string state;
+        float elapsed_seconds;
+        list<string> running_stages;
+        list<stage_timing> completed_stages;
+        int bytes_processed;
+        int total_bytes;
+        int records_processed;
+        float bytes_per_second;
+        float records_per_second;
+        float eta_seconds;
+        import_variation_results result;
+        string error;
+    } import_status;
+
+    /*
+        Report the progress of an import started with run_in_background.
+    */
+    funcdef get_import_status(get_import_status_params)
+        returns (import_status) authentication required;
 };
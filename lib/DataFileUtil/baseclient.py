@@ -1,7 +1,10 @@
 ############################################################
 #
-# Autogenerated by the KBase type compiler -
-# any changes made here will be overwritten
+# The KBase SDK base client with pooled keep-alive sessions and pluggable
+# job polling.  This file is the source of every lib/*/baseclient.py:
+# `make compile` runs `make baseclients`, which copies it over the copies
+# kb-sdk generates.  Run `make baseclients` after `kb-sdk install` too, and
+# edit this file rather than the copies.
 #
 ############################################################
 
@@ -11,6 +14,7 @@ import json as _json
 import requests as _requests
 import random as _random
 import os as _os
+import threading as _threading
 
 try:
     from configparser import ConfigParser as _ConfigParser  # py 3
@@ -27,6 +31,35 @@ _CT = 'content-type'
 _AJ = 'application/json'
 _URL_SCHEME = frozenset(['http', 'https'])
 
+# Keep-alive connection pools shared by every client in the process, one
+# requests.Session per (process, scheme, host).  Sessions are never shared
+# across a fork.
+POOL_SIZE = int(_os.environ.get('KB_CLIENT_POOL_SIZE', 10))
+MAX_RETRIES = int(_os.environ.get('KB_CLIENT_MAX_RETRIES', 3))
+_sessions = dict()
+_sessions_lock = _threading.Lock()
+# Longest wait between job state checks for the default polling strategy.
+MAX_POLL_INTERVAL = float(_os.environ.get('KB_CLIENT_MAX_POLL_INTERVAL', 5))
+
+
+def _get_session(url):
+    '''
+    Return the pooled session for url's host.  Retries only cover failures
+    to connect, so an RPC is never sent twice.
+    '''
+    scheme, netloc, _, _, _, _ = _urlparse(url)
+    key = (_os.getpid(), scheme, netloc)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _requests.Session()
+            adapter = _requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=POOL_SIZE,
+                max_retries=MAX_RETRIES)
+            session.mount(scheme + '://', adapter)
+            _sessions[key] = session
+    return session
+
 
 def _get_token(user_id, password, auth_svc):
     # This is bandaid helper function until we get a full
@@ -93,6 +126,68 @@ class _JSONObjectEncoder(_json.JSONEncoder):
         return _json.JSONEncoder.default(self, obj)
 
 
+class ExponentialPolling(object):
+    '''
+    Job polling schedule: wait initial seconds, then grow each wait by
+    scale_percent up to max_interval.  Strategies yield the waits between
+    job state checks from intervals() and are told each job's duration
+    through record().
+    '''
+    def __init__(self, initial, scale_percent, max_interval):
+        self.initial = initial
+        self.scale_percent = scale_percent
+        self.max_interval = max_interval
+
+    def intervals(self, service_method):
+        interval = self.initial
+        while True:
+            yield interval
+            interval = min(interval * self.scale_percent / 100.0,
+                           self.max_interval)
+
+    def record(self, service_method, duration):
+        pass
+
+
+class AdaptivePolling(ExponentialPolling):
+    '''
+    Exponential polling whose first check is scheduled just before the
+    method's typical run time, learned from earlier jobs in this process as
+    an exponentially weighted mean.  Waits are jittered so concurrent jobs
+    do not poll in lockstep.
+    '''
+    _durations = dict()
+    _durations_lock = _threading.Lock()
+
+    def __init__(self, initial, scale_percent, max_interval, jitter=0.1,
+                 history_weight=0.3, lead=0.9):
+        super(AdaptivePolling, self).__init__(
+            initial, scale_percent, max_interval)
+        self.jitter = jitter
+        self.history_weight = history_weight
+        self.lead = lead
+
+    def expected_duration(self, service_method):
+        with self._durations_lock:
+            return self._durations.get(service_method)
+
+    def intervals(self, service_method):
+        expected = self.expected_duration(service_method)
+        if expected and expected * self.lead > self.initial:
+            yield expected * self.lead
+        for interval in super(AdaptivePolling, self).intervals(
+                service_method):
+            yield interval * _random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def record(self, service_method, duration):
+        with self._durations_lock:
+            expected = self._durations.get(service_method)
+            if expected is not None:
+                duration = (self.history_weight * duration +
+                            (1 - self.history_weight) * expected)
+            self._durations[service_method] = duration
+
+
 class BaseClient(object):
     '''
     The KBase base client.
@@ -116,6 +211,9 @@ class BaseClient(object):
     lookup_url - set to true when contacting KBase dynamic services.
     async_job_check_time_ms - the wait time between checking job state for
         asynchronous jobs run with the run_job method.
+    polling_strategy - an ExponentialPolling (or compatible) instance used to
+        wait for asynchronous jobs.  Defaults to AdaptivePolling built from the
+        async_job_check_* arguments, with waits capped at MAX_POLL_INTERVAL.
     '''
     def __init__(
             self, url=None, timeout=30 * 60, user_id=None,
@@ -125,7 +223,8 @@ class BaseClient(object):
             lookup_url=False,
             async_job_check_time_ms=100,
             async_job_check_time_scale_percent=150,
-            async_job_check_max_time_ms=300000):
+            async_job_check_max_time_ms=300000,
+            polling_strategy=None):
         if url is None:
             raise ValueError('A url is required')
         scheme, _, _, _, _, _ = _urlparse(url)
@@ -140,6 +239,11 @@ class BaseClient(object):
         self.async_job_check_time_scale_percent = (
             async_job_check_time_scale_percent)
         self.async_job_check_max_time = async_job_check_max_time_ms / 1000.0
+        self.polling_strategy = polling_strategy or AdaptivePolling(
+            self.async_job_check_time, self.async_job_check_time_scale_percent,
+            min(self.async_job_check_max_time, MAX_POLL_INTERVAL))
+        # job ID -> (service method, submission time) until it is waited on.
+        self._submitted = dict()
         # token overrides user_id and password
         if token is not None:
             self._headers['AUTHORIZATION'] = token
@@ -172,9 +276,9 @@ class BaseClient(object):
             arg_hash['context'] = context
 
         body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
-                             timeout=self.timeout,
-                             verify=not self.trust_all_ssl_certificates)
+        ret = _get_session(url).post(
+            url, data=body, headers=self._headers, timeout=self.timeout,
+            verify=not self.trust_all_ssl_certificates)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
             if ret.headers.get(_CT) == _AJ:
@@ -212,15 +316,28 @@ class BaseClient(object):
             context['service_ver'] = service_ver
         return context
 
-    def _check_job(self, service, job_id):
+    def _job_state(self, service, job_id):
         return self._call(self.url, service + '._check_job', [job_id])
 
+    def _check_job(self, service, job_id):
+        '''
+        Wait for an asynchronous job on the polling strategy's schedule and
+        return its final state.  The kb-sdk generated clients call this from
+        their own sleep loops, which then end on the first call; the schedule
+        counts from submission, so their first sleep is part of it.
+        '''
+        service_method, submitted = self._submitted.pop(
+            job_id, (service, None))
+        return self._wait_for_job(service_method, job_id, submitted)
+
     def _submit_job(self, service_method, args, service_ver=None,
                     context=None):
         context = self._set_up_context(service_ver, context)
         mod, meth = service_method.split('.')
-        return self._call(self.url, mod + '._' + meth + '_submit',
-                          args, context)
+        job_id = self._call(self.url, mod + '._' + meth + '_submit',
+                            args, context)
+        self._submitted[job_id] = (service_method, time.time())
+        return job_id
 
     def run_job(self, service_method, args, service_ver=None, context=None):
         '''
@@ -233,23 +350,31 @@ class BaseClient(object):
             or dev/beta/release.
         context - the rpc context dict.
         '''
-        mod, _ = service_method.split('.')
         job_id = self._submit_job(service_method, args, service_ver, context)
-        async_job_check_time = self.async_job_check_time
-        while True:
-            time.sleep(async_job_check_time)
-            async_job_check_time = (async_job_check_time *
-                                    self.async_job_check_time_scale_percent /
-                                    100.0)
-            if async_job_check_time > self.async_job_check_max_time:
-                async_job_check_time = self.async_job_check_max_time
-            job_state = self._check_job(mod, job_id)
+        job_state = self._check_job(service_method.split('.')[0], job_id)
+        if not job_state['result']:
+            return
+        if len(job_state['result']) == 1:
+            return job_state['result'][0]
+        return job_state['result']
+
+    def _wait_for_job(self, service_method, job_id, submitted=None):
+        '''
+        Poll an asynchronous job on the schedule of the polling strategy until
+        it finishes and return its final job state.  service_method is the
+        bare service name for jobs this client did not submit.
+        '''
+        mod = service_method.split('.')[0]
+        start = time.time() if submitted is None else submitted
+        check_at = start
+        for interval in self.polling_strategy.intervals(service_method):
+            check_at += interval
+            time.sleep(max(0, check_at - time.time()))
+            job_state = self._job_state(mod, job_id)
             if job_state['finished']:
-                if not job_state['result']:
-                    return
-                if len(job_state['result']) == 1:
-                    return job_state['result'][0]
-                return job_state['result']
+                self.polling_strategy.record(service_method,
+                                             time.time() - start)
+                return job_state
 
     def call_method(self, service_method, args, service_ver=None,
                     context=None):
@@ -0,0 +1,195 @@
+import hashlib
+import struct
+import zlib
+
+# gzip magic, deflate, FEXTRA set; followed by MTIME/XFL/OS, XLEN=6 and the
+# 'BC' subfield holding the block size.
+_BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+_BGZF_SUBFIELD = b'BC\x02\x00'
+_HEADER_SIZE = 18
+_SEARCH_SIZE = 1 << 16
+# Largest uncompressed payload per block, as in htslib.
+MAX_BLOCK_DATA = 0xff00
+EOF_BLOCK = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+             b'\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+def is_bgzf(filepath):
+    """True if the file starts with a BGZF block header."""
+    with open(filepath, 'rb') as handle:
+        header = handle.read(_HEADER_SIZE)
+    return (len(header) == _HEADER_SIZE and header[:4] == _BGZF_MAGIC and
+            header[12:16] == _BGZF_SUBFIELD)
+
+
+def _block_size(header):
+    return struct.unpack('<H', header[16:18])[0] + 1
+
+
+def find_block_start(handle, offset):
+    """
+        Compressed offset of the first BGZF block starting at or after offset,
+        or None past the last block.
+    """
+    while True:
+        handle.seek(offset)
+        data = handle.read(_SEARCH_SIZE + _HEADER_SIZE)
+        if len(data) < _HEADER_SIZE:
+            return None
+        start = 0
+        while True:
+            found = data.find(_BGZF_MAGIC, start)
+            if found < 0 or found + _HEADER_SIZE > len(data):
+                break
+            if data[found + 12:found + 16] == _BGZF_SUBFIELD:
+                return offset + found
+            start = found + 1
+        offset += _SEARCH_SIZE
+
+
+def read_block(handle, offset):
+    """
+        Decompress the BGZF block at offset.
+        Returns (data, offset of the next block); data is empty at EOF.
+    """
+    handle.seek(offset)
+    header = handle.read(_HEADER_SIZE)
+    if len(header) < _HEADER_SIZE:
+        return b'', offset
+    size = _block_size(header)
+    block = header + handle.read(size - _HEADER_SIZE)
+    return zlib.decompress(block, 31), offset + size
+
+
+def iter_blocks(handle, offset=0, end=None):
+    """
+        Yield (compressed offset, decompressed data) for every block from
+        offset, stopping before end when it is given.
+    """
+    while end is None or offset < end:
+        data, next_offset = read_block(handle, offset)
+        if next_offset == offset:
+            return
+        yield offset, data
+        offset = next_offset
+
+
+def make_virtual_offset(block_offset, within_block):
+    return (block_offset << 16) | within_block
+
+
+def split_virtual_offset(virtual_offset):
+    return virtual_offset >> 16, virtual_offset & 0xffff
+
+
+def _compress_block(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    size = len(compressed) + 26
+    if size > 1 << 16:
+        return None
+    header = (_BGZF_MAGIC + b'\x00\x00\x00\x00\x00\xff\x06\x00' + _BGZF_SUBFIELD +
+              struct.pack('<H', size - 1))
+    footer = struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+    return header + compressed + footer
+
+
+class BgzfWriter(object):
+    """
+        Writes BGZF: a series of independent gzip members of at most 64 KiB,
+        readable by any gzip tool and seekable through virtual offsets
+        (compressed block offset << 16 | offset within the block).  digest
+        is the SHA-1 of the bytes written so far.
+    """
+
+    def __init__(self, filepath, level=6, write_eof=True):
+        self.handle = open(filepath, 'wb')
+        self.digest = hashlib.sha1()
+        self.level = level
+        self.write_eof = write_eof
+        self.block_offset = 0
+        self.buffer = b''
+
+    def tell(self):
+        return make_virtual_offset(self.block_offset, len(self.buffer))
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= MAX_BLOCK_DATA:
+            self._write_block(self.buffer[:MAX_BLOCK_DATA])
+            self.buffer = self.buffer[MAX_BLOCK_DATA:]
+
+    def _write_block(self, data):
+        block = _compress_block(data, self.level)
+        if block is None:
+            # Incompressible data can overflow a block.  Stored (level 0)
+            # deflate of MAX_BLOCK_DATA bytes always fits, so the block keeps
+            # the boundaries tell() has already handed out.
+            block = _compress_block(data, 0)
+        self.handle.write(block)
+        self.digest.update(block)
+        self.block_offset += len(block)
+
+    def flush(self):
+        if self.buffer:
+            self._write_block(self.buffer)
+            self.buffer = b''
+
+    def close(self):
+        self.flush()
+        if self.write_eof:
+            self.handle.write(EOF_BLOCK)
+            self.digest.update(EOF_BLOCK)
+        self.handle.close()
+
+
+class BgzfReader(object):
+    """
+        Line reader over a BGZF file positioned by virtual offsets.  Accepts a
+        path or any seekable binary file object, e.g. a ranged remote reader.
+    """
+
+    def __init__(self, source):
+        self.owns_handle = not hasattr(source, 'read')
+        self.handle = open(source, 'rb') if self.owns_handle else source
+        self.block_offset = 0
+        self.next_block_offset = 0
+        self.data = b''
+        self.within = 0
+
+    def seek(self, virtual_offset):
+        block_offset, self.within = split_virtual_offset(virtual_offset)
+        self._load(block_offset)
+
+    def _load(self, block_offset):
+        self.block_offset = block_offset
+        self.data, self.next_block_offset = read_block(self.handle, block_offset)
+
+    def tell(self):
+        if self.within >= len(self.data) and self.next_block_offset != self.block_offset:
+            return make_virtual_offset(self.next_block_offset, 0)
+        return make_virtual_offset(self.block_offset, self.within)
+
+    def readline(self):
+        parts = []
+        while True:
+            if self.within >= len(self.data):
+                if self.next_block_offset == self.block_offset:
+                    break
+                self._load(self.next_block_offset)
+                self.within = 0
+                if not self.data and self.next_block_offset == self.block_offset:
+                    break
+                continue
+            newline = self.data.find(b'\n', self.within)
+            if newline >= 0:
+                parts.append(self.data[self.within:newline + 1])
+                self.within = newline + 1
+                break
+            parts.append(self.data[self.within:])
+            self.within = len(self.data)
+        return b''.join(parts)
+
+    def close(self):
+        if self.owns_handle:
+            self.handle.close()
@@ -0,0 +1,168 @@
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import cPickle as pickle  # py2
+except ImportError:
+    import pickle  # py3
+
+try:
+    string_types = (str, unicode)  # py2
+except NameError:
+    string_types = (str,)  # py3
+
+_READ_SIZE = 1 << 20
+
+
+def file_digest(filepath):
+    """SHA-1 of a file's contents, read in fixed size pieces."""
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as handle:
+        while True:
+            data = handle.read(_READ_SIZE)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def tree_digest(path):
+    """SHA-1 of a file, or of a directory's relative file names and contents."""
+    if not os.path.isdir(path):
+        return file_digest(path)
+    digest = hashlib.sha1()
+    for root, dirs, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            filepath = os.path.join(root, name)
+            digest.update(os.path.relpath(filepath, path).encode('utf-8') + b'\0')
+            digest.update(file_digest(filepath).encode('ascii'))
+    return digest.hexdigest()
+
+
+def params_digest(params):
+    """SHA-1 of a JSON-able value, independent of dict ordering."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def try_lock(lock_filepath):
+    """
+        Take an exclusive flock on lock_filepath without waiting.  Returns the
+        open file, which holds the lock until it is closed or the process
+        exits, or None if another open of the file holds it, in this process
+        or another.
+    """
+    handle = open(lock_filepath, 'a')
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError) as exc:
+        handle.close()
+        if exc.errno in (errno.EAGAIN, errno.EACCES):
+            return None
+        raise
+    return handle
+
+
+def _tree_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, dirs, files in os.walk(path) for name in files)
+
+
+def _result_paths(result, paths):
+    if isinstance(result, string_types):
+        if os.path.isabs(result) and os.path.exists(result):
+            paths.add(result)
+    elif isinstance(result, dict):
+        for value in result.values():
+            _result_paths(value, paths)
+    elif isinstance(result, (list, tuple)):
+        for value in result:
+            _result_paths(value, paths)
+    return paths
+
+
+class StageCheckpoints(object):
+    """
+        Manifests of finished import stages under checkpoint_dir, so a retry
+        of an import with the same inputs resumes after the last stage that
+        completed instead of starting over.
+
+        A stage's key hashes the run key, the stage name and the output keys
+        of the stages it read.  A stage's output key is its key unless it
+        fingerprints its result, e.g. by hashing a downloaded file, so
+        everything downstream of an input whose content changed runs again.
+        Each manifest records the key, the pickled result and the size of
+        every file or directory the result names; a manifest whose key
+        differs or whose files are missing or changed size is ignored.
+    """
+
+    def __init__(self, checkpoint_dir, run_key):
+        self.checkpoint_dir = checkpoint_dir
+        self.run_key = run_key
+        try:
+            os.makedirs(checkpoint_dir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+    def stage_key(self, name, input_keys):
+        return params_digest([self.run_key, name, list(input_keys)])
+
+    def _paths(self, name):
+        base = os.path.join(self.checkpoint_dir, name)
+        return base + '.json', base + '.pickle'
+
+    def load(self, name, key):
+        """(result, output_key) saved for the stage under key, or None."""
+        manifest_filepath, result_filepath = self._paths(name)
+        try:
+            with open(manifest_filepath) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest['key'] != key:
+                return None
+            for path, size in manifest['files'].items():
+                if _tree_size(path) != size:
+                    return None
+            with open(result_filepath, 'rb') as result_file:
+                result = pickle.load(result_file)
+        except (IOError, OSError, ValueError, KeyError, EOFError, pickle.UnpicklingError):
+            return None
+        return result, manifest['output_key']
+
+    def save(self, name, key, result, output_key=None):
+        manifest_filepath, result_filepath = self._paths(name)
+        manifest = {
+            'stage': name,
+            'key': key,
+            'output_key': output_key or key,
+            'files': dict((path, _tree_size(path)) for path in _result_paths(result, set())),
+            'saved': time.time()
+        }
+        # The manifest is written last; it is what makes the checkpoint count.
+        self._write(result_filepath, 'wb',
+                    lambda handle: pickle.dump(result, handle, pickle.HIGHEST_PROTOCOL))
+        self._write(manifest_filepath, 'w', lambda handle: json.dump(manifest, handle))
+
+    def clear(self, name):
+        for path in self._paths(name):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def discard(self):
+        """Drop every checkpoint of the run, e.g. once the import finished."""
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+    def _write(self, filepath, mode, dump):
+        handle, tmp_path = tempfile.mkstemp(dir=self.checkpoint_dir, suffix='.tmp')
+        with os.fdopen(handle, mode) as tmp_file:
+            dump(tmp_file)
+        os.rename(tmp_path, filepath)
@@ -0,0 +1,78 @@
+import errno
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+_VERSIONED_REF = re.compile(r'^\d+/\d+/\d+$')
+# Default on-disk budget for a cache directory.
+MAX_CACHE_BYTES = 256 << 20
+
+
+def is_versioned_ref(ref):
+    """True for an immutable numeric ws/obj/ver reference."""
+    return bool(ref) and _VERSIONED_REF.match(ref) is not None
+
+
+class DiskLRUCache(object):
+    """
+        JSON values stored one file per key under cache_dir, shared by every
+        import on the host.  Hits refresh the file's mtime; once the directory
+        grows past max_bytes the least recently used entries are removed.
+        Writes go through a temporary file and a rename, so concurrent imports
+        never see a partial entry.
+    """
+
+    def __init__(self, cache_dir, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(cache_dir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as entry:
+                value = json.load(entry)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return value
+
+    def put(self, key, value):
+        handle, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(handle, 'w') as entry:
+            json.dump(value, entry)
+        os.rename(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,247 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from kb_variation_importer.Utils.genotype_stats import MISSING, BlockConsumer
+
+# 2-bit codes: 0/1/2 alternate dosage, 3 missing.  Four calls per byte, the
+# first call in the lowest bits.
+PACKED_MISSING = 3
+
+METADATA_FILENAME = 'matrix.json'
+VARIANT_MAJOR_FILENAME = 'variant_major.bin'
+SAMPLE_MAJOR_FILENAME = 'sample_major.bin'
+VARIANT_INDEX_FILENAME = 'variants.tsv'
+
+
+def packed_width(num_calls):
+    return (num_calls + 3) // 4
+
+
+def pack_genotypes(genotypes):
+    """Pack an int8 (rows, calls) dosage array into (rows, ceil(calls / 4)) bytes."""
+    rows, calls = genotypes.shape
+    codes = np.full((rows, 4 * packed_width(calls)), PACKED_MISSING, dtype=np.uint8)
+    codes[:, :calls] = np.where(genotypes == MISSING, PACKED_MISSING, genotypes)
+    return (codes[:, 0::4] | (codes[:, 1::4] << 2) |
+            (codes[:, 2::4] << 4) | (codes[:, 3::4] << 6))
+
+
+def unpack_genotypes(packed, num_calls):
+    """Inverse of pack_genotypes; missing calls come back as -1."""
+    packed = np.asarray(packed, dtype=np.uint8)
+    codes = np.empty((packed.shape[0], 4 * packed.shape[1]), dtype=np.int8)
+    for shift in range(4):
+        codes[:, shift::4] = (packed >> (2 * shift)) & 3
+    codes = codes[:, :num_calls]
+    codes[codes == PACKED_MISSING] = MISSING
+    return codes
+
+
+def _write_matrix_metadata(matrix_dir, samples, block_sizes):
+    metadata = {
+        'encoding': '2-bit alternate allele dosage, 3 = missing, 4 calls per byte',
+        'samples': samples,
+        'num_variants': sum(block_sizes),
+        'block_sizes': block_sizes
+    }
+    with open(os.path.join(matrix_dir, METADATA_FILENAME), 'w') as meta:
+        json.dump(metadata, meta)
+
+
+class PackedGenotypeWriter(BlockConsumer):
+    """
+        Writes decoded genotype blocks to a memory-mappable 2-bit matrix:
+
+        variant_major.bin  one row of ceil(samples / 4) bytes per variant
+        sample_major.bin   per block, one row of ceil(block / 4) bytes per sample
+        variants.tsv       contig, position, ID, REF and ALT of every variant
+        matrix.json        sample IDs, block sizes and layout description
+    """
+    name = 'genotype_matrix'
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def start(self, header):
+        super(PackedGenotypeWriter, self).start(header)
+        self._open(self.output_dir)
+
+    def start_chunk(self, header, chunk_index):
+        # Each worker writes its own part; merge() concatenates them in order.
+        super(PackedGenotypeWriter, self).start(header)
+        self._open(os.path.join(self.output_dir, 'part_{:05d}'.format(chunk_index)))
+
+    def _open(self, write_dir):
+        if not os.path.isdir(write_dir):
+            os.makedirs(write_dir)
+        self.write_dir = write_dir
+        self.samples = self.header.samples
+        self.block_sizes = []
+        self.variant_major = open(os.path.join(write_dir, VARIANT_MAJOR_FILENAME), 'wb')
+        self.sample_major = open(os.path.join(write_dir, SAMPLE_MAJOR_FILENAME), 'wb')
+        self.variant_index = open(os.path.join(write_dir, VARIANT_INDEX_FILENAME), 'w')
+
+    def consume_block(self, records, genotypes):
+        self.variant_major.write(pack_genotypes(genotypes).tobytes())
+        self.sample_major.write(pack_genotypes(np.ascontiguousarray(genotypes.T)).tobytes())
+        for fields in records:
+            self.variant_index.write('\t'.join(fields[:5]) + '\n')
+        self.block_sizes.append(len(records))
+
+    def _close(self):
+        self.variant_major.close()
+        self.sample_major.close()
+        self.variant_index.close()
+
+    def _write_metadata(self, samples, block_sizes):
+        _write_matrix_metadata(self.output_dir, samples, block_sizes)
+
+    def finish(self):
+        self._close()
+        self._write_metadata(self.samples, self.block_sizes)
+        return self.output_dir
+
+    def partial(self):
+        self._close()
+        return {
+            'write_dir': self.write_dir,
+            'samples': self.samples,
+            'block_sizes': self.block_sizes
+        }
+
+    def merge(self, partials):
+        block_sizes = []
+        for filename in (VARIANT_MAJOR_FILENAME, SAMPLE_MAJOR_FILENAME, VARIANT_INDEX_FILENAME):
+            with open(os.path.join(self.output_dir, filename), 'wb') as merged:
+                for line_offset, partial in partials:
+                    with open(os.path.join(partial['write_dir'], filename), 'rb') as part:
+                        shutil.copyfileobj(part, merged)
+        for line_offset, partial in partials:
+            block_sizes.extend(partial['block_sizes'])
+            shutil.rmtree(partial['write_dir'])
+        self._write_metadata(partials[0][1]['samples'], block_sizes)
+        return self.output_dir
+
+
+class GenotypeMatrix(object):
+    """Read-only, memory-mapped view of a directory written by PackedGenotypeWriter."""
+
+    def __init__(self, matrix_dir):
+        self.matrix_dir = matrix_dir
+        with open(os.path.join(matrix_dir, METADATA_FILENAME)) as meta:
+            metadata = json.load(meta)
+        self.samples = metadata['samples']
+        self.num_samples = len(self.samples)
+        self.num_variants = metadata['num_variants']
+        self.block_sizes = metadata['block_sizes']
+        self.block_starts = np.concatenate([[0], np.cumsum(self.block_sizes)]).astype(np.int64)
+
+        self._variant_major = None
+        self._sample_major = None
+        if self.num_variants:
+            self._variant_major = np.memmap(
+                os.path.join(matrix_dir, VARIANT_MAJOR_FILENAME), dtype=np.uint8, mode='r',
+                shape=(self.num_variants, packed_width(self.num_samples)))
+            self._sample_major = np.memmap(
+                os.path.join(matrix_dir, SAMPLE_MAJOR_FILENAME), dtype=np.uint8, mode='r')
+
+    def variants(self):
+        """List of (contig, position, id, ref, alt) in matrix order."""
+        variants = []
+        with open(os.path.join(self.matrix_dir, VARIANT_INDEX_FILENAME)) as index:
+            for line in index:
+                contig, pos, vid, ref, alt = line.rstrip('\n').split('\t')
+                variants.append((contig, int(pos), vid, ref, alt))
+        return variants
+
+    def variant_genotypes(self, start=0, stop=None):
+        """(variants, samples) int8 dosages for variants [start, stop)."""
+        stop = self.num_variants if stop is None else min(stop, self.num_variants)
+        if start >= stop:
+            return np.empty((0, self.num_samples), dtype=np.int8)
+        return unpack_genotypes(self._variant_major[start:stop], self.num_samples)
+
+    def iter_blocks(self):
+        """Yield (first variant index, (variants, samples) dosages) per stored block."""
+        for idx, size in enumerate(self.block_sizes):
+            start = int(self.block_starts[idx])
+            yield start, self.variant_genotypes(start, start + size)
+
+    def sample_genotypes(self, sample_indices):
+        """(samples, variants) int8 dosages for the given samples, from the sample-major blocks."""
+        sample_indices = np.asarray(sample_indices, dtype=np.int64)
+        result = np.empty((len(sample_indices), self.num_variants), dtype=np.int8)
+        offset = 0
+        for idx, size in enumerate(self.block_sizes):
+            width = packed_width(size)
+            block = self._sample_major[offset:offset + self.num_samples * width]
+            block = block.reshape(self.num_samples, width)
+            start = int(self.block_starts[idx])
+            result[:, start:start + size] = unpack_genotypes(block[sample_indices], size)
+            offset += self.num_samples * width
+        return result
+
+
+def subset_genotype_matrix(matrix_dir, output_dir, variant_mask=None, samples=None):
+    """
+        Write a copy of a packed genotype matrix keeping only the variants
+        where variant_mask is true and the named samples, e.g. after QC.
+
+        Works block by block on the packed bytes: dropping samples selects
+        whole rows of the sample-major blocks and dropping variants whole
+        rows of the variant-major matrix; a block is only unpacked and
+        repacked along the other axis when something was dropped from it.
+    """
+    matrix = GenotypeMatrix(matrix_dir)
+    if variant_mask is None:
+        variant_mask = np.ones(matrix.num_variants, dtype=bool)
+    variant_mask = np.asarray(variant_mask, dtype=bool)
+    if len(variant_mask) != matrix.num_variants:
+        raise ValueError("Variant mask has {} entries for {} variants".format(
+            len(variant_mask), matrix.num_variants))
+    if samples is None:
+        samples = matrix.samples
+    sample_index = dict((sample, idx) for idx, sample in enumerate(matrix.samples))
+    sample_indices = np.array([sample_index[sample] for sample in samples], dtype=np.int64)
+    all_samples = len(sample_indices) == matrix.num_samples
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    block_sizes = []
+    with open(os.path.join(output_dir, VARIANT_MAJOR_FILENAME), 'wb') as variant_major, \
+            open(os.path.join(output_dir, SAMPLE_MAJOR_FILENAME), 'wb') as sample_major:
+        offset = 0
+        for idx, size in enumerate(matrix.block_sizes):
+            start = int(matrix.block_starts[idx])
+            width = packed_width(size)
+            block_mask = variant_mask[start:start + size]
+            kept = int(block_mask.sum())
+            by_sample = matrix._sample_major[offset:offset + matrix.num_samples * width]
+            offset += matrix.num_samples * width
+            if not kept:
+                continue
+
+            by_variant = np.asarray(matrix._variant_major[start:start + size][block_mask])
+            if not all_samples:
+                genotypes = unpack_genotypes(by_variant, matrix.num_samples)
+                by_variant = pack_genotypes(genotypes[:, sample_indices])
+            variant_major.write(by_variant.tobytes())
+
+            by_sample = np.asarray(by_sample.reshape(matrix.num_samples, width)[sample_indices])
+            if kept < size:
+                genotypes = unpack_genotypes(by_sample, size)
+                by_sample = pack_genotypes(genotypes[:, block_mask])
+            sample_major.write(by_sample.tobytes())
+            block_sizes.append(kept)
+
+    with open(os.path.join(matrix_dir, VARIANT_INDEX_FILENAME)) as index, \
+            open(os.path.join(output_dir, VARIANT_INDEX_FILENAME), 'w') as subset_index:
+        for line, keep in zip(index, variant_mask):
+            if keep:
+                subset_index.write(line)
+
+    _write_matrix_metadata(output_dir, list(samples), block_sizes)
+    return output_dir
@@ -0,0 +1,372 @@
+import numpy as np
+
+from kb_variation_importer.Utils.vcf_scanner import RecordConsumer, genotype_code
+
+MISSING = -1
+
+# Upper bound on cells in the (sites x het counts) grid used by hwe_exact.
+_HWE_GRID_CELLS = 1 << 22
+# Relative tolerance when deciding whether a het count is as likely as the observed one.
+_HWE_LOG_TOLERANCE = 1e-7
+
+_ZERO = ord('0')
+_MISSING_ALLELE = ord('.')
+_SEPARATORS = (ord('/'), ord('|'))
+_TAB = ord('\t')
+
+
+def _as_bytes(text):
+    return text if isinstance(text, bytes) else text.encode('ascii')
+
+
+def parse_genotype_block(records, num_samples):
+    """
+        Convert a block of VCF records (lists of fields) into an int8 array of
+        shape (sites, samples) holding 0/1/2 alternate dosages and -1 for
+        missing calls.
+
+        Records whose FORMAT is plain GT with single character alleles are
+        decoded together from one byte buffer; anything else goes through
+        genotype_code one call at a time.
+    """
+    genotypes = np.empty((len(records), num_samples), dtype=np.int8)
+    width = 4 * num_samples - 1
+    fast_rows = []
+    fast_text = []
+    for idx, fields in enumerate(records):
+        if fields[8] == 'GT':
+            sample_text = '\t'.join(fields[9:])
+            if len(sample_text) == width:
+                fast_rows.append(idx)
+                fast_text.append(sample_text + '\t')
+                continue
+        genotypes[idx] = [genotype_code(gt) for gt in fields[9:]]
+
+    if fast_rows:
+        buf = np.frombuffer(_as_bytes(''.join(fast_text)), dtype=np.uint8)
+        buf = buf.reshape(len(fast_rows), width + 1)
+        a1 = buf[:, 0::4]
+        a2 = buf[:, 2::4]
+        sep = buf[:, 1::4]
+        well_formed = (((sep == _SEPARATORS[0]) | (sep == _SEPARATORS[1])).all(axis=1) &
+                       (buf[:, 3::4] == _TAB).all(axis=1))
+
+        codes = (a1 != _ZERO).astype(np.int8) + (a2 != _ZERO).astype(np.int8)
+        codes[(a1 == _MISSING_ALLELE) | (a2 == _MISSING_ALLELE)] = MISSING
+
+        fast_rows = np.asarray(fast_rows)
+        genotypes[fast_rows[well_formed]] = codes[well_formed]
+        for idx in fast_rows[~well_formed]:
+            genotypes[idx] = [genotype_code(gt) for gt in records[idx][9:]]
+
+    return genotypes
+
+
+def genotype_counts(genotypes):
+    """Per-site counts of homozygous reference, heterozygous and homozygous alternate calls."""
+    hom_ref = (genotypes == 0).sum(axis=1)
+    het = (genotypes == 1).sum(axis=1)
+    hom_alt = (genotypes == 2).sum(axis=1)
+    return hom_ref, het, hom_alt
+
+
+def log_factorials(n):
+    """log(k!) for k = 0..n."""
+    table = np.zeros(n + 1)
+    if n:
+        table[1:] = np.cumsum(np.log(np.arange(1, n + 1)))
+    return table
+
+
+def hwe_exact(hom1, het, hom2, log_fact=None):
+    """
+        Exact Hardy-Weinberg test (Wigginton, Cutler & Abecasis 2005), the same
+        test plink --hardy reports, vectorized across sites.
+
+        The probability of every possible het count is evaluated in log space
+        from a factorial table, so each block is a handful of array operations
+        rather than one Python loop per site.
+    """
+    hom1 = np.asarray(hom1, dtype=np.int64)
+    het = np.asarray(het, dtype=np.int64)
+    hom2 = np.asarray(hom2, dtype=np.int64)
+    n = hom1 + het + hom2
+    rare = 2 * np.minimum(hom1, hom2) + het
+    p_values = np.ones(len(n))
+    if not len(n):
+        return p_values
+
+    if log_fact is None:
+        log_fact = log_factorials(2 * int(n.max()))
+
+    width = int(rare.max()) + 1
+    rows_per_chunk = max(1, _HWE_GRID_CELLS // width)
+    het_grid = np.arange(width, dtype=np.int64)
+
+    for start in range(0, len(n), rows_per_chunk):
+        stop = start + rows_per_chunk
+        c_n = n[start:stop, None]
+        c_rare = rare[start:stop, None]
+        c_het = het[start:stop]
+
+        valid = (het_grid <= c_rare) & ((c_rare - het_grid) % 2 == 0)
+        h = np.where(valid, het_grid, 0)
+        homr = np.where(valid, (c_rare - h) // 2, 0)
+        homc = np.where(valid, c_n - h - homr, 0)
+
+        log_p = (log_fact[c_n] - log_fact[homr] - log_fact[h] - log_fact[homc] +
+                 h * np.log(2.0) + log_fact[c_rare] + log_fact[2 * c_n - c_rare] -
+                 log_fact[2 * c_n])
+        log_p = np.where(valid, log_p, -np.inf)
+
+        observed = log_p[np.arange(len(c_het)), c_het]
+        probs = np.exp(log_p - log_p.max(axis=1)[:, None])
+        as_likely = log_p <= observed[:, None] + _HWE_LOG_TOLERANCE
+        p = (probs * as_likely).sum(axis=1) / probs.sum(axis=1)
+        p_values[start:stop] = np.minimum(p, 1.0)
+
+    return p_values
+
+
+def block_stats(genotypes, log_fact=None):
+    """
+        MAF, observed/expected heterozygosity and HWE p-values for one block.
+        Columns follow plink: A1 is the minor allele and genotype counts are
+        reported as A1A1/A1A2/A2A2.
+    """
+    hom_ref, het, hom_alt = genotype_counts(genotypes)
+    called = hom_ref + het + hom_alt
+    nchrobs = 2 * called
+    alt_copies = 2 * hom_alt + het
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        alt_freq = alt_copies / nchrobs.astype(np.float64)
+        a1_is_alt = ~(alt_freq > 0.5)
+        maf = np.where(a1_is_alt, alt_freq, 1.0 - alt_freq)
+        o_het = het / called.astype(np.float64)
+        e_het = 2.0 * maf * (1.0 - maf)
+
+    hom1 = np.where(a1_is_alt, hom_alt, hom_ref)
+    hom2 = np.where(a1_is_alt, hom_ref, hom_alt)
+
+    return {
+        'a1_is_alt': a1_is_alt,
+        'maf': maf,
+        'nchrobs': nchrobs,
+        'hom1': hom1,
+        'het': het,
+        'hom2': hom2,
+        'o_het': o_het,
+        'e_het': e_het,
+        'hwe_p': hwe_exact(hom1, het, hom2, log_fact),
+        'missing': genotypes.shape[1] - called
+    }
+
+
+class BlockConsumer(object):
+    """
+        Base class for consumers of decoded genotype blocks.  consume_block()
+        receives the raw records of a block together with the int8 array
+        parse_genotype_block produced for them.  start_chunk(), partial() and
+        merge() follow RecordConsumer.
+    """
+    name = None
+
+    def start(self, header):
+        self.header = header
+
+    def start_chunk(self, header, chunk_index):
+        self.start(header)
+
+    def consume_block(self, records, genotypes):
+        raise NotImplementedError
+
+    def finish(self):
+        return None
+
+    def partial(self):
+        return self.finish()
+
+    def merge(self, partials):
+        raise NotImplementedError(
+            '{} cannot merge chunked results'.format(self.__class__.__name__))
+
+
+class GenotypeBlockReader(RecordConsumer):
+    """
+        Buffers scanned records into blocks and decodes each block once for
+        every BlockConsumer.  finish() returns the block consumers' results
+        keyed by their names.
+    """
+    name = 'genotypes'
+
+    def __init__(self, block_consumers, block_size=4096):
+        self.block_consumers = block_consumers
+        self.block_size = block_size
+
+    def start(self, header):
+        self._start(header)
+        for consumer in self.block_consumers:
+            consumer.start(header)
+
+    def start_chunk(self, header, chunk_index):
+        self._start(header)
+        for consumer in self.block_consumers:
+            consumer.start_chunk(header, chunk_index)
+
+    def _start(self, header):
+        self.header = header
+        self.num_samples = len(header.samples)
+        self.num_columns = len(header.columns)
+        self.block = []
+
+    def consume(self, line_number, fields):
+        # Malformed records are reported by StructuralChecker, not decoded.
+        if len(fields) != self.num_columns:
+            return
+        self.block.append(fields)
+        if len(self.block) >= self.block_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.block:
+            return
+        genotypes = parse_genotype_block(self.block, self.num_samples)
+        for consumer in self.block_consumers:
+            consumer.consume_block(self.block, genotypes)
+        self.block = []
+
+    def finish(self):
+        self._flush()
+        return dict((consumer.name, consumer.finish()) for consumer in self.block_consumers)
+
+    def partial(self):
+        self._flush()
+        return dict((consumer.name, consumer.partial()) for consumer in self.block_consumers)
+
+    def merge(self, partials):
+        return dict((consumer.name,
+                     consumer.merge([(line_offset, partial[consumer.name])
+                                     for line_offset, partial in partials]))
+                    for consumer in self.block_consumers)
+
+
+def _position(pos):
+    # Malformed positions are reported by StructuralChecker; keep the row.
+    try:
+        return int(pos)
+    except ValueError:
+        return -1
+
+
+def _empty_columns():
+    # Typed zero-length columns for a VCF without records.
+    columns = block_stats(np.empty((0, 0), dtype=np.int8))
+    columns['pos'] = np.empty(0, dtype=np.int64)
+    return columns
+
+
+class GenotypeStatsAccumulator(BlockConsumer):
+    """Keeps the per-site statistics plink --freq --hardy would write."""
+    name = 'stats'
+
+    def start(self, header):
+        super(GenotypeStatsAccumulator, self).start(header)
+        self.log_fact = log_factorials(2 * len(header.samples))
+        self.contigs = []
+        self.ids = []
+        self.ref = []
+        self.alt = []
+        self.columns = {}
+
+    def consume_block(self, records, genotypes):
+        for fields in records:
+            self.contigs.append(fields[0])
+            self.ids.append(fields[2])
+            self.ref.append(fields[3])
+            self.alt.append(fields[4])
+        self.columns.setdefault('pos', []).append(
+            np.array([_position(fields[1]) for fields in records], dtype=np.int64))
+        for key, values in block_stats(genotypes, self.log_fact).items():
+            self.columns.setdefault(key, []).append(values)
+
+    def finish(self):
+        stats = {
+            'contig': self.contigs,
+            'id': self.ids,
+            'ref': self.ref,
+            'alt': self.alt
+        }
+        if not self.columns:
+            stats.update(_empty_columns())
+        for key, blocks in self.columns.items():
+            stats[key] = np.concatenate(blocks)
+        return stats
+
+    def merge(self, partials):
+        stats = {}
+        for line_offset, partial in partials:
+            if not partial['contig']:
+                continue
+            for key, values in partial.items():
+                stats.setdefault(key, []).append(values)
+        merged = {'contig': [], 'id': [], 'ref': [], 'alt': []}
+        for key, parts in stats.items():
+            if key in merged:
+                for part in parts:
+                    merged[key].extend(part)
+            else:
+                merged[key] = np.concatenate(parts)
+        if len(merged) == 4:
+            merged.update(_empty_columns())
+        return merged
+
+
+def _a1_a2(stats, idx):
+    if stats['a1_is_alt'][idx]:
+        return stats['alt'][idx], stats['ref'][idx]
+    return stats['ref'][idx], stats['alt'][idx]
+
+
+def _format_float(value):
+    return 'NA' if np.isnan(value) else '{:.4g}'.format(value)
+
+
+def write_plink_frq(stats, filepath):
+    """Write stats in the whitespace layout of a plink .frq file."""
+    with open(filepath, 'w') as frq:
+        frq.write(' CHR          SNP   A1   A2          MAF  NCHROBS\n')
+        for idx in range(len(stats['contig'])):
+            a1, a2 = _a1_a2(stats, idx)
+            frq.write('{:>4} {:>12} {:>4} {:>4} {:>12} {:>8}\n'.format(
+                stats['contig'][idx], stats['id'][idx], a1, a2,
+                _format_float(stats['maf'][idx]), stats['nchrobs'][idx]))
+
+
+# Sites below this HWE p-value make up the "zoom" plot.
+HWE_ZOOM_THRESHOLD = 0.00001
+
+
+def hwe_zoom_rows(stats, threshold=HWE_ZOOM_THRESHOLD):
+    """Indices of the sites whose HWE p-value is below threshold; NaN never is."""
+    with np.errstate(invalid='ignore'):
+        return np.flatnonzero(stats['hwe_p'] < threshold)
+
+
+def write_plink_hwe(stats, filepath, rows=None):
+    """
+        Write stats in the whitespace layout of a plink .hwe file, optionally
+        only the sites at the given row indices.
+    """
+    if rows is None:
+        rows = range(len(stats['contig']))
+    with open(filepath, 'w') as hwe:
+        hwe.write(' CHR          SNP     TEST   A1   A2                 GENO   '
+                  'O(HET)   E(HET)            P\n')
+        for idx in rows:
+            a1, a2 = _a1_a2(stats, idx)
+            geno = '{}/{}/{}'.format(stats['hom1'][idx], stats['het'][idx], stats['hom2'][idx])
+            hwe.write('{:>4} {:>12} {:>8} {:>4} {:>4} {:>20} {:>8} {:>8} {:>12}\n'.format(
+                stats['contig'][idx], stats['id'][idx], 'ALL', a1, a2, geno,
+                _format_float(stats['o_het'][idx]), _format_float(stats['e_het'][idx]),
+                _format_float(stats['hwe_p'][idx])))
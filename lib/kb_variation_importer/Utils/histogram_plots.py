@@ -0,0 +1,95 @@
+import numpy as np
+
+# Same look as the ggplot2 histograms the R scripts draw.
+DEFAULT_BINS = 30
+BAR_FILL = '#eeb422'
+BAR_OUTLINE = '#191970'
+
+_WIDTH = 480
+_HEIGHT = 480
+_MARGIN_LEFT = 64
+_MARGIN_RIGHT = 16
+_MARGIN_TOP = 36
+_MARGIN_BOTTOM = 52
+_NUM_TICKS = 5
+
+
+def histogram(values, bins=DEFAULT_BINS):
+    """Counts and bin edges of the finite entries of values."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if not values.size:
+        return np.zeros(bins, dtype=np.int64), np.linspace(0.0, 1.0, bins + 1)
+    return np.histogram(values, bins=bins)
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _ticks(low, high):
+    return np.linspace(low, high, _NUM_TICKS)
+
+
+def histogram_svg(values, title, xlabel, bins=DEFAULT_BINS, fill=BAR_FILL, outline=BAR_OUTLINE):
+    """Render a histogram of values as a standalone SVG document."""
+    counts, edges = histogram(values, bins)
+    plot_width = _WIDTH - _MARGIN_LEFT - _MARGIN_RIGHT
+    plot_height = _HEIGHT - _MARGIN_TOP - _MARGIN_BOTTOM
+    x_low, x_high = float(edges[0]), float(edges[-1])
+    if x_high <= x_low:
+        x_high = x_low + 1.0
+    y_high = float(max(counts.max(), 1))
+
+    def x_position(value):
+        return _MARGIN_LEFT + (value - x_low) / (x_high - x_low) * plot_width
+
+    def y_position(count):
+        return _MARGIN_TOP + plot_height - count / y_high * plot_height
+
+    parts = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" '
+        'viewBox="0 0 {0} {1}" font-family="sans-serif" font-size="11">'.format(_WIDTH, _HEIGHT),
+        '<rect width="100%" height="100%" fill="white"/>',
+        '<rect x="{}" y="{}" width="{}" height="{}" fill="#ebebeb"/>'.format(
+            _MARGIN_LEFT, _MARGIN_TOP, plot_width, plot_height),
+        '<text x="{}" y="22" font-size="14" text-anchor="middle">{}</text>'.format(
+            _WIDTH / 2.0, _escape(title))
+    ]
+
+    for value in _ticks(x_low, x_high):
+        x = x_position(value)
+        parts.append('<line x1="{0:.1f}" y1="{1}" x2="{0:.1f}" y2="{2}" stroke="white"/>'.format(
+            x, _MARGIN_TOP, _MARGIN_TOP + plot_height))
+        parts.append('<text x="{:.1f}" y="{}" text-anchor="middle">{:.3g}</text>'.format(
+            x, _MARGIN_TOP + plot_height + 16, value))
+    for count in _ticks(0, y_high):
+        y = y_position(count)
+        parts.append('<line x1="{0}" y1="{1:.1f}" x2="{2}" y2="{1:.1f}" stroke="white"/>'.format(
+            _MARGIN_LEFT, y, _MARGIN_LEFT + plot_width))
+        parts.append('<text x="{}" y="{:.1f}" text-anchor="end">{:.4g}</text>'.format(
+            _MARGIN_LEFT - 6, y + 4, count))
+
+    for count, left, right in zip(counts, edges[:-1], edges[1:]):
+        if not count:
+            continue
+        x = x_position(left)
+        y = y_position(count)
+        parts.append('<rect x="{:.2f}" y="{:.2f}" width="{:.2f}" height="{:.2f}" '
+                     'fill="{}" stroke="{}"/>'.format(
+                         x, y, x_position(right) - x, _MARGIN_TOP + plot_height - y,
+                         fill, outline))
+
+    parts.append('<text x="{}" y="{}" text-anchor="middle">{}</text>'.format(
+        _MARGIN_LEFT + plot_width / 2.0, _HEIGHT - 12, _escape(xlabel)))
+    parts.append('<text x="16" y="{0}" text-anchor="middle" '
+                 'transform="rotate(-90 16 {0})">count</text>'.format(
+                     _MARGIN_TOP + plot_height / 2.0))
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def write_histogram_svg(values, filepath, title, xlabel, **kwargs):
+    with open(filepath, 'w') as svg:
+        svg.write(histogram_svg(values, title, xlabel, **kwargs))
+    return filepath
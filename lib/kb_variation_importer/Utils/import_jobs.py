@@ -0,0 +1,227 @@
+import errno
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from multiprocessing.pool import ThreadPool
+
+_JOB_ID = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno != errno.ESRCH
+    return True
+
+
+class ImportProgress(object):
+    """
+        Progress of one background import, kept in a JSON status file that
+        any server process on the host can read.  validate_vcf uses it as its
+        StageExecutor listener and as the scan's progress callback.
+
+        Scan updates arrive every few thousand records, so the file is only
+        rewritten when min_write_interval seconds have passed since the last
+        write; stage and state changes are always written.  Writes go through
+        a temporary file and a rename, so readers never see a partial file.
+    """
+
+    def __init__(self, status_filepath, job_id, user_id=None, min_write_interval=1.0):
+        self.status_filepath = status_filepath
+        self.job_id = job_id
+        self.user_id = user_id
+        self.min_write_interval = min_write_interval
+        self.state = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.ended = None
+        self.stages_running = {}
+        self.stages_completed = []
+        self.total_bytes = None
+        self.bytes_processed = 0
+        self.records_processed = 0
+        self.scan_started = None
+        self.scan_updated = None
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._last_write = 0
+        self._write(force=True)
+
+    def started_running(self):
+        with self._lock:
+            self.state = 'running'
+            self.started = time.time()
+        self._write(force=True)
+
+    def stage_started(self, name):
+        with self._lock:
+            self.stages_running[name] = time.time()
+        self._write(force=True)
+
+    def stage_finished(self, name, seconds):
+        with self._lock:
+            self.stages_running.pop(name, None)
+            self.stages_completed.append({'name': name, 'seconds': seconds})
+        self._write(force=True)
+
+    def set_total_bytes(self, total_bytes):
+        with self._lock:
+            self.total_bytes = total_bytes
+            self.scan_started = time.time()
+        self._write(force=True)
+
+    def scan_progress(self, bytes_processed, records_processed):
+        with self._lock:
+            self.bytes_processed = bytes_processed
+            self.records_processed = records_processed
+            self.scan_updated = time.time()
+        self._write()
+
+    def completed(self, result):
+        with self._lock:
+            self.state = 'completed'
+            self.result = result
+            self.ended = time.time()
+        self._write(force=True)
+
+    def failed(self, error):
+        with self._lock:
+            self.state = 'error'
+            self.error = error
+            self.ended = time.time()
+        self._write(force=True)
+
+    def to_dict(self, now=None):
+        """
+            The status as returned by get_import_status.  Throughput covers
+            the scan, the one stage that streams the whole VCF; the ETA is
+            for the scan to finish at that rate.
+        """
+        now = now or time.time()
+        with self._lock:
+            status = {
+                'job_id': self.job_id,
+                'user_id': self.user_id,
+                'pid': os.getpid(),
+                'state': self.state,
+                'submitted': self.submitted,
+                'elapsed_seconds': ((self.ended or now) - self.started) if self.started else 0.0,
+                'running_stages': sorted(self.stages_running, key=self.stages_running.get),
+                'completed_stages': list(self.stages_completed),
+                'bytes_processed': self.bytes_processed,
+                'total_bytes': self.total_bytes,
+                'records_processed': self.records_processed,
+                'bytes_per_second': None,
+                'records_per_second': None,
+                'eta_seconds': None,
+                'result': self.result,
+                'error': self.error
+            }
+            if self.scan_started and self.scan_updated:
+                seconds = self.scan_updated - self.scan_started
+                if seconds > 0:
+                    status['bytes_per_second'] = self.bytes_processed / seconds
+                    status['records_per_second'] = self.records_processed / seconds
+                if self.total_bytes is not None and status['bytes_per_second']:
+                    status['eta_seconds'] = (max(0, self.total_bytes - self.bytes_processed) /
+                                             status['bytes_per_second'])
+        return status
+
+    def _write(self, force=False):
+        now = time.time()
+        if not force and now - self._last_write < self.min_write_interval:
+            return
+        self._last_write = now
+        status = self.to_dict(now)
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.status_filepath),
+                                            suffix='.tmp')
+        with os.fdopen(handle, 'w') as status_file:
+            json.dump(status, status_file)
+        os.rename(tmp_path, self.status_filepath)
+
+
+class ImportJobQueue(object):
+    """
+        Runs imports on a local thread pool and tracks them by job ID through
+        ImportProgress status files under status_dir.
+
+        The pool is created on first use in each process, so a queue built
+        before the server forks its workers is still usable in every worker.
+        Status is read back from the files, so any worker can answer for a
+        job another worker is running.
+    """
+
+    def __init__(self, status_dir, max_workers=2):
+        self.status_dir = status_dir
+        self.max_workers = max_workers
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        try:
+            os.makedirs(status_dir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+    def _status_filepath(self, job_id):
+        if not _JOB_ID.match(job_id or ''):
+            raise ValueError("Unknown import job {}".format(job_id))
+        return os.path.join(self.status_dir, job_id + '.json')
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPool(self.max_workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def submit(self, func, user_id=None):
+        """Queue func(progress) and return the new job's ID."""
+        job_id = str(uuid.uuid4())
+        progress = ImportProgress(self._status_filepath(job_id), job_id, user_id)
+        self._get_pool().apply_async(self._run, (func, progress))
+        return job_id
+
+    def _run(self, func, progress):
+        progress.started_running()
+        try:
+            result = func(progress)
+        except Exception as e:
+            traceback.print_exc()
+            progress.failed(str(e))
+        else:
+            progress.completed(result)
+
+    def status(self, job_id, user_id=None):
+        """
+            The job's last written status.  Jobs belong to the user that
+            submitted them; a job whose process has gone away before it
+            finished, e.g. a recycled server worker, is reported as failed.
+        """
+        try:
+            with open(self._status_filepath(job_id)) as status_file:
+                status = json.load(status_file)
+        except (IOError, OSError, ValueError):
+            raise ValueError("Unknown import job {}".format(job_id))
+        if user_id is not None and status.get('user_id') not in (None, user_id):
+            raise ValueError("Unknown import job {}".format(job_id))
+        if status['state'] in ('queued', 'running') and not _pid_alive(status['pid']):
+            status['state'] = 'error'
+            status['error'] = "The process running the import exited before it finished."
+        return status
+
+    def join(self):
+        """Wait for every job queued in this process to finish."""
+        with self._pool_lock:
+            pool = self._pool if self._pool_pid == os.getpid() else None
+            self._pool = None
+        if pool is not None:
+            pool.close()
+            pool.join()
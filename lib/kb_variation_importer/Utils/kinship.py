@@ -0,0 +1,135 @@
+import errno
+import os
+
+import numpy as np
+
+from kb_variation_importer.Utils.genotype_stats import MISSING, BlockConsumer
+
+
+def centered_block(genotypes, standardize=False):
+    """
+        Center a (variants, samples) dosage block on twice the per-site allele
+        frequency.  Missing calls are mean-imputed, i.e. contribute zero.
+
+        Returns the centered float64 block and the per-site 2p(1-p) values.
+    """
+    called = genotypes != MISSING
+    dosage = np.where(called, genotypes, 0).astype(np.float64)
+    num_called = called.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = dosage.sum(axis=1) / (2.0 * num_called)
+    p[num_called == 0] = 0.0
+    variance = 2.0 * p * (1.0 - p)
+
+    centered = np.where(called, dosage - 2.0 * p[:, None], 0.0)
+    if standardize:
+        scale = np.zeros_like(variance)
+        polymorphic = variance > 0
+        scale[polymorphic] = 1.0 / np.sqrt(variance[polymorphic])
+        centered *= scale[:, None]
+    return centered, variance
+
+
+class KinshipAccumulator(BlockConsumer):
+    """
+        Genomic relationship matrix accumulated block by block as Z^T Z, so
+        memory stays at samples x samples no matter how many variants are
+        streamed.  Each block product is a single BLAS GEMM.
+
+        With standardize=False this is VanRaden's first method,
+        G = Z^T Z / (2 * sum(p * (1 - p))).  With standardize=True every site
+        is scaled to unit variance and G = Z^T Z / (number of polymorphic sites).
+
+        Under ParallelVCFScanner each chunk's samples x samples sum is saved to
+        partial_dir, when given, rather than pickled back to the parent, and
+        merge() adds the saved sums one at a time; the parent then holds one
+        matrix however many chunks there are.
+    """
+    name = 'kinship'
+
+    def __init__(self, standardize=False, partial_dir=None):
+        self.standardize = standardize
+        self.partial_dir = partial_dir
+
+    def start(self, header):
+        super(KinshipAccumulator, self).start(header)
+        self._reset(header.samples)
+
+    def _reset(self, samples):
+        self.samples = samples
+        num_samples = len(self.samples)
+        self.relationship = np.zeros((num_samples, num_samples), dtype=np.float64)
+        self.denominator = 0.0
+        self.chunk_index = None
+
+    def start_chunk(self, header, chunk_index):
+        self.start(header)
+        self.chunk_index = chunk_index
+
+    def consume_block(self, records, genotypes):
+        centered, variance = centered_block(genotypes, self.standardize)
+        self.relationship += np.dot(centered.T, centered)
+        if self.standardize:
+            self.denominator += np.count_nonzero(variance)
+        else:
+            self.denominator += variance.sum()
+
+    def finish(self):
+        return self._kinship(self.samples, self.relationship, self.denominator)
+
+    def partial(self):
+        relationship = self.relationship
+        if self.partial_dir:
+            try:
+                os.makedirs(self.partial_dir)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+            relationship = os.path.join(self.partial_dir,
+                                        'kinship_{:05d}.npy'.format(self.chunk_index))
+            np.save(relationship, self.relationship)
+        return {
+            'samples': self.samples,
+            'relationship': relationship,
+            'denominator': self.denominator
+        }
+
+    def merge(self, partials):
+        relationship = None
+        for line_offset, partial in partials:
+            part = partial['relationship']
+            if not isinstance(part, np.ndarray):
+                filepath = part
+                part = np.load(filepath)
+                os.remove(filepath)
+            if relationship is None:
+                relationship = part.astype(np.float64)
+            else:
+                relationship += part
+        if self.partial_dir and os.path.isdir(self.partial_dir) and \
+                not os.listdir(self.partial_dir):
+            os.rmdir(self.partial_dir)
+        denominator = sum(partial['denominator'] for line_offset, partial in partials)
+        return self._kinship(partials[0][1]['samples'], relationship, denominator)
+
+    @staticmethod
+    def _kinship(samples, relationship, denominator):
+        if denominator:
+            relationship = relationship / denominator
+        return {
+            'row_ids': samples,
+            'col_ids': samples,
+            'kinship_coefficients': relationship.tolist()
+        }
+
+
+def matrix_kinship(matrix, standardize=False):
+    """
+        Kinship over the variants and samples of a GenotypeMatrix, e.g. one
+        subset by QC, streamed block by block like the scan.
+    """
+    accumulator = KinshipAccumulator(standardize)
+    accumulator._reset(matrix.samples)
+    for start, genotypes in matrix.iter_blocks():
+        accumulator.consume_block(None, genotypes)
+    return accumulator.finish()
@@ -0,0 +1,187 @@
+import multiprocessing
+import os
+import threading
+
+from kb_variation_importer.Utils import bgzf
+from kb_variation_importer.Utils.vcf_scanner import VCFScanner, open_vcf, parse_header
+
+_READ_SIZE = 1 << 20
+# Files smaller than this per worker are not worth the process start-up.
+MIN_CHUNK_SIZE = 64 << 20
+
+
+def _text(line):
+    return line if isinstance(line, str) else line.decode('latin-1')
+
+
+def _plain_pieces(filepath, start, end):
+    """Yield (data, owned) pieces of an uncompressed file from start; owned up to end."""
+    with open(filepath, 'rb') as handle:
+        handle.seek(start)
+        position = start
+        while True:
+            data = handle.read(_READ_SIZE)
+            if not data:
+                return
+            if end is not None and position < end < position + len(data):
+                yield data[:end - position], True
+                yield data[end - position:], False
+            else:
+                yield data, end is None or position < end
+            position += len(data)
+
+
+def _bgzf_pieces(filepath, start, end):
+    """Yield (data, owned) decompressed BGZF blocks from start; owned up to end."""
+    with open(filepath, 'rb') as handle:
+        for offset, data in bgzf.iter_blocks(handle, start):
+            yield data, end is None or offset < end
+
+
+def chunk_lines(pieces, first_chunk):
+    """
+        Yield the lines a chunk owns: every line starting at or before the end
+        of its owned data.  All chunks but the first skip through their first
+        newline, because the previous chunk reads past its end to complete
+        exactly that line.
+    """
+    owned_length = 0
+    owned_end = None
+    position = 0
+    skipping = not first_chunk
+    buf = b''
+    for data, owned in pieces:
+        if owned:
+            owned_length += len(data)
+        elif owned_end is None:
+            owned_end = owned_length
+        buf += data
+        start = 0
+        while True:
+            newline = buf.find(b'\n', start)
+            if newline < 0:
+                break
+            if skipping:
+                skipping = False
+            elif owned_end is not None and position + start > owned_end:
+                return
+            else:
+                yield buf[start:newline + 1]
+            start = newline + 1
+        buf = buf[start:]
+        position += start
+
+    if buf and not skipping and (owned_end is None or position <= owned_end):
+        yield buf
+
+
+def _scan_chunk(task):
+    filepath, compressed, chunk_index, start, end, header, consumer_factory = task
+    consumers = consumer_factory()
+    for consumer in consumers:
+        consumer.start_chunk(header, chunk_index)
+
+    pieces = (_bgzf_pieces if compressed else _plain_pieces)(filepath, start, end)
+    line_count = 0
+    for line in chunk_lines(pieces, chunk_index == 0):
+        line_count += 1
+        line = _text(line).rstrip('\r\n')
+        if not line or line.startswith('#'):
+            continue
+        fields = line.split('\t')
+        for consumer in consumers:
+            consumer.consume(line_count, fields)
+
+    return line_count, dict((consumer.name, consumer.partial()) for consumer in consumers)
+
+
+def chunk_ranges(filepath, num_chunks, compressed):
+    """
+        Split a file into (start, end) byte ranges; end is None for the last.
+        BGZF ranges start on block boundaries so each can be decompressed on
+        its own.  Uncompressed ranges may start mid-line; chunk_lines sorts
+        out record ownership.
+    """
+    size = os.path.getsize(filepath)
+    targets = [size * idx // num_chunks for idx in range(num_chunks)]
+    if compressed:
+        starts = []
+        with open(filepath, 'rb') as handle:
+            for target in targets:
+                start = bgzf.find_block_start(handle, target)
+                if start is not None and start not in starts:
+                    starts.append(start)
+    else:
+        starts = sorted(set(targets))
+    return list(zip(starts, starts[1:] + [None]))
+
+
+class ParallelVCFScanner(object):
+    """
+        VCFScanner counterpart that splits an uncompressed or BGZF VCF into
+        byte ranges, scans each in a worker process and merges the partial
+        results.
+
+        consumer_factory must be picklable (a module level function or a
+        functools.partial of one) and return fresh RecordConsumers that
+        implement merge().  Plain gzip files cannot be split and are scanned
+        serially.
+    """
+
+    def __init__(self, vcf_filepath, consumer_factory, processes=None,
+                 min_chunk_size=MIN_CHUNK_SIZE, progress=None):
+        self.vcf_filepath = vcf_filepath
+        self.consumer_factory = consumer_factory
+        self.processes = processes or multiprocessing.cpu_count()
+        self.min_chunk_size = min_chunk_size
+        self.progress = progress
+        self._progress_lock = threading.Lock()
+        self._scanned = [0, 0]
+
+    def _chunk_done(self, chunk_bytes, header_lines):
+        # Runs on the pool's result thread as each chunk finishes.
+        def callback(result):
+            with self._progress_lock:
+                self._scanned[0] += chunk_bytes
+                self._scanned[1] += result[0] - header_lines
+                self.progress(*self._scanned)
+        return callback
+
+    def scan(self):
+        compressed = self.vcf_filepath.endswith('.gz')
+        size = os.path.getsize(self.vcf_filepath)
+        num_chunks = min(self.processes, max(1, size // self.min_chunk_size))
+        if num_chunks < 2 or (compressed and not bgzf.is_bgzf(self.vcf_filepath)):
+            return VCFScanner(self.vcf_filepath, self.consumer_factory(), self.progress).scan()
+
+        with open_vcf(self.vcf_filepath) as vcf:
+            header = parse_header(iter(vcf))
+
+        ranges = chunk_ranges(self.vcf_filepath, num_chunks, compressed)
+        tasks = [(self.vcf_filepath, compressed, idx, start, end, header, self.consumer_factory)
+                 for idx, (start, end) in enumerate(ranges)]
+
+        pool = multiprocessing.Pool(min(self.processes, len(tasks)))
+        try:
+            if self.progress:
+                results = [pool.apply_async(_scan_chunk, (task,), callback=self._chunk_done(
+                    (size if end is None else end) - start, header.line_count if idx == 0 else 0))
+                    for idx, (task, (start, end)) in enumerate(zip(tasks, ranges))]
+                chunk_results = [result.get() for result in results]
+            else:
+                chunk_results = pool.map(_scan_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        line_offsets = []
+        line_offset = 0
+        for line_count, partials in chunk_results:
+            line_offsets.append(line_offset)
+            line_offset += line_count
+
+        consumers = self.consumer_factory()
+        return dict((consumer.name,
+                     consumer.merge([(line_offsets[idx], partials[consumer.name])
+                                     for idx, (line_count, partials) in enumerate(chunk_results)]))
+                    for consumer in consumers)
@@ -0,0 +1,244 @@
+import copy
+import errno
+import os
+import shutil
+
+import numpy as np
+
+from kb_variation_importer.Utils.bgzf import BgzfReader
+from kb_variation_importer.Utils.genotype_stats import (MISSING, BlockConsumer,
+                                                        genotype_counts,
+                                                        hwe_exact,
+                                                        log_factorials)
+from kb_variation_importer.Utils.tabix import BgzfVcfWriter
+
+FILTERED_VCF_FILENAME = 'filtered.vcf.gz'
+DROPPED_SITES_FILENAME = 'dropped_sites.tsv'
+DROPPED_SAMPLES_FILENAME = 'dropped_samples.txt'
+
+# import_variation parameter -> plink flag it mirrors.  The spec documents the
+# first three as percentages and hwe_threshold as a p-value.
+_PERCENT_PARAMS = (('maf_threshold', 'maf'),
+                   ('geno_missingness', 'geno'),
+                   ('indiv_missingness', 'mind'))
+
+
+def qc_thresholds(params):
+    """
+        QC thresholds from import_variation params as plink style fractions,
+        e.g. {'maf': 0.05, 'hwe': 1e-6}.  Unset parameters are left out, so an
+        empty dict means no filtering.
+    """
+    thresholds = {}
+    for param, flag in _PERCENT_PARAMS:
+        if params.get(param) is not None and params.get(param) != '':
+            value = float(params[param])
+            if not 0 <= value <= 100:
+                raise ValueError("{} must be a percentage between 0 and 100, got {}".format(
+                    param, params[param]))
+            thresholds[flag] = value / 100.0
+    if params.get('hwe_threshold') is not None and params.get('hwe_threshold') != '':
+        value = float(params['hwe_threshold'])
+        if not 0 <= value <= 1:
+            raise ValueError("hwe_threshold must be a p-value between 0 and 1, got {}".format(
+                params['hwe_threshold']))
+        thresholds['hwe'] = value
+    return thresholds
+
+
+def site_filter_reasons(genotypes, thresholds, log_fact=None):
+    """
+        Per-site list of the plink filters (geno, maf, hwe) each row of an
+        int8 genotype block fails; an empty list means the site is kept.
+    """
+    hom_ref, het, hom_alt = genotype_counts(genotypes)
+    called = hom_ref + het + hom_alt
+    failed = []
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'geno' in thresholds:
+            missing_rate = 1.0 - called / float(genotypes.shape[1])
+            failed.append(('geno', missing_rate > thresholds['geno']))
+        if 'maf' in thresholds:
+            alt_freq = (2 * hom_alt + het) / (2.0 * called)
+            maf = np.minimum(alt_freq, 1.0 - alt_freq)
+            # Sites with no calls have no MAF; plink drops them too.
+            failed.append(('maf', ~(maf >= thresholds['maf'])))
+        if 'hwe' in thresholds:
+            p_values = hwe_exact(hom_ref, het, hom_alt, log_fact)
+            failed.append(('hwe', p_values < thresholds['hwe']))
+    return [[name for name, mask in failed if mask[idx]] for idx in range(len(genotypes))]
+
+
+def samples_to_drop(samples, sample_missing, num_sites, thresholds):
+    """Samples whose missing call rate exceeds the mind (indiv_missingness) threshold."""
+    if 'mind' not in thresholds or not num_sites:
+        return []
+    missing_rate = np.asarray(sample_missing, dtype=np.float64) / num_sites
+    return [sample for sample, rate in zip(samples, missing_rate) if rate > thresholds['mind']]
+
+
+def drop_sample_columns(bgzf_filepath, header, dropped_samples):
+    """
+        Re-write an indexed BGZF VCF without the given sample columns, in
+        place, and rebuild its tabix index.
+    """
+    dropped = set(dropped_samples)
+    keep = list(range(9)) + [9 + idx for idx, sample in enumerate(header.samples)
+                             if sample not in dropped]
+    kept_header = copy.copy(header)
+    kept_header.columns = [header.columns[idx] for idx in keep]
+    kept_header.samples = kept_header.columns[9:]
+
+    source_filepath = bgzf_filepath + '.unfiltered_samples'
+    shutil.move(bgzf_filepath, source_filepath)
+    writer = BgzfVcfWriter(bgzf_filepath)
+    writer.start(kept_header)
+    reader = BgzfReader(source_filepath)
+    reader.seek(0)
+    try:
+        while True:
+            line = reader.readline()
+            if not line:
+                break
+            line = line.decode('latin-1')
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            writer.consume(None, [fields[idx] for idx in keep])
+    finally:
+        reader.close()
+    os.remove(source_filepath)
+    return writer.finish()
+
+
+class QCFilterWriter(BlockConsumer):
+    """
+        Applies the plink style QC filters during the import scan.  Sites
+        failing --geno, --maf or --hwe are left out of a BGZF copy of the VCF
+        and listed in dropped_sites.tsv; per-sample missing calls are counted
+        over every site so samples failing --mind can be dropped afterwards.
+        The result's site_mask marks the kept sites in scan order, so the
+        packed genotype matrix can be subset without another pass.
+
+        Unlike plink, which applies --mind before the site filters, site
+        statistics are computed over all samples so that one pass suffices.
+    """
+    name = 'qc'
+
+    def __init__(self, output_dir, thresholds):
+        self.output_dir = output_dir
+        self.thresholds = thresholds
+        self.bgzf_filepath = os.path.join(output_dir, FILTERED_VCF_FILENAME)
+        self.dropped_sites_filepath = os.path.join(output_dir, DROPPED_SITES_FILENAME)
+        self.dropped_samples_filepath = os.path.join(output_dir, DROPPED_SAMPLES_FILENAME)
+
+    def start(self, header):
+        self._start(header)
+        self.writer.start(header)
+        self._open_dropped(self.dropped_sites_filepath)
+
+    def start_chunk(self, header, chunk_index):
+        self._start(header)
+        self.writer.start_chunk(header, chunk_index)
+        self._open_dropped('{}.part_{:05d}'.format(self.dropped_sites_filepath, chunk_index))
+
+    def _start(self, header):
+        super(QCFilterWriter, self).start(header)
+        # Every parallel scan worker gets here; another may create it first.
+        try:
+            os.makedirs(self.output_dir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        self.writer = BgzfVcfWriter(self.bgzf_filepath)
+        self.log_fact = None
+        if 'hwe' in self.thresholds:
+            self.log_fact = log_factorials(2 * len(header.samples))
+        self.sample_missing = np.zeros(len(header.samples), dtype=np.int64)
+        self.site_masks = []
+        self.num_dropped_sites = 0
+
+    def _open_dropped(self, filepath):
+        self.dropped_filepath = filepath
+        self.dropped = open(filepath, 'w')
+
+    def consume_block(self, records, genotypes):
+        self.sample_missing += (genotypes == MISSING).sum(axis=0)
+        reasons = site_filter_reasons(genotypes, self.thresholds, self.log_fact)
+        self.site_masks.append(np.array([not failed for failed in reasons], dtype=bool))
+        for fields, reasons in zip(records, reasons):
+            if reasons:
+                self.dropped.write('\t'.join(fields[:3] + [','.join(reasons)]) + '\n')
+                self.num_dropped_sites += 1
+            else:
+                self.writer.consume(None, fields)
+
+    def finish(self):
+        self.dropped.close()
+        written = self.writer.finish()
+        self._prepend_dropped_header([self.dropped_sites_filepath])
+        return self._finish_samples(self.header, self.sample_missing, self._site_mask(),
+                                    self.num_dropped_sites, written['sha1'])
+
+    def _site_mask(self):
+        if not self.site_masks:
+            return np.zeros(0, dtype=bool)
+        return np.concatenate(self.site_masks)
+
+    def partial(self):
+        self.dropped.close()
+        return {
+            'bgzf': self.writer.partial(),
+            'dropped_filepath': self.dropped_filepath,
+            'sample_missing': self.sample_missing,
+            'site_mask': self._site_mask(),
+            'num_dropped_sites': self.num_dropped_sites
+        }
+
+    def merge(self, partials):
+        self.writer = BgzfVcfWriter(self.bgzf_filepath)
+        written = self.writer.merge([(line_offset, partial['bgzf'])
+                                     for line_offset, partial in partials])
+        self._prepend_dropped_header([partial['dropped_filepath'] for _, partial in partials])
+        return self._finish_samples(
+            partials[0][1]['bgzf']['header'],
+            sum(partial['sample_missing'] for _, partial in partials),
+            np.concatenate([partial['site_mask'] for _, partial in partials]),
+            sum(partial['num_dropped_sites'] for _, partial in partials),
+            written['sha1'])
+
+    def _prepend_dropped_header(self, part_filepaths):
+        merged_filepath = self.dropped_sites_filepath + '.merged'
+        with open(merged_filepath, 'w') as merged:
+            merged.write('#CHROM\tPOS\tID\tFILTERS\n')
+            for part_filepath in part_filepaths:
+                with open(part_filepath) as part:
+                    shutil.copyfileobj(part, merged)
+                os.remove(part_filepath)
+        shutil.move(merged_filepath, self.dropped_sites_filepath)
+
+    def _finish_samples(self, header, sample_missing, site_mask, num_dropped_sites, sha1):
+        num_sites = len(site_mask)
+        dropped_samples = samples_to_drop(header.samples, sample_missing, num_sites,
+                                          self.thresholds)
+        dropped = set(dropped_samples)
+        with open(self.dropped_samples_filepath, 'w') as samples:
+            for sample in dropped_samples:
+                samples.write(sample + '\n')
+        if dropped_samples:
+            sha1 = drop_sample_columns(self.bgzf_filepath, header, dropped_samples)['sha1']
+
+        return {
+            'thresholds': self.thresholds,
+            'bgzf_filepath': self.bgzf_filepath,
+            'index_filepath': self.bgzf_filepath + '.tbi',
+            'sha1': sha1,
+            'dropped_sites_filepath': self.dropped_sites_filepath,
+            'dropped_samples_filepath': self.dropped_samples_filepath,
+            'num_sites': num_sites,
+            'num_dropped_sites': num_dropped_sites,
+            'site_mask': site_mask,
+            'samples': [sample for sample in header.samples if sample not in dropped],
+            'dropped_samples': dropped_samples,
+            'sample_missing': np.asarray(sample_missing).tolist()
+        }
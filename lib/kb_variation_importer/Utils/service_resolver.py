@@ -0,0 +1,61 @@
+import threading
+import time
+
+import requests
+
+from GenomeAnnotationAPI.baseclient import BaseClient
+
+# Seconds a dynamic service URL from the Service Wizard is reused.
+SERVICE_URL_TTL = 300
+
+_service_urls = {}
+_service_urls_lock = threading.Lock()
+
+
+class ServiceResolver(object):
+    """
+        Calls KBase dynamic services without a Service Wizard round trip per
+        call.  Looked-up service URLs are kept process wide for ttl seconds
+        and dropped as soon as a call to them cannot reach the service, so a
+        redeployed service is picked up on the retry.
+    """
+
+    def __init__(self, service_wizard_url, token, ttl=SERVICE_URL_TTL, service_ver='release'):
+        self.service_wizard_url = service_wizard_url
+        self.token = token
+        self.ttl = ttl
+        self.service_ver = service_ver
+
+    def _key(self, module_name):
+        return self.service_wizard_url, module_name, self.service_ver
+
+    def service_url(self, module_name):
+        key = self._key(module_name)
+        now = time.time()
+        with _service_urls_lock:
+            cached = _service_urls.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        wizard = BaseClient(self.service_wizard_url, token=self.token)
+        url = wizard.call_method('ServiceWizard.get_service_status',
+                                 [{'module_name': module_name,
+                                   'version': self.service_ver}])['url']
+        with _service_urls_lock:
+            _service_urls[key] = (url, now + self.ttl)
+        return url
+
+    def invalidate(self, module_name):
+        with _service_urls_lock:
+            _service_urls.pop(self._key(module_name), None)
+
+    def call_method(self, service_method, args):
+        module_name = service_method.split('.')[0]
+        for attempt in range(2):
+            client = BaseClient(self.service_url(module_name), token=self.token)
+            try:
+                return client.call_method(service_method, args, self.service_ver)
+            except requests.exceptions.RequestException:
+                self.invalidate(module_name)
+                if attempt:
+                    raise
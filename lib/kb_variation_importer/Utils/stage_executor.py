@@ -0,0 +1,158 @@
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+try:
+    from queue import Queue  # py3
+except ImportError:
+    from Queue import Queue  # py2
+
+if sys.version_info[0] < 3:
+    exec('def _reraise(error, traceback):\n    raise error, None, traceback\n')
+else:
+    def _reraise(error, traceback):
+        raise error.with_traceback(traceback)
+
+
+class StageError(Exception):
+    """A stage raised; stage names it and error is what it raised."""
+
+    def __init__(self, stage, error):
+        super(StageError, self).__init__('Stage {} failed: {}: {}'.format(
+            stage, error.__class__.__name__, error))
+        self.stage = stage
+        self.error = error
+
+
+class StageExecutor(object):
+    """
+        Runs named stages on a thread pool as soon as the stages they require
+        have finished.  A stage function is called with the results of its
+        required stages as positional arguments, in the order declared.
+
+        If a stage raises, no further stages are started and run() raises a
+        StageError for the first failure, with the traceback of the failing
+        stage, once the stages already running have finished.
+        Per-stage wall clock timings are kept in timings.  An optional
+        listener is told as each stage starts and finishes through its
+        stage_started(name) and stage_finished(name, seconds) methods.
+
+        With a StageCheckpoints store, stages added with checkpoint=True are
+        loaded from their saved manifest when their inputs are unchanged and
+        saved once they finish; their names are listed in resumed.  A stage's
+        fingerprint function, if given, turns its result into the content key
+        the stages after it are keyed on.
+    """
+
+    def __init__(self, max_workers=4, listener=None, checkpoints=None):
+        self.max_workers = max_workers
+        self.listener = listener
+        self.checkpoints = checkpoints
+        self.stages = []
+        self.results = {}
+        self.keys = {}
+        self.timings = {}
+        self.resumed = []
+        self._checkpointed = {}
+        self._timings_lock = threading.Lock()
+
+    def add(self, name, func, requires=(), checkpoint=False, fingerprint=None):
+        known = set(stage[0] for stage in self.stages)
+        if name in known:
+            raise ValueError("Stage {} is already defined.".format(name))
+        missing = [required for required in requires if required not in known]
+        if missing:
+            raise ValueError("Stage {} requires undefined stages: {}".format(
+                name, ', '.join(missing)))
+        self.stages.append((name, func, tuple(requires)))
+        if checkpoint:
+            self._checkpointed[name] = fingerprint
+
+    def _call_stage(self, name, func, args, key):
+        """The stage's result and output key, from its checkpoint if it has one."""
+        checkpointed = self.checkpoints is not None and name in self._checkpointed
+        if checkpointed:
+            saved = self.checkpoints.load(name, key)
+            if saved is not None:
+                with self._timings_lock:
+                    self.resumed.append(name)
+                return saved
+            self.checkpoints.clear(name)
+        result = func(*args)
+        output_key = key
+        fingerprint = self._checkpointed.get(name)
+        if fingerprint is not None and key is not None:
+            output_key = fingerprint(result)
+        if checkpointed:
+            self.checkpoints.save(name, key, result, output_key)
+        return result, output_key
+
+    def _run_stage(self, name, func, args, key, done):
+        start = time.time()
+        if self.listener:
+            self.listener.stage_started(name)
+        try:
+            result, output_key = self._call_stage(name, func, args, key)
+            error = None
+        except Exception:
+            result = output_key = None
+            error = sys.exc_info()
+        end = time.time()
+        with self._timings_lock:
+            self.timings[name] = {'start': start, 'end': end, 'seconds': end - start}
+        if self.listener:
+            self.listener.stage_finished(name, end - start)
+        done.put((name, result, output_key, error))
+
+    def run(self):
+        pending = list(self.stages)
+        running = set()
+        done = Queue()
+        first_error = None
+        pool = ThreadPool(self.max_workers)
+        try:
+            while pending or running:
+                if first_error is None:
+                    for stage in list(pending):
+                        name, func, requires = stage
+                        if all(required in self.results for required in requires):
+                            pending.remove(stage)
+                            running.add(name)
+                            args = [self.results[required] for required in requires]
+                            key = None
+                            if self.checkpoints is not None:
+                                key = self.checkpoints.stage_key(
+                                    name, [self.keys[required] for required in requires])
+                            pool.apply_async(self._run_stage, (name, func, args, key, done))
+                if not running:
+                    break
+                name, result, output_key, error = done.get()
+                running.discard(name)
+                if error is not None:
+                    first_error = first_error or (name, error)
+                else:
+                    self.results[name] = result
+                    self.keys[name] = output_key
+        finally:
+            pool.close()
+            pool.join()
+
+        if first_error is not None:
+            name, (error_class, error, traceback) = first_error
+            stage_error = StageError(name, error)
+            stage_error.__cause__ = error
+            _reraise(stage_error, traceback)
+        return self.results
+
+    def elapsed(self):
+        """Seconds from the first stage starting to the last one finishing."""
+        if not self.timings:
+            return 0.0
+        return (max(timing['end'] for timing in self.timings.values()) -
+                min(timing['start'] for timing in self.timings.values()))
+
+    def timing_summary(self):
+        return ', '.join('{}: {:.2f}s{}'.format(name, self.timings[name]['seconds'],
+                                                ' (resumed)' if name in self.resumed else '')
+                         for name, func, requires in self.stages if name in self.timings)
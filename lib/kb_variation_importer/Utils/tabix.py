@@ -0,0 +1,296 @@
+import gzip
+import os
+import struct
+from collections import OrderedDict
+
+from kb_variation_importer.Utils.bgzf import (EOF_BLOCK, BgzfReader, BgzfWriter,
+                                              make_virtual_offset)
+from kb_variation_importer.Utils.vcf_scanner import RecordConsumer
+
+TABIX_MAGIC = b'TBI\x01'
+# Preset for VCF: sequence in column 1, begin in column 2, end from REF.
+_TABIX_VCF_FORMAT = 2
+_LINEAR_SHIFT = 14
+_BIN_LEVELS = ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681))
+_COPY_SIZE = 1 << 20
+
+
+def reg2bin(beg, end):
+    """Smallest UCSC/tabix bin holding the 0-based half-open interval [beg, end)."""
+    end -= 1
+    for shift, offset in reversed(_BIN_LEVELS):
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+    return 0
+
+
+def reg2bins(beg, end):
+    """Every bin that may hold records overlapping [beg, end)."""
+    end -= 1
+    bins = [0]
+    for shift, offset in _BIN_LEVELS:
+        bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+    return bins
+
+
+def parse_region(region):
+    """
+        Parse 'chr3:1,000,000-2,000,000' (1-based, inclusive) into
+        (contig, start, end).  A bare contig covers the whole contig.
+    """
+    if ':' not in region:
+        return region, 1, 1 << 29
+    contig, span = region.rsplit(':', 1)
+    span = span.replace(',', '')
+    if '-' in span:
+        start, end = span.split('-', 1)
+        return contig, int(start), int(end)
+    return contig, int(span), int(span)
+
+
+def _record_span(fields):
+    beg = int(fields[1]) - 1
+    return beg, beg + max(1, len(fields[3]))
+
+
+class TabixIndex(object):
+    """
+        In-memory tabix index: per contig a map of bin -> chunks of virtual
+        offsets plus a linear index of the first record offset per 16 kb
+        window.  Reads and writes the standard .tbi layout.
+    """
+
+    def __init__(self):
+        self.refs = OrderedDict()
+
+    def _ref(self, contig):
+        if contig not in self.refs:
+            self.refs[contig] = {'bins': {}, 'linear': []}
+        return self.refs[contig]
+
+    def add(self, contig, beg, end, virtual_start, virtual_end):
+        ref = self._ref(contig)
+        chunks = ref['bins'].setdefault(reg2bin(beg, end), [])
+        if chunks and chunks[-1][1] == virtual_start:
+            chunks[-1][1] = virtual_end
+        else:
+            chunks.append([virtual_start, virtual_end])
+
+        linear = ref['linear']
+        last_window = (end - 1) >> _LINEAR_SHIFT
+        if len(linear) <= last_window:
+            linear.extend([None] * (last_window + 1 - len(linear)))
+        for window in range(beg >> _LINEAR_SHIFT, last_window + 1):
+            if linear[window] is None:
+                linear[window] = virtual_start
+
+    def shifted(self, block_offset):
+        """Copy with every virtual offset moved by block_offset compressed bytes."""
+        shift = make_virtual_offset(block_offset, 0)
+        index = TabixIndex()
+        for contig, ref in self.refs.items():
+            index.refs[contig] = {
+                'bins': dict((bin_id, [[beg + shift, end + shift] for beg, end in chunks])
+                             for bin_id, chunks in ref['bins'].items()),
+                'linear': [None if offset is None else offset + shift
+                           for offset in ref['linear']]
+            }
+        return index
+
+    def extend(self, other):
+        """Add the records of an index built over a later part of the same file."""
+        for contig, other_ref in other.refs.items():
+            ref = self._ref(contig)
+            for bin_id, chunks in other_ref['bins'].items():
+                ref['bins'].setdefault(bin_id, []).extend(chunks)
+            linear = ref['linear']
+            if len(linear) < len(other_ref['linear']):
+                linear.extend([None] * (len(other_ref['linear']) - len(linear)))
+            for window, offset in enumerate(other_ref['linear']):
+                if linear[window] is None:
+                    linear[window] = offset
+
+    def chunks(self, contig, beg, end):
+        """Merged (start, end) virtual offset ranges to read for [beg, end)."""
+        ref = self.refs.get(contig)
+        if ref is None:
+            return []
+        min_offset = 0
+        window = beg >> _LINEAR_SHIFT
+        if window < len(ref['linear']):
+            min_offset = ref['linear'][window] or 0
+        candidates = []
+        for bin_id in reg2bins(beg, end):
+            for chunk_beg, chunk_end in ref['bins'].get(bin_id, []):
+                if chunk_end > min_offset:
+                    candidates.append([max(chunk_beg, min_offset), chunk_end])
+        candidates.sort()
+
+        merged = []
+        for chunk in candidates:
+            if merged and chunk[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], chunk[1])
+            else:
+                merged.append(chunk)
+        return merged
+
+    def write(self, filepath):
+        names = b''.join(contig.encode('ascii') + b'\x00' for contig in self.refs)
+        data = [TABIX_MAGIC,
+                struct.pack('<8i', len(self.refs), _TABIX_VCF_FORMAT, 1, 2, 0, ord('#'), 0,
+                            len(names)),
+                names]
+        for ref in self.refs.values():
+            data.append(struct.pack('<i', len(ref['bins'])))
+            for bin_id in sorted(ref['bins']):
+                chunks = ref['bins'][bin_id]
+                data.append(struct.pack('<Ii', bin_id, len(chunks)))
+                for beg, end in chunks:
+                    data.append(struct.pack('<QQ', beg, end))
+            linear = []
+            last = 0
+            for offset in ref['linear']:
+                last = last if offset is None else offset
+                linear.append(last)
+            data.append(struct.pack('<i', len(linear)))
+            data.append(struct.pack('<{}Q'.format(len(linear)), *linear))
+
+        writer = BgzfWriter(filepath)
+        writer.write(b''.join(data))
+        writer.close()
+
+    @classmethod
+    def read(cls, filepath):
+        with gzip.open(filepath, 'rb') as handle:
+            data = handle.read()
+        if data[:4] != TABIX_MAGIC:
+            raise ValueError('{} is not a tabix index'.format(filepath))
+        num_refs = struct.unpack('<i', data[4:8])[0]
+        names_length = struct.unpack('<i', data[32:36])[0]
+        names = data[36:36 + names_length].split(b'\x00')[:num_refs]
+        position = 36 + names_length
+
+        index = cls()
+        for name in names:
+            ref = index._ref(name.decode('ascii') if not isinstance(name, str) else name)
+            num_bins = struct.unpack('<i', data[position:position + 4])[0]
+            position += 4
+            for _ in range(num_bins):
+                bin_id, num_chunks = struct.unpack('<Ii', data[position:position + 8])
+                position += 8
+                chunks = struct.unpack('<{}Q'.format(2 * num_chunks),
+                                       data[position:position + 16 * num_chunks])
+                position += 16 * num_chunks
+                ref['bins'][bin_id] = [list(chunks[i:i + 2]) for i in range(0, len(chunks), 2)]
+            num_windows = struct.unpack('<i', data[position:position + 4])[0]
+            position += 4
+            ref['linear'] = list(struct.unpack('<{}Q'.format(num_windows),
+                                               data[position:position + 8 * num_windows]))
+            position += 8 * num_windows
+        return index
+
+
+def fetch(bgzf_source, index, contig, start, end):
+    """
+        Yield the fields of every record on contig overlapping the 1-based,
+        inclusive interval [start, end], reading only the indexed chunks.
+        bgzf_source is a path or a seekable binary file object.
+    """
+    beg = start - 1
+    reader = BgzfReader(bgzf_source)
+    try:
+        for chunk_beg, chunk_end in index.chunks(contig, beg, end):
+            reader.seek(chunk_beg)
+            while reader.tell() < chunk_end:
+                line = reader.readline()
+                if not line:
+                    break
+                if not isinstance(line, str):
+                    line = line.decode('latin-1')
+                fields = line.rstrip('\r\n').split('\t')
+                if fields[0] != contig:
+                    continue
+                record_beg, record_end = _record_span(fields)
+                if record_beg >= end:
+                    break
+                if record_end > beg:
+                    yield fields
+    finally:
+        reader.close()
+
+
+def _encode(line):
+    return line if isinstance(line, bytes) else line.encode('latin-1')
+
+
+class BgzfVcfWriter(RecordConsumer):
+    """
+        Re-writes the scanned VCF as BGZF and builds its tabix index in the
+        same pass.  Under ParallelVCFScanner every chunk writes a BGZF part
+        without an EOF marker; merge() concatenates the parts after the header
+        and shifts each part's index by its position in the final file.  The
+        result carries the SHA-1 of the BGZF file, taken as it is written.
+    """
+    name = 'bgzf'
+
+    def __init__(self, bgzf_filepath):
+        self.bgzf_filepath = bgzf_filepath
+        self.index_filepath = bgzf_filepath + '.tbi'
+
+    def _header_text(self, header):
+        lines = [header.fileformat] + header.meta + ['\t'.join(header.columns)]
+        return ''.join(line + '\n' for line in lines)
+
+    def start(self, header):
+        super(BgzfVcfWriter, self).start(header)
+        self.part_filepath = None
+        self.writer = BgzfWriter(self.bgzf_filepath)
+        self.writer.write(_encode(self._header_text(header)))
+        self.index = TabixIndex()
+
+    def start_chunk(self, header, chunk_index):
+        super(BgzfVcfWriter, self).start(header)
+        self.part_filepath = '{}.part_{:05d}'.format(self.bgzf_filepath, chunk_index)
+        self.writer = BgzfWriter(self.part_filepath, write_eof=False)
+        self.index = TabixIndex()
+
+    def consume(self, line_number, fields):
+        virtual_start = self.writer.tell()
+        self.writer.write(_encode('\t'.join(fields) + '\n'))
+        beg, end = _record_span(fields)
+        self.index.add(fields[0], beg, end, virtual_start, self.writer.tell())
+
+    def finish(self):
+        self.writer.close()
+        self.index.write(self.index_filepath)
+        return {'bgzf_filepath': self.bgzf_filepath, 'index_filepath': self.index_filepath,
+                'sha1': self.writer.digest.hexdigest()}
+
+    def partial(self):
+        self.writer.close()
+        return {'part_filepath': self.part_filepath, 'index': self.index, 'header': self.header}
+
+    def merge(self, partials):
+        header = partials[0][1]['header']
+        writer = BgzfWriter(self.bgzf_filepath, write_eof=False)
+        writer.write(_encode(self._header_text(header)))
+        writer.close()
+        digest = writer.digest
+
+        index = TabixIndex()
+        with open(self.bgzf_filepath, 'ab') as merged:
+            for line_offset, partial in partials:
+                index.extend(partial['index'].shifted(merged.tell()))
+                with open(partial['part_filepath'], 'rb') as part:
+                    while True:
+                        data = part.read(_COPY_SIZE)
+                        if not data:
+                            break
+                        merged.write(data)
+                        digest.update(data)
+                os.remove(partial['part_filepath'])
+            merged.write(EOF_BLOCK)
+            digest.update(EOF_BLOCK)
+        index.write(self.index_filepath)
+        return {'bgzf_filepath': self.bgzf_filepath, 'index_filepath': self.index_filepath,
+                'sha1': digest.hexdigest()}
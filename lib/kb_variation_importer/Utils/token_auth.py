@@ -0,0 +1,159 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+# Responses that mean the token itself is bad rather than the auth service
+# being unable to answer.
+_REJECTED_TOKEN_STATUSES = (401, 403)
+
+
+def get_token_cache_params(config):
+    """KBaseAuth keyword arguments from the auth-cache-* deploy config keys."""
+    params = {}
+    for key, name, cast in (('auth-cache-size', 'cache_size', int),
+                            ('auth-cache-ttl', 'cache_ttl', float),
+                            ('auth-cache-negative-ttl', 'negative_cache_ttl', float)):
+        if config and config.get(key):
+            params[name] = cast(config[key])
+    return params
+
+
+class TokenCache(object):
+    '''
+    A bounded, thread safe cache of token -> user lookups.  Valid tokens are
+    kept for ttl seconds and tokens the auth service rejected for
+    negative_ttl seconds; past maxsize the least recently added entries are
+    evicted.  Hit and miss counts are kept for monitoring.
+    '''
+
+    _MAX_TIME_SEC = 5 * 60  # 5 min
+    _NEGATIVE_TIME_SEC = 30
+
+    _lock = threading.RLock()
+
+    def __init__(self, maxsize=2000, ttl=_MAX_TIME_SEC, negative_ttl=_NEGATIVE_TIME_SEC):
+        self._cache = OrderedDict()
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _key(token):
+        if not isinstance(token, bytes):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).hexdigest()
+
+    def lookup(self, token):
+        '''
+        Returns (user, error): the cached user for a valid token, or the
+        cached error message for a rejected one.  (None, None) is a miss.
+        '''
+        key = self._key(token)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry:
+                user, error, expires = entry
+                if time.time() < expires:
+                    if error is None:
+                        self._hits += 1
+                    else:
+                        self._negative_hits += 1
+                    return user, error
+                del self._cache[key]
+            self._misses += 1
+        return None, None
+
+    def get_user(self, token):
+        return self.lookup(token)[0]
+
+    def _add(self, token, user, error, ttl):
+        key = self._key(token)
+        with self._lock:
+            self._cache.pop(key, None)
+            self._cache[key] = (user, error, time.time() + ttl)
+            while len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+                self._evictions += 1
+
+    def add_valid_token(self, token, user):
+        if not token:
+            raise ValueError('Must supply token')
+        if not user:
+            raise ValueError('Must supply user')
+        self._add(token, user, None, self._ttl)
+
+    def add_invalid_token(self, token, error):
+        if not token:
+            raise ValueError('Must supply token')
+        if self._negative_ttl > 0:
+            self._add(token, None, error, self._negative_ttl)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._cache),
+                'maxsize': self._maxsize,
+                'hits': self._hits,
+                'negative_hits': self._negative_hits,
+                'misses': self._misses,
+                'evictions': self._evictions
+            }
+
+
+class KBaseAuth(object):
+    '''
+    The generated authclient.KBaseAuth with a configurable TokenCache that
+    also remembers rejected tokens.
+    '''
+
+    _LOGIN_URL = 'https://kbase.us/services/auth/api/legacy/KBase/Sessions/Login'
+
+    def __init__(self, auth_url=None, cache_size=2000,
+                 cache_ttl=TokenCache._MAX_TIME_SEC,
+                 negative_cache_ttl=TokenCache._NEGATIVE_TIME_SEC):
+        '''
+        Constructor
+        '''
+        self._authurl = auth_url
+        if not self._authurl:
+            self._authurl = self._LOGIN_URL
+        self._cache = TokenCache(cache_size, cache_ttl, negative_cache_ttl)
+
+    def get_user(self, token):
+        if not token:
+            raise ValueError('Must supply token')
+        user, error = self._cache.lookup(token)
+        if user:
+            return user
+        if error:
+            raise ValueError(error)
+
+        d = {'token': token, 'fields': 'user_id'}
+        ret = requests.post(self._authurl, data=d)
+        if not ret.ok:
+            try:
+                err = ret.json()
+            except:
+                ret.raise_for_status()
+            message = ('Error connecting to auth service: {} {}\n{}'
+                       .format(ret.status_code, ret.reason,
+                               err['error']['message']))
+            # Only the auth service rejecting the token is cached, not its
+            # own failures or rate limiting.
+            if ret.status_code in _REJECTED_TOKEN_STATUSES:
+                self._cache.add_invalid_token(token, message)
+            raise ValueError(message)
+
+        user = ret.json()['user_id']
+        self._cache.add_valid_token(token, user)
+        return user
+
+    def cache_stats(self):
+        return self._cache.stats()
@@ -0,0 +1,77 @@
+import json
+import os
+
+import numpy as np
+
+MANIFEST_FILENAME = 'columns.json'
+
+
+def _column_filepath(directory, name):
+    return os.path.join(directory, name + '.npy')
+
+
+def write_stats_columns(stats, directory, num_samples=None):
+    """
+        Persist per-variant statistics as one .npy file per column plus a
+        columns.json manifest.  String columns become fixed-width arrays so
+        every column can be memory mapped.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    num_variants = len(stats['contig'])
+    columns = []
+    for name in sorted(stats):
+        values = np.asarray(stats[name])
+        if values.dtype == object:
+            values = values.astype(str)
+        np.save(_column_filepath(directory, name), values)
+        columns.append(name)
+
+    # Derived here so readers need not know the sample count.
+    if num_samples and 'missing' in stats:
+        np.save(_column_filepath(directory, 'missing_rate'),
+                np.asarray(stats['missing'], dtype=np.float64) / num_samples)
+        columns.append('missing_rate')
+
+    with open(os.path.join(directory, MANIFEST_FILENAME), 'w') as manifest:
+        json.dump({'num_variants': num_variants,
+                   'num_samples': num_samples,
+                   'columns': columns}, manifest)
+    return directory
+
+
+class VariantStats(object):
+    """
+        Read-only, dict-like view of a directory written by
+        write_stats_columns.  Columns are memory mapped on first access, so
+        only the columns a stage touches are paged in.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILENAME)) as manifest:
+            self.manifest = json.load(manifest)
+        self._columns = {}
+
+    def __getitem__(self, name):
+        if name not in self.manifest['columns']:
+            raise KeyError(name)
+        if name not in self._columns:
+            self._columns[name] = np.load(_column_filepath(self.directory, name), mmap_mode='r')
+        return self._columns[name]
+
+    def __contains__(self, name):
+        return name in self.manifest['columns']
+
+    def __iter__(self):
+        return iter(self.manifest['columns'])
+
+    @property
+    def num_variants(self):
+        return self.manifest['num_variants']
+
+    def keys(self):
+        return list(self.manifest['columns'])
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
@@ -1,7 +1,10 @@
 import csv
+import errno
+import functools
 import glob
 import gzip
 import json
+import multiprocessing
 import os
 import random
 import shutil
@@ -11,13 +14,35 @@ import time
 import uuid
 import zipfile
 from collections import Counter
+from multiprocessing.pool import ThreadPool
 
 import pandas as pd
 
 from DataFileUtil.DataFileUtilClient import DataFileUtil
-from GenomeAnnotationAPI.GenomeAnnotationAPIServiceClient import \
-    GenomeAnnotationAPI
 from KBaseReport.KBaseReportClient import KBaseReport
+from Workspace.WorkspaceClient import Workspace
+from kb_variation_importer.Utils.checkpoints import (StageCheckpoints, file_digest, params_digest,
+                                                     tree_digest, try_lock)
+from kb_variation_importer.Utils.disk_cache import DiskLRUCache, is_versioned_ref
+from kb_variation_importer.Utils.genotype_matrix import (GenotypeMatrix, PackedGenotypeWriter,
+                                                         subset_genotype_matrix)
+from kb_variation_importer.Utils.genotype_stats import (HWE_ZOOM_THRESHOLD,
+                                                        GenotypeBlockReader,
+                                                        GenotypeStatsAccumulator,
+                                                        hwe_zoom_rows,
+                                                        write_plink_frq,
+                                                        write_plink_hwe)
+from kb_variation_importer.Utils.histogram_plots import write_histogram_svg
+from kb_variation_importer.Utils.kinship import KinshipAccumulator, matrix_kinship
+from kb_variation_importer.Utils.parallel_scanner import ParallelVCFScanner
+from kb_variation_importer.Utils.qc_filter import QCFilterWriter, qc_thresholds
+from kb_variation_importer.Utils.service_resolver import ServiceResolver
+from kb_variation_importer.Utils.stage_executor import StageExecutor
+from kb_variation_importer.Utils.tabix import BgzfVcfWriter
+from kb_variation_importer.Utils.variant_stats import VariantStats, write_stats_columns
+from kb_variation_importer.Utils.vcf_scanner import (HeaderCollector,
+                                                     RecordCounter,
+                                                     StructuralChecker)
 
 
 class InvalidVCFException(Exception):
@@ -34,6 +59,59 @@ def log(message, prefix_newline=False):
     print(('\n' if prefix_newline else '') + '{0:.2f}'.format(time.time()) + ': ' + str(message))
 
 
+def scan_consumers(genotype_matrix_dir, bgzf_filepath=None, qc_dir=None, thresholds=None):
+    """Consumers run over every imported VCF; module level so worker processes can rebuild them."""
+    block_consumers = [GenotypeStatsAccumulator(), PackedGenotypeWriter(genotype_matrix_dir)]
+    if thresholds:
+        # Kinship is computed after QC, from the filtered genotype matrix.
+        block_consumers.append(QCFilterWriter(qc_dir, thresholds))
+    else:
+        # Chunks' kinship sums are handed over on disk beside the genotype matrix.
+        kinship_dir = os.path.join(os.path.dirname(genotype_matrix_dir), 'kinship_parts')
+        block_consumers.append(KinshipAccumulator(partial_dir=kinship_dir))
+    genotype_reader = GenotypeBlockReader(block_consumers)
+    consumers = [HeaderCollector(), RecordCounter(), StructuralChecker(), genotype_reader]
+    if bgzf_filepath:
+        consumers.append(BgzfVcfWriter(bgzf_filepath))
+    return consumers
+
+
+def run_command_chain(chain):
+    """
+        Run (error message, command, cwd) steps in order, logging the message
+        for any step that fails.  String commands go through the shell.
+        Returns True if every step succeeded.
+    """
+    succeeded = True
+    for error_message, command, cwd in chain:
+        log("Running: {}".format(command))
+        try:
+            p = subprocess.Popen(command,
+                                 cwd=cwd,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT,
+                                 shell=not isinstance(command, list))
+            output = p.communicate()[0]
+        except Exception as e:
+            log("{} {}".format(error_message, e))
+            succeeded = False
+            continue
+        if p.returncode != 0:
+            log("{} {}".format(error_message, output))
+            succeeded = False
+    return succeeded
+
+
+def run_command_chains(chains, max_processes):
+    """Run independent command chains concurrently, at most max_processes at a time."""
+    pool = ThreadPool(max(1, min(max_processes, len(chains))))
+    try:
+        return pool.map(run_command_chain, chains)
+    finally:
+        pool.close()
+        pool.join()
+
+
 template_dir = "/kb/module/lib/kb_variation_importer/Utils/invalid_report_template.html"
 # TODO: All manner of input validation checks.
 
@@ -43,14 +121,80 @@ class variation_importer_utils:
     def __init__(self, utility_params):
         self.params = utility_params
         # self.scratch = utility_params['scratch']
-        self.scratch = os.path.join(
-            utility_params['scratch'], 'variation_importer_'+str(uuid.uuid4()))
-        os.mkdir(self.scratch)
+        self._set_scratch(os.path.join(
+            utility_params['scratch'], 'variation_importer_'+str(uuid.uuid4())))
         self.service_wiz_url = utility_params['srv-wiz-url']
         self.callback_url = utility_params['callback_url']
+        # 'false' turns off resuming a retried import from its stage checkpoints.
+        self.resume_imports = str(utility_params.get('resume-imports') or 'true').lower() in (
+            'true', '1', 'yes')
+        self.scan_processes = int(utility_params.get('scan-processes') or
+                                  multiprocessing.cpu_count())
+        self.stage_workers = int(utility_params.get('stage-workers') or 4)
+        self.plot_processes = int(utility_params.get('plot-processes') or 2)
+        # 'numpy' draws the histograms in-process; 'R' uses the Rscript plots.
+        self.plot_backend = utility_params.get('plot-backend') or 'numpy'
+        self.hwe_zoom_threshold = float(utility_params.get('hwe-zoom-threshold') or
+                                        HWE_ZOOM_THRESHOLD)
+
+        # Shared by every import on the host, so it lives beside the per-run scratch dir.
+        self.assembly_cache = DiskLRUCache(
+            utility_params.get('assembly-cache-dir') or
+            os.path.join(utility_params['scratch'], 'cache', 'assembly_contigs'),
+            int(utility_params.get('assembly-cache-bytes') or 256 << 20))
+        self.genome_assembly_cache = DiskLRUCache(
+            os.path.join(os.path.dirname(self.assembly_cache.cache_dir), 'genome_assembly'))
+        # Content hash -> shock node of files uploaded from this host.
+        self.shock_node_cache = DiskLRUCache(
+            os.path.join(os.path.dirname(self.assembly_cache.cache_dir), 'shock_nodes'))
 
         self.dfu = DataFileUtil(self.callback_url)
         self.kbr = KBaseReport(self.callback_url, token=utility_params['token'])
+        self.ws = Workspace(utility_params['workspace-url'], token=utility_params['token'])
+        self.services = ServiceResolver(self.service_wiz_url, utility_params['token'])
+
+    def _set_scratch(self, scratch):
+        if not os.path.isdir(scratch):
+            os.mkdir(scratch)
+        self.scratch = scratch
+        self.genotype_matrix_dir = os.path.join(self.scratch, 'genotype_matrix')
+        self.qc_genotype_matrix_dir = os.path.join(self.scratch, 'genotype_matrix_qc')
+        self.bgzf_filepath = os.path.join(self.scratch, 'variations.vcf.gz')
+        self.qc_dir = os.path.join(self.scratch, 'qc')
+        self.checkpoint_dir = os.path.join(self.scratch, 'checkpoints')
+
+    def _resume_checkpoints(self, params):
+        """
+            Move this import into a scratch directory named after a hash of
+            its parameters and the caller's token, so a retry of the same
+            import finds the checkpoints of the stages that already finished.
+
+            The staged files are keyed by name: a file re-uploaded to the
+            staging area under the same name is only picked up once the
+            earlier download is gone from scratch.
+
+            The directory is locked for the rest of the import, so a second
+            live import with the same parameters, e.g. a client retrying a
+            background job that is still running, is refused rather than
+            overwriting its outputs.
+        """
+        run_key = params_digest([self.params['token'], dict(
+            (key, value) for key, value in params.items() if key != 'run_in_background')])
+        run_dir = os.path.join(self.params['scratch'], 'variation_importer_' + run_key)
+        try:
+            os.mkdir(run_dir)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        self.run_lock = try_lock(os.path.join(run_dir, 'import.lock'))
+        if self.run_lock is None:
+            raise ValueError('An import of {} with the same parameters is already running'.format(
+                params.get('variation_object_name')))
+        previous = self.scratch
+        self._set_scratch(run_dir)
+        if previous != self.scratch and not os.listdir(previous):
+            os.rmdir(previous)
+        return StageCheckpoints(self.checkpoint_dir, run_key)
 
     def _create_fake_location_data(self):
         location = {
@@ -77,17 +221,6 @@ class variation_importer_utils:
             population['strains'].append(self._create_fake_straininfo(genome))
         return population
 
-    def _create_fake_kinship_matrix(self):
-        kinship = {
-            'row_ids': ['one', 'two'],
-            'col_ids': ['one', 'two'],
-            'kinship_coefficients': [
-                [0.1, 0.1],
-                [0.1, 0.1]
-            ]
-        }
-        return kinship
-
     def _compare(self, s, t):
         return Counter(s) == Counter(t)
 
@@ -143,8 +276,7 @@ class variation_importer_utils:
         return population
 
     def _validate_vcf(self, vcf_filepath, vcf_version):
-        validation_output_dir = os.path.join(self.scratch, 'validation_' + str(uuid.uuid4()))
-        os.mkdir(validation_output_dir)
+        validation_output_dir = self._fresh_dir('validation')
         ## TODO: Make this choice more robust.  
         ## Attempt conversion to 4.1?
         if vcf_version >= 4.1:
@@ -189,59 +321,102 @@ class variation_importer_utils:
 
         return validation_output_filepath, p.returncode
 
+    def _fresh_dir(self, name):
+        """Empty directory under scratch; a retried stage replaces its earlier output."""
+        path = os.path.join(self.scratch, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.mkdir(path)
+        return path
+
     # Retrieve contigs from assembly file.
     def _get_contigs_from_assembly(self, assembly_ref, type='Assembly'):
+        """
+            Returns a dict of contig ID -> contig length.  Versioned refs are
+            immutable, so their contigs are cached on disk across imports.
+        """
+        cacheable = is_versioned_ref(assembly_ref)
+        if cacheable:
+            contigs = self.assembly_cache.get(assembly_ref)
+            if contigs is not None:
+                log("Using cached contigs for Assembly {}".format(assembly_ref))
+                return contigs
+
+        # Only the contig IDs and lengths are needed; skip MD5s, GC content and
+        # descriptions, which dominate the object for highly fragmented assemblies.
         try:
-            assembly_data = self.dfu.get_objects(
-                {'object_refs': [assembly_ref]}
-            )['data'][0]['data']
+            assembly_data = self.ws.get_objects2({
+                'objects': [{
+                    'ref': assembly_ref,
+                    'included': ['contigs/*/contig_id', 'contigs/*/length']
+                }]
+            })['data'][0]['data']
         except Exception as e:
             print("Unable to retrieve Assembly reference: {}".format(assembly_ref))
             raise ValueError(e)
-        raw_contigs = assembly_data['contigs']
-        contigs = {}
-
-        # Contigs returns just a dict with key and contig_id
-        # Why did I have this here?  Is it necessary?
-        for key, value in raw_contigs.iteritems():
-            contigs[str(key)] = value['contig_id']
-        return raw_contigs
-
-    def _get_version_contigs_genotypes(self, vcf_filepath):
-        contigs = []
-        genotypes = []
-        version = ''
-        with(gzip.open if vcf_filepath.endswith('.gz') else open)(vcf_filepath, 'rt') as vcf:
-            line = vcf.readline()
-            tokens = line.split('=')
-
-            if not(tokens[0].startswith('##fileformat')):
-                log("Invalid VCF.  ##fileformat line in meta is improperly formatted.")
-                raise ValueError("Invalid VCF.  ##fileformat line in meta is improperly formatted.")
-            version = float(tokens[1][-4:].rstrip())
-            log("VCF version: {}".format(version))
-            for line in vcf:
-                if line.startswith("#CHROM"):
-                    log("#CHROM encountered, exiting loop.")
-                    genotypes = line.split()[9:]
-                    log("Number Genotypes in vcf: {}".format(len(genotypes)))
-                    break
-                tokens = line.split("=")
-
-                if tokens[0].startswith('##contig'):
-                    contigs.append(tokens[2][:-2])
-        return version, contigs, genotypes
+
+        contigs = dict((value['contig_id'], value.get('length'))
+                       for value in assembly_data['contigs'].values())
+        if cacheable:
+            self.assembly_cache.put(assembly_ref, contigs)
+        return contigs
+
+    def _scan_vcf(self, vcf_filepath, thresholds=None, progress=None):
+        """
+            Single streaming pass over the VCF collecting the header, record
+            counts, structural errors and per-site allele frequency/HWE stats,
+            the kinship matrix, and writing the packed genotype matrix and a
+            BGZF copy of the VCF with its tabix index.  With QC thresholds a
+            filtered BGZF copy is written as well.  progress, if given, is an
+            ImportProgress that is kept up to date with the bytes and records
+            scanned.
+        """
+        if progress:
+            progress.set_total_bytes(os.path.getsize(vcf_filepath))
+        # Output left by an earlier attempt of a resumed import.
+        for output_dir in (self.genotype_matrix_dir, self.qc_dir):
+            if os.path.isdir(output_dir):
+                shutil.rmtree(output_dir)
+        scanner = ParallelVCFScanner(vcf_filepath,
+                                     functools.partial(scan_consumers, self.genotype_matrix_dir,
+                                                       self.bgzf_filepath, self.qc_dir,
+                                                       thresholds),
+                                     processes=self.scan_processes,
+                                     progress=progress.scan_progress if progress else None)
+        try:
+            scan_results = scanner.scan()
+        except ValueError as e:
+            log(str(e))
+            raise
+        header = scan_results['header']
+        log("VCF version: {}".format(header['version']))
+        log("Number Genotypes in vcf: {}".format(len(header['genotypes'])))
+        log("Number of variants in vcf: {}".format(scan_results['counts']['num_variants']))
+        qc = scan_results['genotypes'].get('qc')
+        if qc:
+            log("QC removed {} of {} sites and {} samples".format(
+                qc['num_dropped_sites'], qc['num_sites'], len(qc['dropped_samples'])))
+        return scan_results
 
     # Arabidopsis ref: 18590/2/8
     def _get_assembly_ref_from_genome(self, genome_ref):
-        ga = GenomeAnnotationAPI(self.service_wiz_url)
+        # A versioned Genome always points at the same Assembly.
+        cacheable = is_versioned_ref(genome_ref)
+        if cacheable:
+            assembly_object_ref = self.genome_assembly_cache.get(genome_ref)
+            if assembly_object_ref:
+                return assembly_object_ref
+
         inputs_get_assembly = {'ref': genome_ref}
         try:
-            assembly_object_ref = ga.get_assembly(inputs_get_assembly)
+            assembly_object_ref = self.services.call_method('GenomeAnnotationAPI.get_assembly',
+                                                            [inputs_get_assembly])
         except Exception as e:
             print("Unable to retrieve Assembly reference ID from Genome ref_id: {}".format(genome_ref))
             raise Exception(e)
 
+        if cacheable:
+            self.genome_assembly_cache.put(genome_ref, assembly_object_ref)
         return assembly_object_ref
 
     def _generate_output_file_list(self):
@@ -249,11 +424,16 @@ class variation_importer_utils:
         output_files = list()
 
         result_file = os.path.join(self.scratch, 'variation_importer_results.zip')
-        excluded_extensions = ['.zip', '.vcf', '.vcf.gz', '.html', '.DS_Store']
+        excluded_extensions = ['.zip', '.vcf', '.vcf.gz', '.tbi', '.html', '.DS_Store']
         with zipfile.ZipFile(result_file, 'w',
                              zipfile.ZIP_DEFLATED,
                              allowZip64=True) as zip_file:
             for root, dirs, files in os.walk(self.scratch):
+                # The genotype matrix is uploaded on its own in _save_variation_to_ws.
+                if root == self.scratch:
+                    for matrix_dir in ('genotype_matrix', 'genotype_matrix_qc', 'checkpoints'):
+                        if matrix_dir in dirs:
+                            dirs.remove(matrix_dir)
                 for file in files:
                     if not (file.endswith(tuple(excluded_extensions))
                             # file.endswith('.zip') or
@@ -272,11 +452,7 @@ class variation_importer_utils:
 
         return output_files
 
-    def _generate_report(self, params, variation_results,
-                         variation_file_path):
-
-        stats_results = self._generate_variation_stats(None,
-                                                       variation_file_path)
+    def _generate_report(self, params, variation_results, stats_results):
 
         html_report = self._generate_html_report(variation_results, stats_results)
 
@@ -315,8 +491,7 @@ class variation_importer_utils:
         print("Validation output filepath passed to html report: {}".format(
             variation_results['validation_output_filepath']))
         try:
-            report_dir = os.path.join(self.scratch, 'html')
-            os.mkdir(report_dir)
+            report_dir = self._fresh_dir('html')
 
             with open(template_dir, 'r') as html, open(variation_results['validation_output_filepath'], 'r') as validation:
 
@@ -346,6 +521,28 @@ class variation_importer_utils:
                         validation_content += '<li>{}</li>'.format(contig)
                     validation_content += '</ul>'
 
+                if variation_results.get('structural_errors'):
+                    validation_content += '<p><h4>Errors found while scanning records:</h4></p>'
+                    validation_content += '<ul>'
+                    for error in variation_results.get('structural_errors'):
+                        validation_content += '<li>Line {}: {}</li>'.format(
+                            error['line'], error['message'])
+                    validation_content += '</ul>'
+
+                qc = variation_results.get('qc')
+                if qc:
+                    validation_content += '<p><h4>Quality control:</h4></p>'
+                    validation_content += '<ul>'
+                    validation_content += '<li>Thresholds: {}</li>'.format(', '.join(
+                        '{} {:g}'.format(flag, value)
+                        for flag, value in sorted(qc['thresholds'].items())))
+                    validation_content += '<li>{} of {} sites removed, listed in {}</li>'.format(
+                        qc['num_dropped_sites'], qc['num_sites'],
+                        os.path.basename(qc['dropped_sites_filepath']))
+                    validation_content += '<li>{} samples removed: {}</li>'.format(
+                        len(qc['dropped_samples']), ', '.join(qc['dropped_samples']))
+                    validation_content += '</ul>'
+
                 # if not variation_results.get('contigs'):
                 #     validation_content += '<h4>No contig information was included in the VCF file header!  Please recreate the VCF file with each contig described in the meta description </h4>'
                 report = report.replace('Validation_Results', validation_content)
@@ -361,7 +558,7 @@ class variation_importer_utils:
                                         '''
                     summary_results += '<tr>'
                     summary_results += '<td>{}</td><td>{}</td>'.format(
-                        'To be added later', variation_results['num_genotypes'])
+                        variation_results['num_variants'], variation_results['num_genotypes'])
                     summary_results += '</tr></table>'
                     report = report.replace('Variation_Statistics', summary_results)
 
@@ -370,12 +567,15 @@ class variation_importer_utils:
                 if(stats_output.get('stats_img_dir')):
                     image_dir = stats_output.get('stats_img_dir')
 
-                    for file in glob.glob(os.path.join(image_dir, '*.png')):
+                    images = (glob.glob(os.path.join(image_dir, '*.png')) +
+                              glob.glob(os.path.join(image_dir, '*.svg')))
+                    for file in images:
                         shutil.move(file, report_dir)
 
-                    for image in glob.glob(report_dir + "/*.png"):
+                    for image in sorted(glob.glob(report_dir + "/*.png") +
+                                        glob.glob(report_dir + "/*.svg")):
                         image = image.replace(report_dir + '/', '')
-                        caption = image.replace(report_dir + '/', '').replace('.png', '')
+                        caption = os.path.splitext(image)[0]
                         image_content += '<p style="text-align:center"><img align="center" src="{}" ' \
                             '></a><a target="_blank"><br>' \
                             '<p align="center">{}</p></p>'.format(image, caption)
@@ -410,167 +610,169 @@ class variation_importer_utils:
 
         return html_report
 
-    def _generate_variation_stats(self, cmd_line_args, variation_filepath):
+    def _generate_variation_stats(self, variation_stats, variation_filepath, num_samples,
+                                  export_text=False):
         """
-            :param commments go here
+            :param variation_stats: per-site statistics from GenotypeStatsAccumulator
+            :param variation_filepath: VCF the statistics were computed from
+            :param num_samples: number of samples in the VCF
+            :param export_text: also write plink style .frq/.hwe text tables
         """
-        file_output_directory = os.path.join(self.scratch, 'stats_' + str(uuid.uuid4()))
-        os.mkdir(file_output_directory)
-
-        image_output_directory = os.path.join(self.scratch, 'stats_images_' + str(uuid.uuid4()))
-        os.mkdir(image_output_directory)
-
-        # TODO: Validate user supplied params and build PLINK command
-        plink_cmd = ["plink"]
-        plink_cmd.append('--vcf')
-        plink_cmd.append(variation_filepath)
-        if(cmd_line_args is not None):
-            cmds = cmd_line_args.split(';')
-            for cmd in cmds:
-                plink_cmd.append(cmd)
-        # plink_cmd.append('--recode12')
-        # plink_cmd.append('transpose')
-        # plink_cmd.append('--output-missing-genotype')
-        # plink_cmd.append("0")
-        plink_cmd.append('--freq')
-        plink_cmd.append('--hardy')
-        # plink_cmd.append('gz')
-        plink_cmd.append('--out')
-        plink_cmd.append(variation_filepath)
-
-        print("PLINK arguments: {}".format(plink_cmd))
-
-        plink_output = {
-            "errors": [],
-            "warnings": []
-            # "notes" : []
-        }
-        p = subprocess.Popen(plink_cmd,
-                             cwd=file_output_directory,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.STDOUT,
-                             shell=False)
-        while True:
-            line = p.stdout.readline()
-            if not line:
-                break
-            # log(line)
-            tokens = line.split(':')
-            if(tokens[0] == 'Error'):
-                plink_output['errors'].append(line)
-                raise ValueError('PLINK 1.9 error: ' + line)
-            elif(tokens[0] == 'Warning'):
-                plink_output['warnings'].append(line)
-                print(line)
-            # elif(tokens[0] == 'Note'):
-            #     plink_output['notes'].append(line)
-            #     print(line)
-
-        p.stdout.close()
-        p.wait()
-        plink_output_filepath = os.path.join(file_output_directory, 'plink_cli_output.txt')
-        with open(plink_output_filepath, 'w') as plink:
-            for data in plink_output:
-                plink.write("{}: {}\n".format(data, plink_output[data]))
+        file_output_directory = self._fresh_dir('stats')
+        image_output_directory = self._fresh_dir('stats_images')
 
-        plink_output_files = [f for f in os.listdir(self.scratch) if f.startswith(
-            os.path.basename(variation_filepath) + '.')]
-
-        for file in plink_output_files:
-            shutil.move(os.path.join(self.scratch, file), file_output_directory)
-
-        if p.returncode != 0:
-            log("PLINK encountered an error during runtime.  Please see log file.")
+        # Later stages read the memory mapped columns, not the in-memory copy.
+        columns_directory = write_stats_columns(
+            variation_stats, os.path.join(file_output_directory, 'variant_stats'), num_samples)
+        variation_stats = VariantStats(columns_directory)
+        log("Variant statistics columns: {}".format(columns_directory))
 
+        # Same file names and layout plink --freq --hardy --out produced.
         variation_filename = os.path.basename(variation_filepath)
         base_filepath = os.path.join(file_output_directory, variation_filename)
         freq_filepath = base_filepath + '.frq'
-
-        maf_script_filepath = '/kb/module/lib/kb_variation_importer/Utils/MAF_check.R'
-        hwe_script_filepath = '/kb/module/lib/kb_variation_importer/Utils/HWE.R'
-        log("Frequency filepath: {}".format(freq_filepath))
-        # TODO: make function to do Rscript calls.
-        # generate visualizations and store in directory
-        maf_command = ['Rscript']
-        maf_command.append('--no-save')
-        maf_command.append('--vanilla')
-        maf_command.append(maf_script_filepath)
-        maf_command.append(freq_filepath)
-        maf_command.append("Minor Allele Frequencies.png")
-        print("MAF command: {}".format(maf_command))
-        r = subprocess.Popen(maf_command,
-                             cwd=image_output_directory,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.STDOUT,
-                             shell=False)
-        r.wait()
-
-        if r.returncode != 0:
-            log("Error creating MAF histogram in R")
-
         hwe_filepath = base_filepath + '.hwe'
-        zoom_filepath = hwe_filepath + '.zoom'
-        log("HWE filepath: {}".format(hwe_filepath))
-        zoom_command = '''awk '{{ if ($9 < 0.00001) print $0 }}' {} > {}'''.format(
-            hwe_filepath, zoom_filepath)
-        log("Zoom cmd: {}".format(zoom_command))
-
-        try:
-            z = subprocess.Popen(zoom_command,
-                                 cwd=file_output_directory,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.STDOUT,
-                                 shell=True)
-            z.wait()
-
-            if z.returncode != 0:
-                log("Error creating HWE zoom file.")
-
-        except Exception as e:
-            log("Error creating zoom HWE file: {}".format(e))
-
-        hwe_command = ['Rscript']
-        hwe_command.append('--no-save')
-        hwe_command.append('--vanilla')
-        hwe_command.append(hwe_script_filepath)
-        hwe_command.append(hwe_filepath)
-        hwe_command.append("Hardy-Weinberg Equilibrium.png")
-        hwe_command.append(zoom_filepath)
-        hwe_command.append("Hardy-Weinberg Equilibrium Zoom.png")
-        print("MAF command: {}".format(hwe_command))
-        h = subprocess.Popen(hwe_command,
-                             cwd=image_output_directory,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.STDOUT,
-                             shell=False)
-        h.wait()
-
-        if h.returncode != 0:
-            log("Error generating HWE Zoom plot")
+        if export_text:
+            self._write_text_stats(variation_stats, freq_filepath, hwe_filepath)
+
+        plotted = False
+        if self.plot_backend == 'numpy':
+            try:
+                self._plot_variation_stats(variation_stats, image_output_directory)
+                plotted = True
+            except Exception as e:
+                log("Error plotting statistics with NumPy, falling back to R: {}".format(e))
+
+        if not plotted:
+            if not export_text:
+                self._write_text_stats(variation_stats, freq_filepath, hwe_filepath)
+            self._plot_variation_stats_r(variation_stats, freq_filepath, hwe_filepath,
+                                         image_output_directory)
 
         return {'stats_file_dir': file_output_directory,
                 'stats_img_dir': image_output_directory}
 
-    def _save_variation_to_ws(self, workspace_name, variation_object_name, variation_obj, variation_filepath, kinship_matrix):
+    def _write_text_stats(self, variation_stats, freq_filepath, hwe_filepath):
+        write_plink_frq(variation_stats, freq_filepath)
+        write_plink_hwe(variation_stats, hwe_filepath)
+        log("Frequency filepath: {}".format(freq_filepath))
+        log("HWE filepath: {}".format(hwe_filepath))
+
+    def _plot_variation_stats(self, variation_stats, image_output_directory):
+        """Histograms straight from the in-memory statistics, written as SVG."""
+        write_histogram_svg(variation_stats['maf'],
+                            os.path.join(image_output_directory, 'Minor Allele Frequencies.svg'),
+                            'Minor Allele Frequencies', 'MAF')
+        hwe_p = variation_stats['hwe_p']
+        write_histogram_svg(hwe_p,
+                            os.path.join(image_output_directory, 'Hardy-Weinberg Equilibrium.svg'),
+                            'Hardy-Weinberg Equilibrium', 'HWE')
+        write_histogram_svg(hwe_p[hwe_zoom_rows(variation_stats, self.hwe_zoom_threshold)],
+                            os.path.join(image_output_directory,
+                                         'Hardy-Weinberg Equilibrium Zoom.svg'),
+                            'Hardy-Weinberg Equilibrium Zoom', 'HWE_ZOOM')
+
+    def _plot_variation_stats_r(self, variation_stats, freq_filepath, hwe_filepath,
+                                image_output_directory):
+        # HWE.R reads the low p-value subset from its own file.
+        zoom_filepath = hwe_filepath + '.zoom'
+        write_plink_hwe(variation_stats, zoom_filepath,
+                        hwe_zoom_rows(variation_stats, self.hwe_zoom_threshold))
+        maf_script_filepath = '/kb/module/lib/kb_variation_importer/Utils/MAF_check.R'
+        hwe_script_filepath = '/kb/module/lib/kb_variation_importer/Utils/HWE.R'
+        # generate visualizations and store in directory
+        maf_command = ['Rscript', '--no-save', '--vanilla', maf_script_filepath,
+                       freq_filepath, "Minor Allele Frequencies.png"]
+        hwe_command = ['Rscript', '--no-save', '--vanilla', hwe_script_filepath,
+                       hwe_filepath, "Hardy-Weinberg Equilibrium.png",
+                       zoom_filepath, "Hardy-Weinberg Equilibrium Zoom.png"]
+
+        # The MAF and HWE plots are independent; run them side by side so
+        # their R start-up costs overlap.
+        run_command_chains([
+            [('Error creating MAF histogram in R', maf_command, image_output_directory)],
+            [('Error generating HWE Zoom plot', hwe_command, image_output_directory)]
+        ], self.plot_processes)
+
+    def _file_to_shock(self, upload_params, sha1=None):
+        """
+            file_to_shock, except that a file or directory with the same
+            content and packing as an earlier upload from this host reuses
+            that upload's node through own_shock_node, which hands back the
+            node itself if the caller owns it and a copy otherwise.  sha1 is
+            the content hash if the caller already has it.  A node that can no
+            longer be reused is uploaded again.
+        """
+        sha1 = sha1 or tree_digest(upload_params['file_path'])
+        key = '{}:{}:{}'.format(self.params.get('shock-url') or '',
+                                upload_params.get('pack') or '', sha1)
+        node = self.shock_node_cache.get(key)
+        if node:
+            try:
+                owned = self.dfu.own_shock_node({
+                    'shock_id': node['shock_id'],
+                    'make_handle': upload_params.get('make_handle', 0)})
+                log("Reusing shock node {} for {}".format(owned['shock_id'],
+                                                          upload_params['file_path']))
+                return owned
+            except Exception as e:
+                log("Unable to reuse shock node {}, uploading again: {}".format(
+                    node['shock_id'], e))
+        shock_return = self.dfu.file_to_shock(upload_params)
+        self.shock_node_cache.put(key, {'shock_id': shock_return['shock_id']})
+        return shock_return
+
+    def _save_variation_to_ws(self, workspace_name, variation_object_name, variation_obj,
+                              variation_filepath, kinship_matrix, genotype_matrix_dir=None,
+                              vcf_index_filepath=None, variation_sha1=None):
         ws_id = self.dfu.ws_name_to_id(workspace_name)
+        vcf_upload_params = {
+            'file_path': variation_filepath,
+            'make_handle': 1}
+        # An indexed VCF is already BGZF compressed; gzipping it again would
+        # break the index's virtual offsets.
+        if not vcf_index_filepath:
+            vcf_upload_params['pack'] = 'gzip'
         try:
-            vcf_shock_return = self.dfu.file_to_shock({
-                'file_path': variation_filepath,
-                'make_handle': 1,
-                'pack': 'gzip'})
+            vcf_shock_return = self._file_to_shock(vcf_upload_params, variation_sha1)
         except Exception as e:
             print("Error uploading file to shock!")
             raise ValueError(e)
 
         variation_obj['variation_file_reference'] = vcf_shock_return.get('shock_id')
 
+        # The Variations type has no field for auxiliary files, so their shock
+        # nodes are recorded in the object's user metadata.
+        object_meta = {}
+        if genotype_matrix_dir:
+            try:
+                matrix_shock_return = self._file_to_shock({
+                    'file_path': genotype_matrix_dir,
+                    'make_handle': 1,
+                    'pack': 'zip'})
+            except Exception as e:
+                print("Error uploading genotype matrix to shock!")
+                raise ValueError(e)
+            object_meta['genotype_matrix_shock_id'] = matrix_shock_return.get('shock_id')
+
+        if vcf_index_filepath:
+            try:
+                index_shock_return = self._file_to_shock({
+                    'file_path': vcf_index_filepath,
+                    'make_handle': 1})
+            except Exception as e:
+                print("Error uploading VCF index to shock!")
+                raise ValueError(e)
+            object_meta['vcf_index_shock_id'] = index_shock_return.get('shock_id')
+
         info = self.dfu.save_objects(
             {
                 'id': ws_id,
                 'objects': [{
                     'type': 'KBaseGwasData.Variations',
                     'data': variation_obj,
-                    'name': variation_object_name
+                    'name': variation_object_name,
+                    'meta': object_meta
                 }]
             })[0]
 
@@ -578,14 +780,7 @@ class variation_importer_utils:
         log("Variation reference created: {}".format(variation_ref))
         return variation_ref
 
-    def validate_vcf(self, params):
-        """
-            :param params: dict containing all input parameters.
-        """
-
-        returnVal = {}
-        valid_vcf_file = True
-
+    def _download_vcf(self, params):
         try:
             # vcf_filepath = self.pretend_download_staging_file(
             #     params['variation_file_subdir_path'], self.scratch).get('copy_file_path')
@@ -593,13 +788,15 @@ class variation_importer_utils:
             vcf_filepath = self.dfu.download_staging_file(
                 {'staging_file_subdir_path' : params['variation_file_subdir_path']}).get('copy_file_path')
 
-            location_filepath = self.pretend_download_staging_file(
-                params['variation_attributes_subdir_path'], self.scratch).get('copy_file_path')
-
         except Exception as e:
             raise Exception("Unable to download {} from staging area.".format(
                 params['variation_file_subdir_path']))
 
+        # Check file size
+        log("{} file size: {}".format(vcf_filepath, os.path.getsize(vcf_filepath)))
+        return vcf_filepath
+
+    def _download_locations(self, params):
         try:
             location_filepath = self.pretend_download_staging_file(
                 params['variation_attributes_subdir_path'], self.scratch).get('copy_file_path')
@@ -607,12 +804,11 @@ class variation_importer_utils:
         except Exception as e:
             raise Exception("Unable to download {} from staging area.".format(
                 params['variation_attributes_subdir_path']))
+        return location_filepath
 
-        # Check file size
-        log("{} file size: {}".format(vcf_filepath, os.path.getsize(vcf_filepath)))
-        log('\nValidating {}...'.format(vcf_filepath))
-
-        vcf_version, vcf_contigs, vcf_genotypes = self._get_version_contigs_genotypes(vcf_filepath)
+    def _check_vcf_header(self, vcf_filepath, scan_results):
+        vcf_version = scan_results['header']['version']
+        vcf_contigs = scan_results['header']['contigs']
 
         if not vcf_contigs:
             log("No contig data in {} header.".format(vcf_filepath))
@@ -622,28 +818,13 @@ class variation_importer_utils:
             log("VCF file is version {}.  Must be at least version 4.1".format(vcf_version))
             raise ValueError(
                 "VCF file is version {}.  Must be at least version 4.1".format(vcf_version))
+        return scan_results['header']
 
-        # Generate population object
-        population = self._generate_population(location_filepath, vcf_genotypes)
-
-        # Retrieve Assembly object reference associated with genome.
-        try:
-            assembly_ref = self._get_assembly_ref_from_genome(params['genome_ref'])
-        except Exception as e:
-            print("Unable to retrieve {}".format(params['genome_ref']))
-            raise ValueError(e)
-
-        # Retrieve contig list from Assembly object.
-        try:
-            assembly_contigs = self._get_contigs_from_assembly(assembly_ref)
-        except Exception as e:
-            print("Unable to retrieve contigs from Assembly ref: {}".format(assembly_ref))
-            raise ValueError(e)
-
+    def _find_invalid_contigs(self, vcf_filepath, header, assembly_contigs):
         log("Length of assembly contigs: {}".format(len(assembly_contigs)))
         # Compare contig IDs from VCF to those in the Assembly object
         invalid_contigs = []
-        for contig in vcf_contigs:
+        for contig in header['contigs']:
             if contig not in assembly_contigs.keys():
                 invalid_contigs.append(contig)
 
@@ -655,46 +836,160 @@ class variation_importer_utils:
             with open(valid_contig_filepath, 'w') as icf:
                 for contig in assembly_contigs:
                     icf.write(contig + '\n')
-            valid_vcf_file = False
-
-        validation_output_filepath, returncode = self._validate_vcf(vcf_filepath, vcf_version)
-
-        if returncode != 0:
-            valid_vcf_file = False
-
-        kinship_matrix = self._create_fake_kinship_matrix()
-
-        variation_obj_ref = ''
-        if valid_vcf_file:
-            variation_object = {
-                "genome": params['genome_ref'],
-                "population": population,
-                "contigs": vcf_contigs,
-                "comment": "Comments go here",
-                "assay": "Assay data goes gere.",
-                "originator": "PI/Lab info goes here",
-                "pubmed_id": "PubMed ID goes here",
-                "kinship_info": kinship_matrix
-            }
-
-            variation_obj_ref = self._save_variation_to_ws(params['workspace_name'],
-                                                           params['variation_object_name'],
-                                                           variation_object,
-                                                           vcf_filepath,
-                                                           kinship_matrix)
+        return invalid_contigs
+
+    def _imported_samples(self, header, scan_results):
+        """Samples in the stored VCF, i.e. without those removed by QC."""
+        qc = scan_results['genotypes'].get('qc')
+        return qc['samples'] if qc else header['genotypes']
+
+    def _apply_sample_qc(self, scan_results):
+        """
+            Packed genotype matrix and kinship matrix without the sites and
+            samples QC removed.  The matrix is cut down from what the scan
+            already wrote, so dropping samples never re-reads the VCF, and the
+            kinship is computed from it, so it covers exactly the stored sites
+            and samples.
+
+            The sample-level mind filter is applied after the site filters:
+            the geno, maf and hwe decisions were made over every sample.
+        """
+        qc = scan_results['genotypes'].get('qc')
+        if not qc:
+            return self.genotype_matrix_dir, scan_results['genotypes']['kinship']
+
+        matrix_dir = subset_genotype_matrix(self.genotype_matrix_dir, self.qc_genotype_matrix_dir,
+                                            qc['site_mask'], qc['samples'])
+        return matrix_dir, matrix_kinship(GenotypeMatrix(matrix_dir))
+
+    def _save_if_valid(self, params, valid_vcf_file, header, population, scan_results,
+                       sample_qc):
+        if not valid_vcf_file:
+            return ''
+
+        genotype_matrix_dir, kinship_matrix = sample_qc
+        # Store the QC filtered VCF when filters were requested.
+        saved_vcf = scan_results['genotypes'].get('qc') or scan_results['bgzf']
+        variation_object = {
+            "genome": params['genome_ref'],
+            "population": population,
+            "contigs": header['contigs'],
+            "comment": "Comments go here",
+            "assay": "Assay data goes gere.",
+            "originator": "PI/Lab info goes here",
+            "pubmed_id": "PubMed ID goes here",
+            "kinship_info": kinship_matrix
+        }
+
+        return self._save_variation_to_ws(params['workspace_name'],
+                                          params['variation_object_name'],
+                                          variation_object,
+                                          saved_vcf['bgzf_filepath'],
+                                          kinship_matrix,
+                                          genotype_matrix_dir,
+                                          saved_vcf['index_filepath'],
+                                          saved_vcf.get('sha1'))
+
+    def validate_vcf(self, params, progress=None):
+        """
+            :param params: dict containing all input parameters.
+            :param progress: optional ImportProgress told about each stage and
+                the scan's progress, for imports run as background jobs.
+
+            The import runs as a graph of stages; each starts as soon as the
+            stages it needs are done, so e.g. the assembly lookup overlaps the
+            VCF download and scan, and the statistics and plots overlap the
+            validator and the workspace save.
+
+            Checkpoints only outlive a failed attempt: they are dropped once
+            the report is made.
+        """
+        checkpoints = self._resume_checkpoints(params) if self.resume_imports else None
+        try:
+            returnVal = self._run_import(params, checkpoints, progress)
+            # Only a failed attempt is resumed; importing the same data again
+            # later saves a new object.
+            if checkpoints:
+                checkpoints.discard()
+        finally:
+            if checkpoints:
+                self.run_lock.close()
+        return returnVal
+
+    def _run_import(self, params, checkpoints, progress):
+        thresholds = qc_thresholds(params)
+        stages = StageExecutor(max_workers=self.stage_workers, listener=progress,
+                               checkpoints=checkpoints)
+        # Stages that download, write to the workspace or run for long are
+        # checkpointed; the downloads are keyed on the content of the files.
+        stages.add('vcf_filepath', lambda: self._download_vcf(params),
+                   checkpoint=True, fingerprint=file_digest)
+        stages.add('location_filepath', lambda: self._download_locations(params),
+                   checkpoint=True, fingerprint=file_digest)
+        stages.add('assembly_ref', lambda: self._get_assembly_ref_from_genome(params['genome_ref']))
+        stages.add('assembly_contigs', self._get_contigs_from_assembly, ['assembly_ref'])
+        stages.add('scan', lambda vcf_filepath: self._scan_vcf(vcf_filepath, thresholds, progress),
+                   ['vcf_filepath'], checkpoint=True)
+        stages.add('header', self._check_vcf_header, ['vcf_filepath', 'scan'])
+        # Generate population object
+        stages.add('population',
+                   lambda location_filepath, header, scan: self._generate_population(
+                       location_filepath, self._imported_samples(header, scan)),
+                   ['location_filepath', 'header', 'scan'], checkpoint=True)
+        stages.add('invalid_contigs', self._find_invalid_contigs,
+                   ['vcf_filepath', 'header', 'assembly_contigs'])
+        stages.add('validation',
+                   lambda vcf_filepath, header: self._validate_vcf(vcf_filepath, header['version']),
+                   ['vcf_filepath', 'header'], checkpoint=True)
+        stages.add('valid_vcf_file',
+                   lambda validation, scan, invalid_contigs: (
+                       validation[1] == 0 and not scan['structure']['error_count'] and
+                       not invalid_contigs),
+                   ['validation', 'scan', 'invalid_contigs'])
+        stages.add('sample_qc', self._apply_sample_qc, ['scan'], checkpoint=True)
+        stages.add('variation_obj_ref', lambda *args: self._save_if_valid(params, *args),
+                   ['valid_vcf_file', 'header', 'population', 'scan', 'sample_qc'],
+                   checkpoint=True)
+        stages.add('stats',
+                   lambda scan, vcf_filepath: self._generate_variation_stats(
+                       scan['genotypes']['stats'], vcf_filepath,
+                       len(scan['header']['genotypes']), params.get('export_text_stats')),
+                   ['scan', 'vcf_filepath'], checkpoint=True)
+
+        try:
+            results = stages.run()
+        finally:
+            self.stage_timings = stages.timings
+            if stages.resumed:
+                log("Resumed stages: {}".format(', '.join(stages.resumed)))
+            log("Stage timings: {}".format(stages.timing_summary()))
+            log("Import stages finished in {:.2f}s".format(stages.elapsed()))
+
+        vcf_filepath = results['vcf_filepath']
+        header = results['header']
+        scan_results = results['scan']
+        variation_obj_ref = results['variation_obj_ref']
 
         log("Variation object reference: {}".format(variation_obj_ref))
         variation_report_metadata = {
-            'valid_variation_file': valid_vcf_file,
+            'valid_variation_file': results['valid_vcf_file'],
             'variation_obj_ref': variation_obj_ref,
             'variation_filename': os.path.basename(vcf_filepath),
-            'validation_output_filepath': validation_output_filepath,
-            'vcf_version': vcf_version,
-            'num_genotypes': len(vcf_genotypes),
-            'num_contigs': len(vcf_contigs),
-            'invalid_contigs': invalid_contigs
+            'validation_output_filepath': results['validation'][0],
+            'vcf_version': header['version'],
+            'num_genotypes': len(header['genotypes']),
+            'num_variants': scan_results['counts']['num_variants'],
+            'structural_errors': scan_results['structure']['errors'],
+            'num_contigs': len(header['contigs']),
+            'invalid_contigs': results['invalid_contigs'],
+            'qc': scan_results['genotypes'].get('qc')
         }
 
-        returnVal = self._generate_report(params, variation_report_metadata, vcf_filepath)
+        if progress:
+            progress.stage_started('report')
+        start = time.time()
+        returnVal = self._generate_report(params, variation_report_metadata, results['stats'])
+        if progress:
+            progress.stage_finished('report', time.time() - start)
 
         return returnVal
@@ -0,0 +1,165 @@
+import os
+import uuid
+
+import requests
+
+from DataFileUtil.DataFileUtilClient import DataFileUtil
+from kb_variation_importer.Utils.bgzf import BgzfReader
+from kb_variation_importer.Utils.tabix import TabixIndex, fetch, parse_region
+from kb_variation_importer.Utils.vcf_scanner import genotype_code, parse_header
+from kb_variation_importer.Utils.variation_importer_utils import log
+
+
+class ShockRangeFile(object):
+    """
+        Read-only, seekable file object over a Shock node.  Reads are served
+        from ranged downloads (Shock's seek/length parameters) of at least
+        window bytes, so only the parts of the node touched by a query are
+        transferred.
+    """
+
+    def __init__(self, shock_url, node_id, token, window=1 << 20):
+        self.url = '{}/node/{}'.format(shock_url.rstrip('/'), node_id)
+        self.headers = {'Authorization': 'OAuth ' + token}
+        self.window = window
+        self.session = requests.Session()
+        self.position = 0
+        self.buffer_start = 0
+        self.buffer = b''
+
+    def seek(self, position):
+        self.position = position
+
+    def tell(self):
+        return self.position
+
+    def _download(self, start, length):
+        response = self.session.get(self.url, headers=self.headers,
+                                    params={'download': '', 'seek': start, 'length': length})
+        if not response.ok:
+            raise ValueError('Unable to read {} bytes at {} from {}: {}'.format(
+                length, start, self.url, response.text))
+        return response.content
+
+    def read(self, size):
+        offset = self.position - self.buffer_start
+        if offset < 0 or offset + size > len(self.buffer):
+            self.buffer_start = self.position
+            self.buffer = self._download(self.position, max(size, self.window))
+            offset = 0
+        data = self.buffer[offset:offset + size]
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.session.close()
+
+
+def read_header(bgzf_source):
+    """Parse the VCF header at the start of an indexed BGZF VCF."""
+    reader = BgzfReader(bgzf_source)
+    reader.seek(0)
+
+    def lines():
+        while True:
+            line = reader.readline()
+            if not line:
+                return
+            yield line if isinstance(line, str) else line.decode('latin-1')
+    try:
+        return parse_header(lines())
+    finally:
+        reader.close()
+
+
+def query_regions(bgzf_source, index, regions, samples=None, include_genotypes=True):
+    """
+        Look up every region ('contig:start-end', 1-based inclusive) through
+        the tabix index.  Returns the selected sample IDs and, per region, the
+        overlapping variants with their genotype codes (0/1/2, -1 missing) for
+        those samples.
+    """
+    header = read_header(bgzf_source)
+    if samples:
+        unknown = [sample for sample in samples if sample not in header.samples]
+        if unknown:
+            raise ValueError('Unknown sample IDs: {}'.format(', '.join(unknown)))
+        columns = [header.samples.index(sample) + 9 for sample in samples]
+    else:
+        samples = header.samples
+        columns = list(range(9, 9 + len(samples)))
+
+    region_results = []
+    for region in regions:
+        contig, start, end = parse_region(region)
+        variants = []
+        for fields in fetch(bgzf_source, index, contig, start, end):
+            variant = {
+                'contig_id': fields[0],
+                'position': int(fields[1]),
+                'id': fields[2],
+                'ref': fields[3],
+                'alt': fields[4]
+            }
+            if include_genotypes:
+                variant['genotypes'] = [genotype_code(fields[column]) for column in columns]
+            variants.append(variant)
+        region_results.append({'region': region, 'variants': variants})
+
+    return {'samples': samples, 'regions': region_results}
+
+
+class variation_query_utils:
+
+    def __init__(self, utility_params):
+        self.params = utility_params
+        self.scratch = os.path.join(
+            utility_params['scratch'], 'variation_query_' + str(uuid.uuid4()))
+        os.mkdir(self.scratch)
+        self.shock_url = utility_params['shock-url']
+        self.callback_url = utility_params['callback_url']
+        self.token = utility_params['token']
+
+        self.dfu = DataFileUtil(self.callback_url)
+
+    def _get_variation_files(self, variation_ref):
+        try:
+            variation = self.dfu.get_objects({'object_refs': [variation_ref]})['data'][0]
+        except Exception as e:
+            print("Unable to retrieve Variation object: {}".format(variation_ref))
+            raise ValueError(e)
+
+        object_meta = variation['info'][10] or {}
+        index_shock_id = object_meta.get('vcf_index_shock_id')
+        if not index_shock_id:
+            raise ValueError("Variation object {} has no VCF index; "
+                             "re-import it to enable region queries.".format(variation_ref))
+        return variation['data']['variation_file_reference'], index_shock_id
+
+    def query_variation_regions(self, params):
+        """
+            :param params: dict containing all input parameters.
+        """
+        if not params.get('variation_ref'):
+            raise ValueError("variation_ref is required.")
+        if not params.get('regions'):
+            raise ValueError("At least one region is required.")
+
+        vcf_shock_id, index_shock_id = self._get_variation_files(params['variation_ref'])
+
+        index_filepath = os.path.join(self.scratch, 'variations.vcf.gz.tbi')
+        self.dfu.shock_to_file({'shock_id': index_shock_id, 'file_path': index_filepath})
+        index = TabixIndex.read(index_filepath)
+
+        vcf_file = ShockRangeFile(self.shock_url, vcf_shock_id, self.token)
+        try:
+            results = query_regions(vcf_file, index, params['regions'],
+                                    samples=params.get('samples'),
+                                    include_genotypes=params.get('include_genotypes', 1))
+        finally:
+            vcf_file.close()
+
+        log("Returned {} variants from {} regions".format(
+            sum(len(region['variants']) for region in results['regions']),
+            len(results['regions'])))
+        return results
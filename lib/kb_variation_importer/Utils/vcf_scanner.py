@@ -0,0 +1,337 @@
+import gzip
+import os
+
+
+def open_vcf(vcf_filepath):
+    """Open a plain or gzipped VCF for text reading."""
+    return (gzip.open if vcf_filepath.endswith('.gz') else open)(vcf_filepath, 'rt')
+
+
+def genotype_code(gt):
+    """
+        Collapse a GT string into a biallelic dosage.
+        0 = homozygous reference, 1 = heterozygous, 2 = homozygous alternate,
+        -1 = missing.  Any non-reference allele counts as alternate.
+    """
+    gt = gt.split(':', 1)[0]
+    if len(gt) == 3:
+        a1, a2 = gt[0], gt[2]
+    else:
+        alleles = gt.replace('|', '/').split('/')
+        if len(alleles) != 2:
+            return -1
+        a1, a2 = alleles
+    if a1 == '.' or a2 == '.':
+        return -1
+    return (a1 != '0') + (a2 != '0')
+
+
+class VCFHeader(object):
+    """Meta lines, contigs and sample IDs read from the top of a VCF."""
+
+    def __init__(self):
+        self.version = None
+        self.fileformat = None
+        self.meta = []
+        self.contigs = []
+        self.columns = []
+        self.samples = []
+        self.line_count = 0
+
+
+class RecordConsumer(object):
+    """
+        Base class for anything fed by VCFScanner.
+        start() receives the parsed header, consume() every data record as a
+        list of tab separated fields, and finish() returns the result stored
+        under the consumer's name.
+
+        Consumers that can run under ParallelVCFScanner also implement
+        merge(), which combines the partial() results of every chunk given as
+        (line offset, partial) pairs in file order.  start_chunk() replaces
+        start() inside a worker.
+    """
+    name = None
+
+    def start(self, header):
+        self.header = header
+
+    def start_chunk(self, header, chunk_index):
+        self.start(header)
+
+    def consume(self, line_number, fields):
+        raise NotImplementedError
+
+    def finish(self):
+        return None
+
+    def partial(self):
+        return self.finish()
+
+    def merge(self, partials):
+        raise NotImplementedError(
+            '{} cannot merge chunked results'.format(self.__class__.__name__))
+
+
+class HeaderCollector(RecordConsumer):
+    name = 'header'
+
+    def consume(self, line_number, fields):
+        pass
+
+    def finish(self):
+        return {
+            'version': self.header.version,
+            'contigs': self.header.contigs,
+            'genotypes': self.header.samples,
+            'meta': self.header.meta
+        }
+
+    def merge(self, partials):
+        return partials[0][1]
+
+
+class RecordCounter(RecordConsumer):
+    name = 'counts'
+
+    def start(self, header):
+        super(RecordCounter, self).start(header)
+        self.num_variants = 0
+        self.contig_counts = {}
+        self.contig_order = []
+
+    def consume(self, line_number, fields):
+        self.num_variants += 1
+        contig = fields[0]
+        if contig not in self.contig_counts:
+            self.contig_counts[contig] = 0
+            self.contig_order.append(contig)
+        self.contig_counts[contig] += 1
+
+    def finish(self):
+        return {
+            'num_variants': self.num_variants,
+            'contigs': self.contig_order,
+            'contig_counts': self.contig_counts
+        }
+
+    def merge(self, partials):
+        merged = {'num_variants': 0, 'contigs': [], 'contig_counts': {}}
+        for line_offset, partial in partials:
+            merged['num_variants'] += partial['num_variants']
+            for contig in partial['contigs']:
+                if contig not in merged['contig_counts']:
+                    merged['contig_counts'][contig] = 0
+                    merged['contigs'].append(contig)
+                merged['contig_counts'][contig] += partial['contig_counts'][contig]
+        return merged
+
+
+class StructuralChecker(RecordConsumer):
+    """
+        Cheap checks that do not need the external validator: column count,
+        integer and sorted positions, non-empty alleles and declared contigs.
+    """
+    name = 'structure'
+
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+
+    def start(self, header):
+        super(StructuralChecker, self).start(header)
+        self.num_columns = len(header.columns)
+        self.declared_contigs = set(header.contigs)
+        self.undeclared_contigs = []
+        self.last_contig = None
+        self.last_pos = 0
+        self.seen_contigs = set()
+        self.contig_order = []
+        self.first_record = None
+        self.errors = []
+        self.error_count = 0
+
+    def _error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_number, 'message': message})
+
+    def consume(self, line_number, fields):
+        if len(fields) != self.num_columns:
+            self._error(line_number, 'Expected {} columns, found {}'.format(
+                self.num_columns, len(fields)))
+            return
+
+        contig = fields[0]
+        if contig != self.last_contig:
+            if contig in self.seen_contigs:
+                self._error(line_number, 'Records for contig {} are not contiguous'.format(contig))
+            if self.declared_contigs and contig not in self.declared_contigs \
+                    and contig not in self.seen_contigs:
+                self.undeclared_contigs.append(contig)
+            self.seen_contigs.add(contig)
+            self.contig_order.append((contig, line_number))
+            self.last_contig = contig
+            self.last_pos = 0
+
+        try:
+            pos = int(fields[1])
+        except ValueError:
+            self._error(line_number, 'POS is not an integer: {}'.format(fields[1]))
+            return
+        if self.first_record is None:
+            self.first_record = (line_number, contig, pos)
+        if pos < self.last_pos:
+            self._error(line_number, 'POS {} on {} is out of order'.format(pos, contig))
+        self.last_pos = pos
+
+        if not fields[3] or fields[3] == '.':
+            self._error(line_number, 'Missing REF allele')
+        if not fields[4]:
+            self._error(line_number, 'Missing ALT allele')
+
+    def finish(self):
+        return {
+            'errors': self.errors,
+            'error_count': self.error_count,
+            'undeclared_contigs': self.undeclared_contigs
+        }
+
+    def partial(self):
+        partial = self.finish()
+        partial.update({
+            'errors': self.errors,
+            'contig_order': self.contig_order,
+            'first_record': self.first_record,
+            'last_record': (self.last_contig, self.last_pos)
+        })
+        return partial
+
+    def merge(self, partials):
+        """
+            Offset each chunk's line numbers and repeat the ordering and
+            contiguity checks across chunk boundaries.
+        """
+        errors = []
+        error_count = 0
+        undeclared_contigs = []
+        seen_contigs = set()
+        last_contig, last_pos = None, 0
+        for line_offset, partial in partials:
+            error_count += partial['error_count']
+            for error in partial['errors']:
+                errors.append({'line': error['line'] + line_offset, 'message': error['message']})
+            if partial['first_record'] is not None:
+                line_number, contig, pos = partial['first_record']
+                line_number += line_offset
+                if contig == last_contig and pos < last_pos:
+                    error_count += 1
+                    errors.append({'line': line_number, 'message':
+                                   'POS {} on {} is out of order'.format(pos, contig)})
+                elif contig != last_contig and contig in seen_contigs:
+                    error_count += 1
+                    errors.append({'line': line_number, 'message':
+                                   'Records for contig {} are not contiguous'.format(contig)})
+            # Repeats within the chunk were already reported by the chunk itself.
+            chunk_contigs = set()
+            for idx, (contig, line_number) in enumerate(partial['contig_order']):
+                if idx and contig in seen_contigs and contig not in chunk_contigs:
+                    error_count += 1
+                    errors.append({'line': line_number + line_offset, 'message':
+                                   'Records for contig {} are not contiguous'.format(contig)})
+                chunk_contigs.add(contig)
+            seen_contigs.update(chunk_contigs)
+            for contig in partial['undeclared_contigs']:
+                if contig not in undeclared_contigs:
+                    undeclared_contigs.append(contig)
+            if partial['last_record'][0] is not None:
+                last_contig, last_pos = partial['last_record']
+
+        errors.sort(key=lambda error: error['line'])
+        return {
+            'errors': errors[:self.max_errors],
+            'error_count': error_count,
+            'undeclared_contigs': undeclared_contigs
+        }
+
+
+def parse_header(lines):
+    """
+        Parse meta lines up to and including #CHROM from an iterator of lines.
+        The iterator is left positioned at the first data record.
+    """
+    header = VCFHeader()
+    line = next(lines, '')
+    header.line_count += 1
+    tokens = line.split('=')
+    if not (tokens[0].startswith('##fileformat')) or len(tokens) < 2:
+        raise ValueError("Invalid VCF.  ##fileformat line in meta is improperly formatted.")
+    header.version = float(tokens[1][-4:].rstrip())
+    header.fileformat = line.rstrip('\r\n')
+
+    for line in lines:
+        header.line_count += 1
+        if line.startswith('#CHROM'):
+            header.columns = line.rstrip().split('\t')
+            header.samples = header.columns[9:]
+            return header
+        header.meta.append(line.rstrip('\r\n'))
+        if line.startswith('##contig'):
+            for item in line.strip()[len('##contig=<'):-1].split(','):
+                if item.startswith('ID='):
+                    header.contigs.append(item[3:])
+                    break
+
+    raise ValueError("Invalid VCF.  No #CHROM header line found.")
+
+
+# Records between calls to a scanner's progress callback.
+PROGRESS_INTERVAL = 10000
+
+
+def file_position(vcf):
+    """
+        Byte offset reached in the file on disk behind a handle from open_vcf,
+        i.e. the compressed offset for gzip.  Ahead of the last line returned
+        by at most the read buffer, which is plenty for progress reporting.
+    """
+    handle = getattr(vcf, 'buffer', vcf)
+    return getattr(handle, 'fileobj', handle).tell()
+
+
+class VCFScanner(object):
+    """
+        Reads a (optionally gzipped) VCF exactly once and fans each record out
+        to a list of RecordConsumers.  progress, if given, is called as
+        progress(bytes_read, records) every PROGRESS_INTERVAL records and at
+        the end.
+    """
+
+    def __init__(self, vcf_filepath, consumers, progress=None):
+        self.vcf_filepath = vcf_filepath
+        self.consumers = consumers
+        self.progress = progress
+
+    def scan(self):
+        with open_vcf(self.vcf_filepath) as vcf:
+            lines = iter(vcf)
+            header = parse_header(lines)
+            for consumer in self.consumers:
+                consumer.start(header)
+
+            line_number = header.line_count
+            records = 0
+            for line in lines:
+                line_number += 1
+                line = line.rstrip('\r\n')
+                if not line:
+                    continue
+                fields = line.split('\t')
+                for consumer in self.consumers:
+                    consumer.consume(line_number, fields)
+                records += 1
+                if self.progress and not records % PROGRESS_INTERVAL:
+                    self.progress(file_position(vcf), records)
+            if self.progress:
+                self.progress(os.path.getsize(self.vcf_filepath), records)
+
+        return dict((consumer.name, consumer.finish()) for consumer in self.consumers)
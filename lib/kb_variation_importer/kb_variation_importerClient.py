@@ -33,19 +33,75 @@ class kb_variation_importer(object):
             trust_all_ssl_certificates=trust_all_ssl_certificates,
             auth_svc=auth_svc)
 
-    def import_snp_data(self, import_snp_params, context=None):
+    def import_variation(self, import_variation_params, context=None):
         """
-        :param import_snp_params: instance of type "import_snp_params"
-           (Insert your typespec information here.) -> structure: parameter
-           "workspace_name" of String, parameter "variation_file_subdir_path"
-           of String, parameter "will_perform_gwas" of Long
-        :returns: instance of type "snp_import_results" -> structure:
+        :param import_variation_params: instance of type
+           "import_variation_params" (required params: genome_ref:
+           KBaseGenomes.Genome object reference variation_file_subdir_path:
+           path to VCF in staging area variation_attributes_subdir_path: path
+           to location file in staging area. variation_object_name: name of
+           created Variation Object) -> structure: parameter "workspace_name"
+           of String, parameter "genome_ref" of type "obj_ref" (An X/Y/Z
+           style reference), parameter "variation_file_subdir_path" of
+           String, parameter "variation_attributes_subdir_path" of String,
+           parameter "variation_object_name" of String
+        :returns: instance of type "import_variation_results" -> structure:
            parameter "report_name" of String, parameter "report_ref" of
-           String, parameter "vcf_version" of String
+           String, parameter "variation_ref" of type "obj_ref" (An X/Y/Z
+           style reference)
         """
         return self._client.call_method(
-            'kb_variation_importer.import_snp_data',
-            [import_snp_params], self._service_ver, context)
+            'kb_variation_importer.import_variation',
+            [import_variation_params], self._service_ver, context)
+
+    def query_variation_regions(self, query_variation_regions_params, context=None):
+        """
+        Return the variants overlapping the given regions using the positional
+        index written at import time, reading only the matching parts of the
+        stored VCF.
+        :param query_variation_regions_params: instance of type
+           "query_variation_regions_params" -> structure: parameter
+           "variation_ref" of type "obj_ref" (An X/Y/Z style reference),
+           parameter "regions" of list of String, parameter "samples" of
+           list of String, parameter "include_genotypes" of type "boolean"
+           (A boolean - 0 for false, 1 for true. @range (0, 1))
+        :returns: instance of type "query_variation_regions_results" ->
+           structure: parameter "samples" of list of String, parameter
+           "regions" of list of type "region_variants" -> structure:
+           parameter "region" of String, parameter "variants" of list of type
+           "variant_record" -> structure: parameter "contig_id" of String,
+           parameter "position" of Long, parameter "id" of String, parameter
+           "ref" of String, parameter "alt" of String, parameter "genotypes"
+           of list of Long
+        """
+        return self._client.call_method(
+            'kb_variation_importer.query_variation_regions',
+            [query_variation_regions_params], self._service_ver, context)
+
+    def get_import_status(self, get_import_status_params, context=None):
+        """
+        Report the progress of an import started with run_in_background.
+        :param get_import_status_params: instance of type
+           "get_import_status_params" -> structure: parameter "job_id" of
+           String
+        :returns: instance of type "import_status" -> structure: parameter
+           "job_id" of String, parameter "state" of String, parameter
+           "elapsed_seconds" of Double, parameter "running_stages" of list of
+           String, parameter "completed_stages" of list of type
+           "stage_timing" -> structure: parameter "name" of String, parameter
+           "seconds" of Double, parameter "bytes_processed" of Long,
+           parameter "total_bytes" of Long, parameter "records_processed" of
+           Long, parameter "bytes_per_second" of Double, parameter
+           "records_per_second" of Double, parameter "eta_seconds" of Double,
+           parameter "result" of type "import_variation_results" ->
+           structure: parameter "report_name" of String, parameter
+           "report_ref" of String, parameter "variation_ref" of type
+           "obj_ref", parameter "job_id" of String, parameter "error" of
+           String
+        """
+        return self._client.call_method(
+            'kb_variation_importer.get_import_status',
+            [get_import_status_params], self._service_ver, context)
 
     def status(self, context=None):
         return self._client.call_method('kb_variation_importer.status',
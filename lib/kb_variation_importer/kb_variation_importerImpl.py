@@ -6,6 +6,8 @@ import uuid
 import errno
 import json
 from kb_variation_importer.Utils import variation_importer_utils
+from kb_variation_importer.Utils import variation_query_utils
+from kb_variation_importer.Utils.import_jobs import ImportJobQueue
 
 # from DataFileUtil.DataFileUtilClient import DataFileUtil
 # from KBaseReport.KBaseReportClient import KBaseReport
@@ -57,6 +59,10 @@ class kb_variation_importer:
         self.config = config
         self.scratch = config['scratch']
         self.callback_url = os.environ['SDK_CALLBACK_URL']
+        # Imports run with run_in_background go to this pool; their status
+        # files are shared by every server process on the host.
+        self.import_jobs = ImportJobQueue(os.path.join(self.scratch, 'import_jobs'),
+                                          int(config.get('import-workers') or 2))
         #END_CONSTRUCTOR
         pass
 
@@ -78,13 +84,21 @@ class kb_variation_importer:
         returnVal = {}
         # TODO: Validate params
 
-        utility_params = self.config
+        utility_params = dict(self.config)
         utility_params['token'] = ctx['token']
         utility_params['callback_url'] = self.callback_url
-        self.vu = variation_importer_utils.variation_importer_utils(utility_params)
+
+        if import_variation_params.get('run_in_background'):
+            def run_import(progress):
+                vu = variation_importer_utils.variation_importer_utils(utility_params)
+                return vu.validate_vcf(import_variation_params, progress)
+            job_id = self.import_jobs.submit(run_import, ctx.get('user_id'))
+            return [{'job_id': job_id}]
+
+        vu = variation_importer_utils.variation_importer_utils(utility_params)
 
         try:
-            returnVal = self.vu.validate_vcf(import_variation_params)
+            returnVal = vu.validate_vcf(import_variation_params)
         except Exception as e:
             print("Error importing variation data!")
             raise ValueError(e)
@@ -98,6 +112,98 @@ class kb_variation_importer:
         # return the results
         return [returnVal]
 
+    def query_variation_regions(self, ctx, query_variation_regions_params):
+        """
+        Return the variants overlapping the given regions using the positional
+        index written at import time, reading only the matching parts of the
+        stored VCF.
+        :param query_variation_regions_params: instance of type
+           "query_variation_regions_params" -> structure: parameter
+           "variation_ref" of type "obj_ref" (An X/Y/Z style reference),
+           parameter "regions" of list of String, parameter "samples" of
+           list of String, parameter "include_genotypes" of type "boolean"
+           (A boolean - 0 for false, 1 for true. @range (0, 1))
+        :returns: instance of type "query_variation_regions_results" ->
+           structure: parameter "samples" of list of String, parameter
+           "regions" of list of type "region_variants" -> structure:
+           parameter "region" of String, parameter "variants" of list of type
+           "variant_record" (genotypes: one code per requested sample - 0
+           homozygous reference, 1 heterozygous, 2 homozygous alternate, -1
+           missing.) -> structure: parameter "contig_id" of String, parameter
+           "position" of Long, parameter "id" of String, parameter "ref" of
+           String, parameter "alt" of String, parameter "genotypes" of list
+           of Long
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN query_variation_regions
+
+        utility_params = dict(self.config)
+        utility_params['token'] = ctx['token']
+        utility_params['callback_url'] = self.callback_url
+        vq = variation_query_utils.variation_query_utils(utility_params)
+
+        try:
+            returnVal = vq.query_variation_regions(query_variation_regions_params)
+        except Exception as e:
+            print("Error querying variation regions!")
+            raise ValueError(e)
+
+        #END query_variation_regions
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method query_variation_regions return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
+
+    def get_import_status(self, ctx, get_import_status_params):
+        """
+        Report the progress of an import started with run_in_background.
+        :param get_import_status_params: instance of type
+           "get_import_status_params" -> structure: parameter "job_id" of
+           String
+        :returns: instance of type "import_status" (state: queued, running,
+           completed or error. running_stages: import stages in progress,
+           oldest first. bytes_processed, records_processed: how far the VCF
+           scan has got; total_bytes is the VCF's size on disk.
+           bytes_per_second, records_per_second: scan throughput so far.
+           eta_seconds: estimated time for the scan to finish. result: the
+           import's results once completed. error: why the import failed.) ->
+           structure: parameter "job_id" of String, parameter "state" of
+           String, parameter "elapsed_seconds" of Double, parameter
+           "running_stages" of list of String, parameter "completed_stages"
+           of list of type "stage_timing" -> structure: parameter "name" of
+           String, parameter "seconds" of Double, parameter
+           "bytes_processed" of Long, parameter "total_bytes" of Long,
+           parameter "records_processed" of Long, parameter
+           "bytes_per_second" of Double, parameter "records_per_second" of
+           Double, parameter "eta_seconds" of Double, parameter "result" of
+           type "import_variation_results" -> structure: parameter
+           "report_name" of String, parameter "report_ref" of String,
+           parameter "variation_ref" of type "obj_ref" (An X/Y/Z style
+           reference), parameter "job_id" of String, parameter "error" of
+           String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN get_import_status
+
+        status = self.import_jobs.status(get_import_status_params.get('job_id'),
+                                         ctx.get('user_id'))
+        returnVal = dict((key, value) for key, value in status.items()
+                         if key not in ('user_id', 'pid', 'submitted') and value is not None)
+
+        #END get_import_status
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method get_import_status return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
+
     def status(self, ctx):
         #BEGIN_STATUS
         returnVal = {'state': "OK",
@@ -105,5 +211,10 @@ class kb_variation_importer:
                      'version': self.VERSION,
                      'git_url': self.GIT_URL,
                      'git_commit_hash': self.GIT_COMMIT_HASH}
+        # The server hands over its auth client so the token cache counters
+        # can be monitored.
+        auth_client = getattr(self, 'auth_client', None)
+        if auth_client is not None:
+            returnVal['token_cache'] = auth_client.cache_stats()
         #END_STATUS
         return [returnVal]
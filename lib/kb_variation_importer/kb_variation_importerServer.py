@@ -333,10 +333,18 @@ class Application(object):
         self.serverlog.set_log_level(6)
         self.rpc_service = JSONRPCServiceCustom()
         self.method_authentication = dict()
-        self.rpc_service.add(impl_kb_variation_importer.import_snp_data,
-                             name='kb_variation_importer.import_snp_data',
+        self.rpc_service.add(impl_kb_variation_importer.import_variation,
+                             name='kb_variation_importer.import_variation',
                              types=[dict])
-        self.method_authentication['kb_variation_importer.import_snp_data'] = 'required'  # noqa
+        self.method_authentication['kb_variation_importer.import_variation'] = 'required'  # noqa
+        self.rpc_service.add(impl_kb_variation_importer.query_variation_regions,
+                             name='kb_variation_importer.query_variation_regions',
+                             types=[dict])
+        self.method_authentication['kb_variation_importer.query_variation_regions'] = 'required'  # noqa
+        self.rpc_service.add(impl_kb_variation_importer.get_import_status,
+                             name='kb_variation_importer.get_import_status',
+                             types=[dict])
+        self.method_authentication['kb_variation_importer.get_import_status'] = 'required'  # noqa
         self.rpc_service.add(impl_kb_variation_importer.status,
                              name='kb_variation_importer.status',
                              types=[dict])
@@ -0,0 +1,47 @@
+'''
+Entry point that serves the module.  kb-sdk regenerates
+kb_variation_importerServer.py on every compile, so the choice of serving
+mode lives here and scripts/start_server.sh runs this module:
+
+    python -m kb_variation_importer.service [--host HOST] [--port PORT]
+
+The server-mode deploy config key selects single (the default), threaded,
+prefork or gevent serving; prefork runs server-workers processes that are
+replaced after server-max-requests requests each (0 for never).  In every
+mode GET /ready answers once the application is loaded.  Token lookups go
+through a cache sized by the auth-cache-* keys.
+'''
+from argparse import ArgumentParser
+
+from kb_variation_importer import kb_variation_importerServer as server
+from kb_variation_importer.Utils.token_auth import KBaseAuth, get_token_cache_params
+from kb_variation_importer.wsgi_workers import get_server_mode_params, make_wsgi_server
+
+
+def use_token_cache(application, impl, config):
+    '''
+    Replace the generated server's auth client with one whose token cache is
+    configured from deploy.cfg, and let the impl report its statistics.
+    '''
+    config = config or {}
+    application.auth_client = KBaseAuth(config.get(server.AUTH),
+                                        **get_token_cache_params(config))
+    impl.auth_client = application.auth_client
+
+
+def start_server(host='localhost', port=5000):
+    use_token_cache(server.application, server.impl_kb_variation_importer, server.config)
+    # A recycled prefork worker finishes its background imports before exiting.
+    httpd = make_wsgi_server(host, port, server.application,
+                             on_worker_exit=server.impl_kb_variation_importer.import_jobs.join,
+                             **get_server_mode_params(server.config))
+    print('Listening on port %s' % httpd.server_address[1])
+    httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Serve kb_variation_importer')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    start_server(host=args.host, port=args.port)
@@ -0,0 +1,232 @@
+'''
+Serving modes for the module's WSGI application besides the single threaded
+wsgiref server:
+
+threaded  one process, one thread per request
+prefork   a master process binds the listening socket and forks N worker
+          processes that accept from it; a worker exits after max_requests
+          requests and the master forks a replacement as soon as it stops
+          accepting, which bounds memory growth across imports
+gevent    gevent's WSGI server, when gevent is installed
+'''
+import errno
+import fcntl
+import json
+import os
+import select
+import signal
+import sys
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+try:
+    from socketserver import ThreadingMixIn  # py3
+except ImportError:
+    from SocketServer import ThreadingMixIn  # py2
+
+SERVER_MODES = ('single', 'threaded', 'prefork', 'gevent')
+READY_PATH = '/ready'
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def with_readiness_check(app, path=READY_PATH):
+    '''
+    Answer GET requests for path with 200 and the serving process ID once the
+    application is loaded; everything else goes to app.
+    '''
+    def readiness_app(environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'GET' and environ.get('PATH_INFO') == path:
+            body = json.dumps({'state': 'ready', 'pid': os.getpid()}).encode('utf-8')
+            start_response('200 OK', [('Content-Type', 'application/json'),
+                                      ('Content-Length', str(len(body)))])
+            return [body]
+        return app(environ, start_response)
+    return readiness_app
+
+
+class PreforkServer(object):
+    '''
+    Pre-forked WSGI server.  All workers accept connections from the socket
+    the master bound, so the kernel spreads requests over whichever workers
+    are idle.  serve_forever() runs in the master until SIGTERM or SIGINT,
+    which are passed on to the workers.  on_worker_exit, if given, is called
+    in a worker that reached max_requests before it exits, e.g. to let
+    background work started by its requests finish.
+
+    A worker that stops accepting writes its pid to a pipe the master
+    watches, so the master forks its replacement straight away rather than
+    when the worker exits; the retiring worker is tracked as draining until
+    it is reaped.  SIGCHLD also writes to the pipe to wake the master.
+    '''
+
+    def __init__(self, host, port, app, workers=4, max_requests=0,
+                 handler_class=WSGIRequestHandler, on_worker_exit=None):
+        self.httpd = make_server(host, port, app, handler_class=handler_class)
+        self.server_address = self.httpd.server_address
+        self.num_workers = max(1, workers)
+        self.max_requests = max_requests
+        self.on_worker_exit = on_worker_exit
+        self.workers = set()
+        self.draining = set()
+        self.stopping = False
+        self.notify_r = self.notify_w = None
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers.add(pid)
+            return pid
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            os.close(self.notify_r)
+            self._work()
+            # Stop accepting first so the wait does not hold up requests.
+            self.httpd.server_close()
+            self._notify('{}\n'.format(os.getpid()))
+            if self.on_worker_exit:
+                self.on_worker_exit()
+        except Exception:
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def _work(self):
+        handled = 0
+        while not self.max_requests or handled < self.max_requests:
+            self.httpd.handle_request()
+            handled += 1
+
+    def _notify(self, message):
+        try:
+            os.write(self.notify_w, message.encode('ascii'))
+        except OSError:
+            # A full pipe already wakes the master; a lost notice only delays
+            # the respawn until the worker is reaped.
+            pass
+
+    def _child_exited(self, signum, frame):
+        self._notify('\n')
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.workers | self.draining):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                self.workers.discard(pid)
+                self.draining.discard(pid)
+
+    def _stop_late_spawn(self):
+        # A signal that arrived while forking missed the new worker.
+        if self.stopping:
+            self._stop(None, None)
+
+    def _replace(self, pid):
+        self.workers.discard(pid)
+        if not self.stopping:
+            self._spawn()
+            self._stop_late_spawn()
+
+    def _read_notices(self):
+        try:
+            ready = select.select([self.notify_r], [], [], 1.0)[0]
+        except (OSError, select.error) as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        if not ready:
+            return
+        for line in os.read(self.notify_r, 4096).decode('ascii').split():
+            pid = int(line)
+            # Ignore notices from workers already reaped as dead.
+            if pid in self.workers:
+                self.draining.add(pid)
+                self._replace(pid)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    self.workers.clear()
+                    self.draining.clear()
+                    return
+                raise
+            if not pid:
+                return
+            if pid in self.draining:
+                self.draining.discard(pid)
+            elif pid in self.workers:
+                # Died before reaching max_requests.
+                self._replace(pid)
+
+    def serve_forever(self):
+        self.notify_r, self.notify_w = os.pipe()
+        fcntl.fcntl(self.notify_w, fcntl.F_SETFL,
+                    fcntl.fcntl(self.notify_w, fcntl.F_GETFL) | os.O_NONBLOCK)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGCHLD, self._child_exited)
+        for _ in range(self.num_workers):
+            self._spawn()
+            self._stop_late_spawn()
+        try:
+            while self.workers or self.draining:
+                self._read_notices()
+                self._reap()
+        finally:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            os.close(self.notify_r)
+            os.close(self.notify_w)
+            self.httpd.server_close()
+
+
+def get_server_mode_params(config):
+    '''
+    Read make_wsgi_server's mode, workers and max_requests from the
+    server-mode, server-workers and server-max-requests deploy config keys.
+    '''
+    config = config or {}
+    return {
+        'mode': config.get('server-mode') or 'single',
+        'workers': int(config.get('server-workers') or 4),
+        'max_requests': int(config.get('server-max-requests') or 0)
+    }
+
+
+def make_wsgi_server(host, port, app, mode='single', workers=4, max_requests=0,
+                     on_worker_exit=None):
+    '''
+    Build a server for app in one of SERVER_MODES.  The result has
+    server_address and serve_forever() whatever the mode; on_worker_exit only
+    applies to prefork.
+    '''
+    app = with_readiness_check(app)
+    if mode == 'single':
+        return make_server(host, port, app)
+    if mode == 'threaded':
+        return make_server(host, port, app, server_class=ThreadingWSGIServer)
+    if mode == 'prefork':
+        return PreforkServer(host, port, app, workers, max_requests,
+                             on_worker_exit=on_worker_exit)
+    if mode == 'gevent':
+        try:
+            from gevent.pywsgi import WSGIServer as GeventWSGIServer
+        except ImportError:
+            raise ValueError('server-mode gevent requires the gevent package')
+        server = GeventWSGIServer((host, port), app)
+        server.init_socket()
+        server.server_address = server.socket.getsockname()
+        return server
+    raise ValueError('Unknown server mode {}; expected one of {}'.format(
+        mode, ', '.join(SERVER_MODES)))
@@ -0,0 +1,16 @@
+#!/bin/bash
+# Regenerate the plink --freq/--hardy output that test/genotype_stats_test.py
+# checks the in-process statistics against.  Needs plink 1.9 on the PATH,
+# e.g. http://s3.amazonaws.com/plink1-assets/plink_linux_x86_64_20181202.zip,
+# the build the module ran before the statistics moved in-process.
+set -e
+
+script_dir=$(dirname "$(readlink -f "$0")")
+data_dir=$script_dir/../data
+out_dir=$data_dir/plink
+work_dir=$(mktemp -d)
+trap 'rm -rf "$work_dir"' EXIT
+
+mkdir -p "$out_dir"
+plink --vcf "$data_dir/test.vcf" --freq --hardy --out "$work_dir/test.vcf"
+cp "$work_dir/test.vcf.frq" "$work_dir/test.vcf.hwe" "$out_dir/"
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # py3
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer  # py2
+    from SocketServer import ThreadingMixIn
+
+from kb_variation_importer.Utils import baseclient
+from kb_variation_importer.Utils.baseclient import AdaptivePolling, BaseClient, ExponentialPolling
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = []
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        EchoHandler.connections.append(self.client_address)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        body = json.dumps({'version': '1.1', 'result': [request['params']]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # Keep-alive connections hold their handler open until the client closes.
+    daemon_threads = True
+
+
+class BaseClientSessionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+        cls.url = 'http://127.0.0.1:{}'.format(cls.server.server_address[1])
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_clients_share_keep_alive_connection(self):
+        EchoHandler.connections = []
+        for idx in range(10):
+            client = BaseClient(self.url, token='token', ignore_authrc=True)
+            self.assertEqual(client.call_method('Echo.echo', [idx]), [idx])
+        self.assertEqual(len(EchoHandler.connections), 1)
+        self.assertIs(baseclient._get_session(self.url),
+                      baseclient._get_session(self.url + '/other/path'))
+
+
+class PollingStrategyTest(unittest.TestCase):
+
+    def setUp(self):
+        AdaptivePolling._durations.clear()
+
+    def take(self, strategy, count):
+        intervals = strategy.intervals('DataFileUtil.file_to_shock')
+        return [next(intervals) for _ in range(count)]
+
+    def test_exponential_schedule_is_capped(self):
+        self.assertEqual(self.take(ExponentialPolling(0.1, 200, 0.5), 5),
+                         [0.1, 0.2, 0.4, 0.5, 0.5])
+
+    def test_first_check_near_expected_duration(self):
+        strategy = AdaptivePolling(0.1, 150, 5, jitter=0.1)
+        first = self.take(strategy, 1)[0]
+        self.assertTrue(0.09 <= first <= 0.11)
+
+        strategy.record('DataFileUtil.file_to_shock', 30.0)
+        strategy.record('DataFileUtil.file_to_shock', 40.0)
+        self.assertAlmostEqual(strategy.expected_duration('DataFileUtil.file_to_shock'), 33.0)
+        intervals = self.take(strategy, 30)
+        self.assertAlmostEqual(intervals[0], 0.9 * 33.0)
+        self.assertTrue(all(interval <= 5 * 1.1 for interval in intervals[1:]))
+
+    def test_wait_for_job_records_duration(self):
+        client = BaseClient('http://127.0.0.1:1', token='token', ignore_authrc=True,
+                            async_job_check_time_ms=1)
+        states = [{'finished': 0}, {'finished': 0}, {'finished': 1, 'result': ['done']}]
+        client._job_state = lambda service, job_id: states.pop(0)
+
+        self.assertEqual(client._wait_for_job('DataFileUtil.file_to_shock', 'job')['result'],
+                         ['done'])
+        self.assertFalse(states)
+        self.assertIsNotNone(
+            client.polling_strategy.expected_duration('DataFileUtil.file_to_shock'))
+
+    def test_generated_check_job_waits_for_the_job(self):
+        # kb-sdk generated clients call _check_job in their own sleep loop.
+        client = BaseClient('http://127.0.0.1:1', token='token', ignore_authrc=True,
+                            async_job_check_time_ms=1)
+        client._call = lambda url, method, params, context=None: 'job'
+        states = [{'finished': 0}, {'finished': 1, 'result': ['done']}]
+        client._job_state = lambda service, job_id: states.pop(0)
+
+        job_id = client._submit_job('KBaseReport.create', [{}])
+        self.assertEqual(client._check_job('KBaseReport', job_id)['result'], ['done'])
+        self.assertFalse(states)
+        self.assertIsNotNone(client.polling_strategy.expected_duration('KBaseReport.create'))
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from kb_variation_importer.Utils.checkpoints import StageCheckpoints, file_digest, try_lock
+from kb_variation_importer.Utils.stage_executor import StageError, StageExecutor
+
+
+class CheckpointsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_filepath = os.path.join(self.tmp_dir, 'input.vcf')
+        with open(self.input_filepath, 'w') as input_file:
+            input_file.write('1\t100\n')
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_import(self, run_key='run', fail_report=False):
+        def stage(name, func):
+            def run(*args):
+                self.calls.append(name)
+                return func(*args)
+            return run
+
+        def scan(input_filepath):
+            output_filepath = os.path.join(self.tmp_dir, 'scan.bin')
+            with open(input_filepath) as input_file, open(output_filepath, 'w') as output:
+                output.write(input_file.read() * 2)
+            return {'filepath': output_filepath, 'stats': np.arange(3)}
+
+        def report(scan, save):
+            if fail_report:
+                raise ValueError('report failed')
+            return save
+
+        stages = StageExecutor(checkpoints=StageCheckpoints(
+            os.path.join(self.tmp_dir, 'checkpoints'), run_key))
+        stages.add('download', stage('download', lambda: self.input_filepath),
+                   checkpoint=True, fingerprint=file_digest)
+        stages.add('scan', stage('scan', scan), ['download'], checkpoint=True)
+        stages.add('save', stage('save', lambda scan: '1/2/3'), ['scan'], checkpoint=True)
+        stages.add('report', stage('report', report), ['scan', 'save'])
+        return stages, stages.run()
+
+    def test_retry_resumes_after_last_finished_stage(self):
+        with self.assertRaises(StageError):
+            self.run_import(fail_report=True)
+        self.assertEqual(self.calls, ['download', 'scan', 'save', 'report'])
+
+        self.calls = []
+        stages, results = self.run_import()
+        self.assertEqual(self.calls, ['report'])
+        self.assertEqual(sorted(stages.resumed), ['download', 'save', 'scan'])
+        self.assertEqual(results['report'], '1/2/3')
+        np.testing.assert_array_equal(results['scan']['stats'], np.arange(3))
+
+    def test_changed_inputs_and_outputs_rerun_stages(self):
+        self.run_import()
+
+        # Same file name, new content: the download is resumed but everything
+        # keyed on its content runs again.
+        with open(self.input_filepath, 'w') as input_file:
+            input_file.write('1\t200\n')
+        checkpoints = StageCheckpoints(os.path.join(self.tmp_dir, 'checkpoints'), 'run')
+        checkpoints.clear('download')
+        self.calls = []
+        self.run_import()
+        self.assertEqual(self.calls, ['download', 'scan', 'save', 'report'])
+
+        # An output file that changed on disk invalidates its stage.
+        with open(os.path.join(self.tmp_dir, 'scan.bin'), 'a') as output:
+            output.write('truncated')
+        self.calls = []
+        self.run_import()
+        self.assertEqual(self.calls, ['scan', 'report'])
+
+        # Another run key shares nothing.
+        self.calls = []
+        self.run_import(run_key='other')
+        self.assertEqual(self.calls, ['download', 'scan', 'save', 'report'])
+
+    def test_unreadable_checkpoint_is_ignored(self):
+        checkpoints = StageCheckpoints(os.path.join(self.tmp_dir, 'checkpoints'), 'run')
+        key = checkpoints.stage_key('scan', ['abc'])
+        checkpoints.save('scan', key, {'count': 3})
+        self.assertEqual(checkpoints.load('scan', key), ({'count': 3}, key))
+        self.assertIsNone(checkpoints.load('scan', checkpoints.stage_key('scan', ['def'])))
+
+        with open(os.path.join(self.tmp_dir, 'checkpoints', 'scan.pickle'), 'wb') as result:
+            result.write(b'not a pickle')
+        self.assertIsNone(checkpoints.load('scan', key))
+
+    def test_discard_after_success_runs_everything_again(self):
+        self.run_import()
+        StageCheckpoints(os.path.join(self.tmp_dir, 'checkpoints'), 'run').discard()
+        self.calls = []
+        stages, results = self.run_import()
+        self.assertEqual(self.calls, ['download', 'scan', 'save', 'report'])
+        self.assertEqual(stages.resumed, [])
+
+    def test_run_lock_is_exclusive(self):
+        lock_filepath = os.path.join(self.tmp_dir, 'import.lock')
+        held = try_lock(lock_filepath)
+        self.assertIsNotNone(held)
+        self.assertIsNone(try_lock(lock_filepath))
+        held.close()
+        again = try_lock(lock_filepath)
+        self.assertIsNotNone(again)
+        again.close()
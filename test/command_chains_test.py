@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from kb_variation_importer.Utils.variation_importer_utils import run_command_chains
+
+
+class CommandChainsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_chains_run_concurrently_and_in_order(self):
+        out_filepath = os.path.join(self.tmp_dir, 'out.txt')
+        start = time.time()
+        results = run_command_chains([
+            [('first failed', ['sleep', '0.5'], self.tmp_dir)],
+            [('write failed', 'sleep 0.5; echo a > out.txt', self.tmp_dir),
+             ('append failed', 'echo b >> out.txt', self.tmp_dir)]
+        ], 2)
+        self.assertTrue(time.time() - start < 0.9)
+        self.assertEqual(results, [True, True])
+        with open(out_filepath) as out:
+            self.assertEqual(out.read().split(), ['a', 'b'])
+
+    def test_failed_step_does_not_stop_chain(self):
+        results = run_command_chains([
+            [('false failed', ['false'], self.tmp_dir),
+             ('touch failed', ['touch', 'after'], self.tmp_dir)]
+        ], 2)
+        self.assertEqual(results, [False])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'after')))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from kb_variation_importer.Utils.disk_cache import DiskLRUCache, is_versioned_ref
+
+
+class DiskLRUCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = os.path.join(tempfile.mkdtemp(), 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.cache_dir))
+
+    def test_versioned_ref(self):
+        self.assertTrue(is_versioned_ref('18590/2/8'))
+        self.assertFalse(is_versioned_ref('18590/2'))
+        self.assertFalse(is_versioned_ref('my_ws/my_assembly/1'))
+        self.assertFalse(is_versioned_ref(None))
+
+    def test_round_trip_across_instances(self):
+        contigs = {'Chr1': 30427671, 'Chr2': 19698289}
+        DiskLRUCache(self.cache_dir).put('18590/2/8', contigs)
+        self.assertEqual(DiskLRUCache(self.cache_dir).get('18590/2/8'), contigs)
+        self.assertIsNone(DiskLRUCache(self.cache_dir).get('18590/2/9'))
+
+    def test_evicts_least_recently_used(self):
+        value = dict(('contig_{}'.format(idx), idx) for idx in range(50))
+        cache = DiskLRUCache(self.cache_dir)
+        cache.put('1/1/1', value)
+        entry_size = os.path.getsize(os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0]))
+
+        cache = DiskLRUCache(self.cache_dir, max_bytes=2 * entry_size)
+        cache.put('1/2/1', value)
+        past = time.time() - 100
+        for name in os.listdir(self.cache_dir):
+            os.utime(os.path.join(self.cache_dir, name), (past, past))
+        # A hit makes 1/1/1 the most recently used entry.
+        self.assertEqual(cache.get('1/1/1'), value)
+        cache.put('1/3/1', value)
+
+        self.assertIsNotNone(cache.get('1/1/1'))
+        self.assertIsNone(cache.get('1/2/1'))
+        self.assertIsNotNone(cache.get('1/3/1'))
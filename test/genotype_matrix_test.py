@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from kb_variation_importer.Utils.genotype_matrix import (GenotypeMatrix,
+                                                         PackedGenotypeWriter,
+                                                         pack_genotypes,
+                                                         subset_genotype_matrix,
+                                                         unpack_genotypes)
+from kb_variation_importer.Utils.genotype_stats import GenotypeBlockReader, parse_genotype_block
+from kb_variation_importer.Utils.vcf_scanner import VCFScanner
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class GenotypeMatrixTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_pack_round_trip(self):
+        genotypes = np.random.RandomState(3).randint(-1, 3, size=(9, 13)).astype(np.int8)
+        packed = pack_genotypes(genotypes)
+        self.assertEqual(packed.shape, (9, 4))
+        np.testing.assert_array_equal(unpack_genotypes(packed, 13), genotypes)
+
+    def test_matrix_matches_vcf(self):
+        vcf_filepath = os.path.join(data_dir, 'test.vcf')
+        matrix_dir = os.path.join(self.tmp_dir, 'genotype_matrix')
+        reader = GenotypeBlockReader([PackedGenotypeWriter(matrix_dir)], block_size=64)
+        VCFScanner(vcf_filepath, [reader]).scan()
+
+        with open(vcf_filepath) as vcf:
+            records = [line.rstrip('\n').split('\t') for line in vcf if not line.startswith('#')]
+        expected = parse_genotype_block(records, 197)
+
+        matrix = GenotypeMatrix(matrix_dir)
+        self.assertEqual(matrix.num_variants, 217)
+        self.assertEqual(matrix.block_sizes, [64, 64, 64, 25])
+        self.assertEqual(matrix.variants()[0], ('1', 265099, 's1265099', 'T', 'A'))
+        np.testing.assert_array_equal(matrix.variant_genotypes(), expected)
+        np.testing.assert_array_equal(matrix.variant_genotypes(60, 70), expected[60:70])
+        np.testing.assert_array_equal(matrix.sample_genotypes([5, 0, 196]),
+                                      expected[:, [5, 0, 196]].T)
+
+    def test_subset_matches_vcf(self):
+        vcf_filepath = os.path.join(data_dir, 'test.vcf')
+        matrix_dir = os.path.join(self.tmp_dir, 'full_matrix')
+        reader = GenotypeBlockReader([PackedGenotypeWriter(matrix_dir)], block_size=64)
+        VCFScanner(vcf_filepath, [reader]).scan()
+        matrix = GenotypeMatrix(matrix_dir)
+        expected = matrix.variant_genotypes()
+
+        # Drop every third variant, all of the second block and a few samples.
+        variant_mask = np.arange(217) % 3 != 1
+        variant_mask[64:128] = False
+        samples = [sample for idx, sample in enumerate(matrix.samples) if idx % 10 != 4]
+        sample_indices = [idx for idx in range(197) if idx % 10 != 4]
+        subset = GenotypeMatrix(subset_genotype_matrix(
+            matrix_dir, os.path.join(self.tmp_dir, 'subset_matrix'), variant_mask, samples))
+
+        self.assertEqual(subset.samples, samples)
+        self.assertEqual(subset.num_variants, int(variant_mask.sum()))
+        self.assertEqual(len(subset.block_sizes), 3)
+        self.assertEqual(subset.variants(),
+                         [variant for variant, keep in zip(matrix.variants(), variant_mask)
+                          if keep])
+        np.testing.assert_array_equal(subset.variant_genotypes(),
+                                      expected[variant_mask][:, sample_indices])
+        np.testing.assert_array_equal(subset.sample_genotypes([0, 3, len(samples) - 1]),
+                                      expected[variant_mask][:, sample_indices][
+                                          :, [0, 3, len(samples) - 1]].T)
+
+        # With every variant kept the sample-major rows are selected without unpacking.
+        samples_only = GenotypeMatrix(subset_genotype_matrix(
+            matrix_dir, os.path.join(self.tmp_dir, 'samples_only'), None, samples[:5]))
+        np.testing.assert_array_equal(samples_only.sample_genotypes(range(5)),
+                                      expected[:, sample_indices[:5]].T)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from kb_variation_importer.Utils.genotype_stats import (GenotypeBlockReader,
+                                                        GenotypeStatsAccumulator,
+                                                        block_stats,
+                                                        hwe_exact,
+                                                        hwe_zoom_rows,
+                                                        parse_genotype_block,
+                                                        write_plink_frq,
+                                                        write_plink_hwe)
+from kb_variation_importer.Utils.vcf_scanner import VCFScanner, genotype_code
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+# Written by scripts/make_plink_fixtures.sh with plink 1.9.
+plink_dir = os.path.join(data_dir, 'plink')
+
+
+def read_plink_table(filepath):
+    with open(filepath) as table:
+        rows = [line.split() for line in table]
+    return [dict(zip(rows[0], row)) for row in rows[1:]]
+
+
+def plink_float(value):
+    return np.nan if value == 'NA' else float(value)
+
+
+def snp_hwe(obs_hets, obs_hom1, obs_hom2):
+    """Straightforward port of the Wigginton et al. exact HWE test (plink's SNPHWE)."""
+    obs_homc = max(obs_hom1, obs_hom2)
+    obs_homr = min(obs_hom1, obs_hom2)
+    rare_copies = 2 * obs_homr + obs_hets
+    genotypes = obs_hets + obs_homc + obs_homr
+    if genotypes == 0:
+        return 1.0
+
+    het_probs = [0.0] * (rare_copies + 1)
+    mid = rare_copies * (2 * genotypes - rare_copies) // (2 * genotypes)
+    if (mid % 2) != (rare_copies % 2):
+        mid += 1
+
+    het_probs[mid] = 1.0
+    total = 1.0
+    curr_hets = mid
+    curr_homr = (rare_copies - mid) // 2
+    curr_homc = genotypes - curr_hets - curr_homr
+    while curr_hets > 1:
+        het_probs[curr_hets - 2] = (het_probs[curr_hets] * curr_hets * (curr_hets - 1.0) /
+                                    (4.0 * (curr_homr + 1.0) * (curr_homc + 1.0)))
+        total += het_probs[curr_hets - 2]
+        curr_hets -= 2
+        curr_homr += 1
+        curr_homc += 1
+
+    curr_hets = mid
+    curr_homr = (rare_copies - mid) // 2
+    curr_homc = genotypes - curr_hets - curr_homr
+    while curr_hets <= rare_copies - 2:
+        het_probs[curr_hets + 2] = (het_probs[curr_hets] * 4.0 * curr_homr * curr_homc /
+                                    ((curr_hets + 2.0) * (curr_hets + 1.0)))
+        total += het_probs[curr_hets + 2]
+        curr_hets += 2
+        curr_homr -= 1
+        curr_homc -= 1
+
+    het_probs = [p / total for p in het_probs]
+    observed = het_probs[obs_hets]
+    p_value = sum(p for p in het_probs if p <= observed * (1 + 1e-7))
+    return min(1.0, p_value)
+
+
+class GenotypeStatsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_parse_block_matches_genotype_code(self):
+        records = [
+            ['1', '1', '.', 'A', 'C', '.', '.', '.', 'GT', '0/0', '0|1', '1/1', './.'],
+            ['1', '2', '.', 'A', 'C', '.', '.', '.', 'GT:DP', '0/0:3', '0/1:4', '1/1:2', '.:0'],
+            ['1', '3', '.', 'A', 'C,G', '.', '.', '.', 'GT', '0/2', '2/1', '10/0', '0']
+        ]
+        expected = [[genotype_code(gt) for gt in fields[9:]] for fields in records]
+        self.assertEqual(parse_genotype_block(records, 4).tolist(), expected)
+
+    def test_hwe_exact_matches_reference(self):
+        rng = np.random.RandomState(7)
+        hom1 = rng.randint(0, 60, 500)
+        het = rng.randint(0, 60, 500)
+        hom2 = rng.randint(0, 60, 500)
+        expected = [snp_hwe(h, a, b) for a, h, b in zip(hom1, het, hom2)]
+        np.testing.assert_allclose(hwe_exact(hom1, het, hom2), expected, rtol=1e-6)
+
+    def test_stats_match_per_record_counts_on_test_vcf(self):
+        reader = GenotypeBlockReader([GenotypeStatsAccumulator()], block_size=50)
+        results = VCFScanner(os.path.join(data_dir, 'test.vcf'), [reader]).scan()
+        stats = results['genotypes']['stats']
+        self.assertEqual(len(stats['maf']), 217)
+
+        with open(os.path.join(data_dir, 'test.vcf')) as vcf:
+            records = [line.rstrip('\n').split('\t') for line in vcf if not line.startswith('#')]
+        # Recount each record's genotypes in pure Python as an independent check.
+        for idx, fields in enumerate(records):
+            codes = [genotype_code(gt) for gt in fields[9:]]
+            called = [c for c in codes if c >= 0]
+            alt_freq = float(sum(called)) / (2 * len(called))
+            hom_ref, het, hom_alt = called.count(0), called.count(1), called.count(2)
+
+            self.assertAlmostEqual(stats['maf'][idx], min(alt_freq, 1 - alt_freq))
+            self.assertEqual(stats['nchrobs'][idx], 2 * len(called))
+            self.assertAlmostEqual(stats['hwe_p'][idx] / snp_hwe(het, hom_ref, hom_alt), 1.0)
+            self.assertEqual(sorted([stats['hom1'][idx], stats['hom2'][idx]]),
+                             sorted([hom_ref, hom_alt]))
+
+        frq_filepath = os.path.join(self.tmp_dir, 'test.vcf.frq')
+        hwe_filepath = os.path.join(self.tmp_dir, 'test.vcf.hwe')
+        write_plink_frq(stats, frq_filepath)
+        write_plink_hwe(stats, hwe_filepath)
+        with open(frq_filepath) as frq:
+            rows = [line.split() for line in frq]
+        self.assertEqual(rows[0][4], 'MAF')
+        self.assertEqual(len(rows), 218)
+        with open(hwe_filepath) as hwe:
+            rows = [line.split() for line in hwe]
+        self.assertEqual(rows[0][8], 'P')
+        self.assertEqual(rows[1][:5], ['1', 's1265099', 'ALL', 'A', 'T'])
+
+        # The zoom subset matches awk '{ if ($9 < threshold) print }' minus the header.
+        threshold = float(np.median(stats['hwe_p'][np.isfinite(stats['hwe_p'])]))
+        zoom_filepath = hwe_filepath + '.zoom'
+        write_plink_hwe(stats, zoom_filepath, hwe_zoom_rows(stats, threshold))
+        with open(zoom_filepath) as zoom:
+            zoom_rows = [line.split() for line in zoom]
+        self.assertEqual(zoom_rows[0], rows[0])
+        self.assertEqual(zoom_rows[1:],
+                         [row for row in rows[1:] if row[8] != 'NA' and float(row[8]) < threshold])
+        self.assertTrue(len(zoom_rows) > 1)
+
+    def test_parity_with_plink_on_test_vcf(self):
+        frq_filepath = os.path.join(plink_dir, 'test.vcf.frq')
+        hwe_filepath = os.path.join(plink_dir, 'test.vcf.hwe')
+        if not (os.path.exists(frq_filepath) and os.path.exists(hwe_filepath)):
+            self.skipTest('no plink output; run scripts/make_plink_fixtures.sh')
+        reader = GenotypeBlockReader([GenotypeStatsAccumulator()], block_size=50)
+        stats = VCFScanner(os.path.join(data_dir, 'test.vcf'), [reader]).scan()[
+            'genotypes']['stats']
+
+        frq = read_plink_table(frq_filepath)
+        hwe = read_plink_table(hwe_filepath)
+        self.assertEqual([row['SNP'] for row in frq], stats['id'])
+        self.assertEqual([row['SNP'] for row in hwe], stats['id'])
+        # plink prints four significant digits.
+        tolerance = {'rtol': 1e-3, 'atol': 1e-4, 'equal_nan': True}
+        np.testing.assert_allclose(stats['maf'], [plink_float(row['MAF']) for row in frq],
+                                   **tolerance)
+        np.testing.assert_array_equal(stats['nchrobs'], [int(row['NCHROBS']) for row in frq])
+        for column, key in (('O(HET)', 'o_het'), ('E(HET)', 'e_het'), ('P', 'hwe_p')):
+            np.testing.assert_allclose(stats[key], [plink_float(row[column]) for row in hwe],
+                                       err_msg=column, **tolerance)
+
+    def test_vcf_without_records(self):
+        vcf_filepath = os.path.join(self.tmp_dir, 'empty.vcf')
+        with open(os.path.join(data_dir, 'test.vcf')) as vcf, open(vcf_filepath, 'w') as empty:
+            empty.writelines(line for line in vcf if line.startswith('#'))
+        reader = GenotypeBlockReader([GenotypeStatsAccumulator()])
+        stats = VCFScanner(vcf_filepath, [reader]).scan()['genotypes']['stats']
+        merged = GenotypeStatsAccumulator().merge([(0, stats), (0, stats)])
+        for result in (stats, merged):
+            self.assertEqual(result['contig'], [])
+            for key in ('pos', 'maf', 'nchrobs', 'hom1', 'het', 'hom2', 'o_het', 'e_het',
+                        'hwe_p', 'missing', 'a1_is_alt'):
+                self.assertEqual(len(result[key]), 0, key)
+            self.assertEqual(result['pos'].dtype, np.int64)
+            self.assertEqual(result['a1_is_alt'].dtype, bool)
+            self.assertEqual(len(hwe_zoom_rows(result)), 0)
+
+    def test_block_stats_minor_allele(self):
+        genotypes = np.array([[2, 2, 1, 0], [0, 0, -1, -1]], dtype=np.int8)
+        stats = block_stats(genotypes)
+        self.assertEqual(stats['a1_is_alt'].tolist(), [False, True])
+        self.assertAlmostEqual(stats['maf'][0], 3.0 / 8)
+        self.assertEqual(stats['maf'][1], 0.0)
+        self.assertEqual(stats['missing'].tolist(), [0, 2])
+        self.assertEqual(stats['hwe_p'][1], 1.0)
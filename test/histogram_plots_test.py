@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from kb_variation_importer.Utils.histogram_plots import histogram, histogram_svg
+
+SVG = '{http://www.w3.org/2000/svg}'
+
+
+class HistogramPlotsTest(unittest.TestCase):
+
+    def test_histogram_ignores_missing_values(self):
+        values = np.array([0.0, 0.1, 0.1, np.nan, 0.5, np.inf])
+        counts, edges = histogram(values, bins=5)
+        self.assertEqual(counts.sum(), 4)
+        self.assertEqual(len(edges), 6)
+
+        counts, edges = histogram(np.array([np.nan]), bins=5)
+        self.assertEqual(counts.sum(), 0)
+
+    def test_svg_has_one_bar_per_non_empty_bin(self):
+        values = np.random.RandomState(0).uniform(0, 0.5, 1000)
+        counts, edges = histogram(values)
+        root = ElementTree.fromstring(histogram_svg(values, 'Minor <Allele> Frequencies', 'MAF'))
+        bars = [rect for rect in root.iter(SVG + 'rect') if rect.get('stroke')]
+        self.assertEqual(len(bars), np.count_nonzero(counts))
+        titles = [text.text for text in root.iter(SVG + 'text')]
+        self.assertIn('Minor <Allele> Frequencies', titles)
+
+    def test_empty_svg_is_valid(self):
+        root = ElementTree.fromstring(histogram_svg(np.array([]), 'Empty', 'HWE_ZOOM'))
+        self.assertEqual(root.tag, SVG + 'svg')
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from kb_variation_importer.Utils.import_jobs import ImportJobQueue, ImportProgress
+from kb_variation_importer.Utils.parallel_scanner import ParallelVCFScanner
+from kb_variation_importer.Utils.stage_executor import StageExecutor
+from kb_variation_importer.Utils.vcf_scanner import HeaderCollector
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def header_consumers():
+    return [HeaderCollector()]
+
+
+class ImportJobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = ImportJobQueue(os.path.join(self.tmp_dir, 'jobs'), max_workers=2)
+
+    def tearDown(self):
+        self.queue.join()
+        shutil.rmtree(self.tmp_dir)
+
+    def wait_for(self, job_id, states=('completed', 'error')):
+        for _ in range(200):
+            status = self.queue.status(job_id)
+            if status['state'] in states:
+                return status
+            time.sleep(0.05)
+        self.fail("Job {} did not finish".format(job_id))
+
+    def test_progress_throughput_and_eta(self):
+        status_filepath = os.path.join(self.tmp_dir, 'status.json')
+        progress = ImportProgress(status_filepath, 'job', min_write_interval=3600)
+        progress.started_running()
+        progress.stage_started('scan')
+        progress.set_total_bytes(1000)
+        progress.scan_started -= 2
+        progress.scan_progress(250, 50)
+
+        status = progress.to_dict()
+        self.assertEqual(status['running_stages'], ['scan'])
+        self.assertAlmostEqual(status['bytes_per_second'], 125, delta=5)
+        self.assertAlmostEqual(status['records_per_second'], 25, delta=1)
+        self.assertAlmostEqual(status['eta_seconds'], 6, delta=0.5)
+        # Scan updates within the write interval are not written out.
+        with open(status_filepath) as status_file:
+            self.assertEqual(json.load(status_file)['bytes_processed'], 0)
+
+        progress.stage_finished('scan', 2.5)
+        with open(status_filepath) as status_file:
+            written = json.load(status_file)
+        self.assertEqual(written['bytes_processed'], 250)
+        self.assertEqual(written['running_stages'], [])
+        self.assertEqual(written['completed_stages'], [{'name': 'scan', 'seconds': 2.5}])
+
+    def test_job_runs_stages_in_background(self):
+        release = threading.Event()
+
+        def run_import(progress):
+            stages = StageExecutor(listener=progress)
+            stages.add('download', lambda: 'file.vcf')
+            stages.add('wait', lambda filename: release.wait(5), ['download'])
+            stages.add('report', lambda filename, wait: {'report_name': filename},
+                       ['download', 'wait'])
+            return stages.run()['report']
+
+        job_id = self.queue.submit(run_import, 'alice')
+        status = self.wait_for(job_id, ['running'])
+        for _ in range(100):
+            if 'wait' in status['running_stages']:
+                break
+            time.sleep(0.05)
+            status = self.queue.status(job_id)
+        self.assertEqual(status['running_stages'], ['wait'])
+        self.assertEqual([stage['name'] for stage in status['completed_stages']], ['download'])
+
+        release.set()
+        status = self.wait_for(job_id)
+        self.assertEqual(status['state'], 'completed')
+        self.assertEqual(status['result'], {'report_name': 'file.vcf'})
+        self.assertEqual([stage['name'] for stage in status['completed_stages']],
+                         ['download', 'wait', 'report'])
+        self.assertEqual(self.queue.status(job_id, 'alice')['job_id'], job_id)
+        with self.assertRaises(ValueError):
+            self.queue.status(job_id, 'mallory')
+
+    def test_failed_and_unknown_jobs(self):
+        def fail(progress):
+            raise ValueError('no such file')
+
+        status = self.wait_for(self.queue.submit(fail))
+        self.assertEqual(status['state'], 'error')
+        self.assertEqual(status['error'], 'no such file')
+
+        for job_id in ('../../etc/passwd', '00000000-0000-0000-0000-000000000000', None):
+            with self.assertRaises(ValueError):
+                self.queue.status(job_id)
+
+    def test_job_of_exited_process_is_failed(self):
+        job_id = '11111111-2222-3333-4444-555555555555'
+        progress = ImportProgress(self.queue._status_filepath(job_id), job_id)
+        progress.started_running()
+        status_filepath = self.queue._status_filepath(job_id)
+        with open(status_filepath) as status_file:
+            status = json.load(status_file)
+        # Find a PID that is not in use.
+        status['pid'] = 2 ** 22 + 1
+        while os.path.exists('/proc/{}'.format(status['pid'])):
+            status['pid'] += 1
+        with open(status_filepath, 'w') as status_file:
+            json.dump(status, status_file)
+        self.assertEqual(self.queue.status(job_id)['state'], 'error')
+
+    def test_scan_progress_reaches_total(self):
+        vcf_filepath = os.path.join(data_dir, 'test.vcf')
+        for processes in (1, 3):
+            updates = []
+            ParallelVCFScanner(vcf_filepath, header_consumers, processes=processes,
+                               min_chunk_size=1,
+                               progress=lambda *update: updates.append(update)).scan()
+            self.assertEqual(updates[-1], (os.path.getsize(vcf_filepath), 217))
@@ -133,4 +133,13 @@ class kb_variation_importerTest(unittest.TestCase):
         
         ret = self.getImpl().import_variation(self.getContext(), params)[0]
         self.assertIsNotNone(ret['report_ref'], ret['report_name'])
+
+        if ret['variation_ref']:
+            query_params = {
+                'variation_ref': ret['variation_ref'],
+                'regions': ['Chr1:1-1000000'],
+                'samples': []
+            }
+            query = self.getImpl().query_variation_regions(self.getContext(), query_params)[0]
+            self.assertEqual(len(query['regions']), 1)
         pass
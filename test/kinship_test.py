@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+
+import numpy as np
+
+from kb_variation_importer.Utils.genotype_stats import GenotypeBlockReader, parse_genotype_block
+from kb_variation_importer.Utils.kinship import KinshipAccumulator
+from kb_variation_importer.Utils.vcf_scanner import VCFScanner
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class KinshipTest(unittest.TestCase):
+
+    def _scan(self, standardize):
+        reader = GenotypeBlockReader([KinshipAccumulator(standardize)], block_size=50)
+        results = VCFScanner(os.path.join(data_dir, 'test.vcf'), [reader]).scan()
+        return results['genotypes']['kinship']
+
+    def _genotypes(self):
+        with open(os.path.join(data_dir, 'test.vcf')) as vcf:
+            records = [line.rstrip('\n').split('\t') for line in vcf if not line.startswith('#')]
+        return parse_genotype_block(records, 197).astype(np.float64)
+
+    def test_vanraden_matches_full_matrix(self):
+        kinship = self._scan(standardize=False)
+        self.assertEqual(len(kinship['row_ids']), 197)
+        self.assertEqual(kinship['row_ids'], kinship['col_ids'])
+
+        genotypes = self._genotypes()
+        p = genotypes.mean(axis=1) / 2
+        z = genotypes - 2 * p[:, None]
+        expected = np.dot(z.T, z) / (2 * (p * (1 - p)).sum())
+        np.testing.assert_allclose(kinship['kinship_coefficients'], expected, atol=1e-10)
+
+    def test_standardized_matches_full_matrix(self):
+        kinship = self._scan(standardize=True)
+
+        genotypes = self._genotypes()
+        p = genotypes.mean(axis=1) / 2
+        keep = (p > 0) & (p < 1)
+        z = (genotypes[keep] - 2 * p[keep, None]) / np.sqrt(2 * p[keep] * (1 - p[keep]))[:, None]
+        expected = np.dot(z.T, z) / keep.sum()
+        np.testing.assert_allclose(kinship['kinship_coefficients'], expected, atol=1e-10)
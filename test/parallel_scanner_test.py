@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import functools
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from kb_variation_importer.Utils.genotype_matrix import GenotypeMatrix
+from kb_variation_importer.Utils.parallel_scanner import (ParallelVCFScanner,
+                                                          _plain_pieces,
+                                                          chunk_lines)
+from kb_variation_importer.Utils.variation_importer_utils import scan_consumers
+from kb_variation_importer.Utils.vcf_scanner import VCFScanner
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class ParallelVCFScannerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_chunk_lines_cover_every_line_once(self):
+        filepath = os.path.join(self.tmp_dir, 'lines.txt')
+        lines = [b'line %d %s\n' % (idx, b'x' * (idx % 7)) for idx in range(40)]
+        with open(filepath, 'wb') as handle:
+            handle.write(b''.join(lines))
+        size = os.path.getsize(filepath)
+
+        for split in range(1, size):
+            first = list(chunk_lines(_plain_pieces(filepath, 0, split), True))
+            second = list(chunk_lines(_plain_pieces(filepath, split, None), False))
+            self.assertEqual(first + second, lines)
+
+    def _compare(self, vcf_filepath):
+        serial_dir = os.path.join(self.tmp_dir, 'serial')
+        parallel_dir = os.path.join(self.tmp_dir, 'parallel')
+        serial = VCFScanner(vcf_filepath, scan_consumers(serial_dir)).scan()
+        parallel = ParallelVCFScanner(vcf_filepath, functools.partial(scan_consumers, parallel_dir),
+                                      processes=4, min_chunk_size=1).scan()
+
+        self.assertEqual(serial['header'], parallel['header'])
+        self.assertEqual(serial['counts'], parallel['counts'])
+        self.assertEqual(serial['structure'], parallel['structure'])
+
+        serial_stats = serial['genotypes']['stats']
+        parallel_stats = parallel['genotypes']['stats']
+        self.assertEqual(sorted(serial_stats), sorted(parallel_stats))
+        for key in serial_stats:
+            if key in ('contig', 'id', 'ref', 'alt'):
+                self.assertEqual(serial_stats[key], parallel_stats[key])
+            else:
+                np.testing.assert_allclose(serial_stats[key], parallel_stats[key], rtol=1e-12)
+
+        np.testing.assert_allclose(serial['genotypes']['kinship']['kinship_coefficients'],
+                                   parallel['genotypes']['kinship']['kinship_coefficients'])
+        # The chunks' kinship sums went through disk and are gone after the merge.
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'kinship_parts')))
+        np.testing.assert_array_equal(GenotypeMatrix(serial_dir).variant_genotypes(),
+                                      GenotypeMatrix(parallel_dir).variant_genotypes())
+        self.assertEqual(GenotypeMatrix(parallel_dir).variants(),
+                         GenotypeMatrix(serial_dir).variants())
+        return parallel
+
+    def test_parallel_matches_serial(self):
+        results = self._compare(os.path.join(data_dir, 'test.vcf'))
+        self.assertEqual(results['counts']['num_variants'], 217)
+
+    def test_errors_across_chunks(self):
+        vcf_filepath = os.path.join(self.tmp_dir, 'unsorted.vcf')
+        with open(os.path.join(data_dir, 'test.vcf')) as vcf:
+            lines = vcf.readlines()
+        records = [idx for idx, line in enumerate(lines) if not line.startswith('#')]
+        # Swap two records far apart and append one contig out of place.
+        a, b = records[10], records[150]
+        lines[a], lines[b] = lines[b], lines[a]
+        lines.append(lines[records[0]])
+        with open(vcf_filepath, 'w') as vcf:
+            vcf.writelines(lines)
+
+        results = self._compare(vcf_filepath)
+        self.assertTrue(results['structure']['error_count'] >= 3)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import functools
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from kb_variation_importer.Utils.bgzf import BgzfReader
+from kb_variation_importer.Utils.checkpoints import file_digest
+from kb_variation_importer.Utils.genotype_matrix import GenotypeMatrix, subset_genotype_matrix
+from kb_variation_importer.Utils.kinship import matrix_kinship
+from kb_variation_importer.Utils.parallel_scanner import ParallelVCFScanner
+from kb_variation_importer.Utils.qc_filter import qc_thresholds, site_filter_reasons
+from kb_variation_importer.Utils.tabix import TabixIndex, fetch
+from kb_variation_importer.Utils.variation_importer_utils import scan_consumers
+from kb_variation_importer.Utils.vcf_scanner import VCFScanner
+
+GENOTYPES = {0: '0/0', 1: '0/1', 2: '1/1', -1: './.'}
+
+
+def write_vcf(filepath, genotypes, samples):
+    with open(filepath, 'w') as vcf:
+        vcf.write('##fileformat=VCFv4.2\n##contig=<ID=1>\n')
+        vcf.write('\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO',
+                             'FORMAT'] + samples) + '\n')
+        for idx, row in enumerate(genotypes):
+            vcf.write('\t'.join(['1', str(100 * (idx + 1)), 'rs{}'.format(idx), 'A', 'G', '.',
+                                 'PASS', '.', 'GT'] + [GENOTYPES[code] for code in row]) + '\n')
+
+
+def read_records(filepath):
+    reader = BgzfReader(filepath)
+    reader.seek(0)
+    lines = []
+    while True:
+        line = reader.readline().decode('latin-1')
+        if not line:
+            break
+        lines.append(line.rstrip('\n').split('\t'))
+    reader.close()
+    return lines
+
+
+class QCFilterTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(3)
+        cls.samples = ['s{}'.format(idx) for idx in range(12)]
+        genotypes = rng.choice([0, 1, 2], size=(300, 12), p=[0.6, 0.3, 0.1])
+        genotypes[rng.rand(300, 12) < 0.03] = -1
+        # Two samples with mostly missing calls and a block of rare sites.
+        genotypes[:, 4] = np.where(rng.rand(300) < 0.5, -1, genotypes[:, 4])
+        genotypes[:, 9] = np.where(rng.rand(300) < 0.4, -1, genotypes[:, 9])
+        genotypes[50:80] = np.where(genotypes[50:80] == -1, -1, 0)
+        genotypes[50:80, 0] = 1
+        cls.genotypes = genotypes
+        cls.vcf_filepath = os.path.join(cls.tmp_dir, 'qc.vcf')
+        write_vcf(cls.vcf_filepath, genotypes, cls.samples)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_thresholds_from_params(self):
+        self.assertEqual(qc_thresholds({'maf_threshold': 5, 'geno_missingness': '10',
+                                        'indiv_missingness': None, 'hwe_threshold': 1e-6}),
+                         {'maf': 0.05, 'geno': 0.1, 'hwe': 1e-6})
+        self.assertEqual(qc_thresholds({}), {})
+        with self.assertRaises(ValueError):
+            qc_thresholds({'maf_threshold': 120})
+        with self.assertRaises(ValueError):
+            qc_thresholds({'hwe_threshold': 2})
+
+    def test_site_filter_reasons(self):
+        genotypes = np.array([[0, 0, 0, 1], [0, -1, -1, 2], [0, 0, 0, 0]], dtype=np.int8)
+        self.assertEqual(site_filter_reasons(genotypes, {'maf': 0.2, 'geno': 0.25}),
+                         [['maf'], ['geno'], ['maf']])
+        self.assertEqual(site_filter_reasons(genotypes, {}), [[], [], []])
+
+    def scan(self, output_dir, thresholds, parallel):
+        consumers = functools.partial(scan_consumers, os.path.join(output_dir, 'matrix'),
+                                      None, os.path.join(output_dir, 'qc'), thresholds)
+        if parallel:
+            return ParallelVCFScanner(self.vcf_filepath, consumers, processes=3,
+                                      min_chunk_size=1).scan()
+        return VCFScanner(self.vcf_filepath, consumers()).scan()
+
+    def test_filters_match_statistics(self):
+        thresholds = qc_thresholds({'maf_threshold': 5, 'geno_missingness': 10,
+                                    'indiv_missingness': 30, 'hwe_threshold': 1e-4})
+        serial = self.scan(os.path.join(self.tmp_dir, 'serial'), thresholds, False)
+        parallel = self.scan(os.path.join(self.tmp_dir, 'parallel'), thresholds, True)
+
+        stats = serial['genotypes']['stats']
+        missing_rate = stats['missing'] / float(len(self.samples))
+        with np.errstate(invalid='ignore'):
+            kept = ((missing_rate <= 0.1) & (stats['maf'] >= 0.05) & (stats['hwe_p'] >= 1e-4))
+        self.assertTrue(0 < kept.sum() < len(kept))
+
+        sample_missing = (self.genotypes == -1).sum(axis=0)
+        for results in (serial, parallel):
+            qc = results['genotypes']['qc']
+            self.assertEqual(qc['dropped_samples'], ['s4', 's9'])
+            self.assertEqual(qc['samples'], [s for s in self.samples if s not in ('s4', 's9')])
+            self.assertEqual(qc['sample_missing'], sample_missing.tolist())
+            self.assertEqual(qc['num_sites'], 300)
+            self.assertEqual(qc['num_dropped_sites'], int((~kept).sum()))
+            np.testing.assert_array_equal(qc['site_mask'], kept)
+
+            self.assertEqual(qc['sha1'], file_digest(qc['bgzf_filepath']))
+            records = read_records(qc['bgzf_filepath'])
+            header = [line for line in records if line[0].startswith('#CHROM')][0]
+            self.assertEqual(header[9:], qc['samples'])
+            sites = [line for line in records if not line[0].startswith('#')]
+            self.assertEqual([line[2] for line in sites],
+                             ['rs{}'.format(idx) for idx in np.flatnonzero(kept)])
+            self.assertTrue(all(len(line) == 19 for line in sites))
+
+            with open(qc['dropped_sites_filepath']) as dropped:
+                rows = [line.rstrip('\n').split('\t') for line in dropped]
+            self.assertEqual(rows[0], ['#CHROM', 'POS', 'ID', 'FILTERS'])
+            self.assertEqual([row[2] for row in rows[1:]],
+                             ['rs{}'.format(idx) for idx in np.flatnonzero(~kept)])
+            with open(qc['dropped_samples_filepath']) as dropped:
+                self.assertEqual(dropped.read().split(), ['s4', 's9'])
+
+            index = TabixIndex.read(qc['index_filepath'])
+            fetched = list(fetch(qc['bgzf_filepath'], index, '1', 1, 30000))
+            self.assertEqual(fetched, sites)
+            self.assertNotIn('kinship', results['genotypes'])
+
+        # Kinship after QC covers only the kept sites and samples.
+        matrix_dir = subset_genotype_matrix(os.path.join(self.tmp_dir, 'serial', 'matrix'),
+                                            os.path.join(self.tmp_dir, 'serial', 'matrix_qc'),
+                                            kept, serial['genotypes']['qc']['samples'])
+        kinship = matrix_kinship(GenotypeMatrix(matrix_dir))
+        self.assertEqual(kinship['row_ids'], serial['genotypes']['qc']['samples'])
+        genotypes = self.genotypes[kept][:, [idx for idx in range(12) if idx not in (4, 9)]]
+        called = genotypes != -1
+        p = np.where(called, genotypes, 0).sum(axis=1) / (2.0 * called.sum(axis=1))
+        z = np.where(called, genotypes - 2 * p[:, None], 0.0)
+        np.testing.assert_allclose(kinship['kinship_coefficients'],
+                                   np.dot(z.T, z) / (2 * p * (1 - p)).sum(), atol=1e-10)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import requests
+from mock import patch
+
+from kb_variation_importer.Utils import service_resolver
+from kb_variation_importer.Utils.service_resolver import ServiceResolver
+
+WIZARD_URL = 'https://kbase.test/services/service_wizard'
+
+
+class FakeBaseClient(object):
+    """Stands in for BaseClient, recording every call per URL."""
+    calls = []
+    unreachable = set()
+
+    def __init__(self, url, token=None):
+        self.url = url
+
+    def call_method(self, service_method, args, service_ver=None):
+        FakeBaseClient.calls.append((self.url, service_method))
+        if self.url in FakeBaseClient.unreachable:
+            raise requests.exceptions.ConnectionError(self.url)
+        if service_method == 'ServiceWizard.get_service_status':
+            return {'url': 'https://kbase.test/dynserv/{}.{}'.format(
+                args[0]['module_name'], len(FakeBaseClient.calls))}
+        return '1/2/3'
+
+
+@patch.object(service_resolver, 'BaseClient', new=FakeBaseClient)
+class ServiceResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        FakeBaseClient.calls = []
+        FakeBaseClient.unreachable = set()
+        service_resolver._service_urls.clear()
+
+    def wizard_calls(self):
+        return [call for call in FakeBaseClient.calls if call[0] == WIZARD_URL]
+
+    def test_url_is_looked_up_once_per_ttl(self):
+        for _ in range(50):
+            resolver = ServiceResolver(WIZARD_URL, 'token')
+            self.assertEqual(resolver.call_method('GenomeAnnotationAPI.get_assembly',
+                                                  [{'ref': '4/5/6'}]), '1/2/3')
+        self.assertEqual(len(self.wizard_calls()), 1)
+
+        service_resolver._service_urls.clear()
+        ServiceResolver(WIZARD_URL, 'token', ttl=-1).service_url('GenomeAnnotationAPI')
+        ServiceResolver(WIZARD_URL, 'token', ttl=-1).service_url('GenomeAnnotationAPI')
+        self.assertEqual(len(self.wizard_calls()), 3)
+
+    def test_unreachable_service_is_looked_up_again(self):
+        resolver = ServiceResolver(WIZARD_URL, 'token')
+        stale_url = resolver.service_url('GenomeAnnotationAPI')
+        FakeBaseClient.unreachable.add(stale_url)
+
+        self.assertEqual(resolver.call_method('GenomeAnnotationAPI.get_assembly',
+                                              [{'ref': '4/5/6'}]), '1/2/3')
+        self.assertEqual(len(self.wizard_calls()), 2)
+        self.assertNotEqual(resolver.service_url('GenomeAnnotationAPI'), stale_url)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import time
+import traceback
+import unittest
+
+from kb_variation_importer.Utils.stage_executor import StageError, StageExecutor
+
+
+class StageExecutorTest(unittest.TestCase):
+
+    def test_dependencies_and_overlap(self):
+        order = []
+        lock = threading.Lock()
+
+        def stage(name, result, delay=0.0):
+            def run(*args):
+                time.sleep(delay)
+                with lock:
+                    order.append(name)
+                return result(*args)
+            return run
+
+        stages = StageExecutor(max_workers=4)
+        stages.add('a', stage('a', lambda: 2, 0.2))
+        stages.add('b', stage('b', lambda: 3, 0.2))
+        stages.add('c', stage('c', lambda a, b: a * b), ['a', 'b'])
+        stages.add('d', stage('d', lambda c, a: c + a), ['c', 'a'])
+        results = stages.run()
+
+        self.assertEqual(results, {'a': 2, 'b': 3, 'c': 6, 'd': 8})
+        self.assertEqual(order[2:], ['c', 'd'])
+        # a and b ran side by side.
+        self.assertTrue(stages.elapsed() < 0.35)
+        self.assertEqual(sorted(stages.timings), ['a', 'b', 'c', 'd'])
+
+    def test_error_stops_dependent_stages(self):
+        ran = []
+
+        def fail():
+            raise ValueError('download failed')
+
+        stages = StageExecutor()
+        stages.add('download', fail)
+        stages.add('lookup', lambda: ran.append('lookup') or 'ref')
+        stages.add('scan', lambda download: ran.append('scan'), ['download'])
+        try:
+            stages.run()
+            self.fail('run() did not raise')
+        except StageError as e:
+            error = e
+            frames = traceback.extract_tb(sys.exc_info()[2])
+        self.assertNotIn('scan', ran)
+        self.assertEqual(error.stage, 'download')
+        self.assertIsInstance(error.error, ValueError)
+        self.assertEqual(str(error), 'Stage download failed: ValueError: download failed')
+        # The traceback reaches the line that raised in the worker thread.
+        self.assertEqual(frames[-1][2], 'fail')
+
+    def test_undefined_requirement(self):
+        stages = StageExecutor()
+        with self.assertRaises(ValueError):
+            stages.add('scan', lambda download: None, ['download'])
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import functools
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from kb_variation_importer.Utils.bgzf import MAX_BLOCK_DATA, _compress_block
+from kb_variation_importer.Utils.checkpoints import file_digest
+from kb_variation_importer.Utils.parallel_scanner import ParallelVCFScanner
+from kb_variation_importer.Utils.tabix import (BgzfVcfWriter, TabixIndex, fetch,
+                                               parse_region, reg2bin, reg2bins)
+from kb_variation_importer.Utils.vcf_scanner import VCFHeader, VCFScanner
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def bgzf_consumers(bgzf_filepath):
+    return [BgzfVcfWriter(bgzf_filepath)]
+
+
+class TabixTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.vcf_filepath = os.path.join(data_dir, 'test.vcf')
+        with open(cls.vcf_filepath) as vcf:
+            cls.vcf_text = vcf.read()
+        cls.records = [line.split('\t') for line in cls.vcf_text.splitlines()
+                       if line and not line.startswith('#')]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def _expected(self, contig, start, end):
+        return [fields for fields in self.records
+                if fields[0] == contig and int(fields[1]) <= end and
+                int(fields[1]) + len(fields[3]) - 1 >= start]
+
+    def _check_queries(self, result):
+        self.assertEqual(result['sha1'], file_digest(result['bgzf_filepath']))
+        index = TabixIndex.read(result['index_filepath'])
+        positions = [int(fields[1]) for fields in self.records]
+        regions = [(contig, 1, 1 << 29) for contig in '12345']
+        regions += [(fields[0], int(fields[1]), int(fields[1]) + 2000000)
+                    for fields in self.records[::17]]
+        regions += [('1', 1, min(positions) - 1), ('missing', 1, 100)]
+        for contig, start, end in regions:
+            self.assertEqual(list(fetch(result['bgzf_filepath'], index, contig, start, end)),
+                             self._expected(contig, start, end))
+
+    def test_bins(self):
+        self.assertEqual(reg2bin(0, 1), 4681)
+        self.assertEqual(reg2bin(0, 1 << 14), 4681)
+        self.assertEqual(reg2bin(0, (1 << 14) + 1), 585)
+        self.assertEqual(reg2bin(0, 1 << 29), 0)
+        for beg, end in ((0, 1), (100000, 300000), (5 << 20, 9 << 20)):
+            self.assertIn(reg2bin(beg, end), reg2bins(beg, end))
+
+    def test_parse_region(self):
+        self.assertEqual(parse_region('chr3:1,000,000-2,000,000'), ('chr3', 1000000, 2000000))
+        self.assertEqual(parse_region('chr3:42'), ('chr3', 42, 42))
+        self.assertEqual(parse_region('chr3')[:2], ('chr3', 1))
+
+    def test_serial_bgzf_and_index(self):
+        bgzf_filepath = os.path.join(self.tmp_dir, 'serial.vcf.gz')
+        result = VCFScanner(self.vcf_filepath, bgzf_consumers(bgzf_filepath)).scan()['bgzf']
+        with gzip.open(result['bgzf_filepath'], 'rt') as bgzf_file:
+            self.assertEqual(bgzf_file.read(), self.vcf_text)
+        self._check_queries(result)
+
+    def test_parallel_bgzf_and_index(self):
+        bgzf_filepath = os.path.join(self.tmp_dir, 'parallel.vcf.gz')
+        result = ParallelVCFScanner(self.vcf_filepath,
+                                    functools.partial(bgzf_consumers, bgzf_filepath),
+                                    processes=4, min_chunk_size=1).scan()['bgzf']
+        with gzip.open(result['bgzf_filepath'], 'rt') as bgzf_file:
+            self.assertEqual(bgzf_file.read(), self.vcf_text)
+        self._check_queries(result)
+
+        # The BGZF output can itself be split on block boundaries.
+        rescanned = ParallelVCFScanner(result['bgzf_filepath'],
+                                       functools.partial(bgzf_consumers,
+                                                         os.path.join(self.tmp_dir, 're.vcf.gz')),
+                                       processes=3, min_chunk_size=1).scan()['bgzf']
+        self._check_queries(rescanned)
+
+    def test_incompressible_records(self):
+        rng = random.Random(11)
+        payload = [c for c in map(chr, range(256)) if c not in '\t\n\r']
+        # Even stored, a full block of random bytes fits in 64 KiB.
+        block = _compress_block(bytes(bytearray(rng.getrandbits(8)
+                                                for _ in range(MAX_BLOCK_DATA))), 0)
+        self.assertIsNotNone(block)
+        self.assertTrue(len(block) <= 1 << 16)
+
+        header = VCFHeader()
+        header.fileformat = '##fileformat=VCFv4.2'
+        header.columns = ['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
+        writer = BgzfVcfWriter(os.path.join(self.tmp_dir, 'random.vcf.gz'))
+        writer.start(header)
+        records = []
+        for idx in range(40):
+            info = ''.join(rng.choice(payload) for _ in range(rng.randint(1, 20000)))
+            fields = ['1', str(1000 * (idx + 1)), '.', 'A', 'C', '.', '.', info]
+            writer.consume(idx, fields)
+            records.append(fields)
+        result = writer.finish()
+
+        index = TabixIndex.read(result['index_filepath'])
+        self.assertEqual(list(fetch(result['bgzf_filepath'], index, '1', 1, 1 << 29)), records)
+        for fields in records[::7]:
+            pos = int(fields[1])
+            self.assertEqual(list(fetch(result['bgzf_filepath'], index, '1', pos, pos)),
+                             [fields])
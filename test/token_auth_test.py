@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from mock import MagicMock, patch
+
+from kb_variation_importer.Utils.token_auth import KBaseAuth, TokenCache, get_token_cache_params
+
+
+def auth_response(status_code, body):
+    response = MagicMock()
+    response.ok = status_code == 200
+    response.status_code = status_code
+    response.reason = 'Unauthorized' if status_code == 401 else 'Error'
+    response.json.return_value = body
+    return response
+
+
+VALID = auth_response(200, {'user_id': 'alice'})
+INVALID = auth_response(401, {'error': {'message': 'Invalid token'}})
+UNAVAILABLE = auth_response(503, {'error': {'message': 'Down for maintenance'}})
+RATE_LIMITED = auth_response(429, {'error': {'message': 'Too many requests'}})
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    @patch('kb_variation_importer.Utils.token_auth.requests.post', return_value=VALID)
+    def test_valid_token_is_cached(self, post):
+        auth = KBaseAuth('http://auth')
+        for _ in range(5):
+            self.assertEqual(auth.get_user('token'), 'alice')
+        self.assertEqual(post.call_count, 1)
+        stats = auth.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (4, 1, 1))
+
+    @patch('kb_variation_importer.Utils.token_auth.requests.post', return_value=INVALID)
+    def test_rejected_token_is_cached(self, post):
+        auth = KBaseAuth('http://auth')
+        for _ in range(3):
+            with self.assertRaises(ValueError) as error:
+                auth.get_user('bad token')
+            self.assertIn('Invalid token', str(error.exception))
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(auth.cache_stats()['negative_hits'], 2)
+
+    @patch('kb_variation_importer.Utils.token_auth.requests.post', return_value=UNAVAILABLE)
+    def test_auth_service_errors_are_not_cached(self, post):
+        auth = KBaseAuth('http://auth')
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                auth.get_user('token')
+        self.assertEqual(post.call_count, 2)
+
+    @patch('kb_variation_importer.Utils.token_auth.requests.post', return_value=RATE_LIMITED)
+    def test_rate_limited_lookups_are_not_cached(self, post):
+        auth = KBaseAuth('http://auth')
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                auth.get_user('token')
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(auth.cache_stats()['size'], 0)
+
+    def test_token_cache_params(self):
+        self.assertEqual(get_token_cache_params(None), {})
+        config = {'auth-cache-size': '10', 'auth-cache-ttl': '60',
+                  'auth-cache-negative-ttl': '0'}
+        self.assertEqual(get_token_cache_params(config),
+                         {'cache_size': 10, 'cache_ttl': 60.0, 'negative_cache_ttl': 0.0})
+
+    def test_entries_expire(self):
+        cache = TokenCache(ttl=0.05, negative_ttl=0)
+        cache.add_valid_token('token', 'alice')
+        cache.add_invalid_token('bad token', 'Invalid token')
+        self.assertEqual(cache.get_user('token'), 'alice')
+        self.assertEqual(cache.lookup('bad token'), (None, None))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get_user('token'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_size_is_bounded(self):
+        cache = TokenCache(maxsize=10)
+
+        def add(start):
+            for idx in range(start, start + 100):
+                cache.add_valid_token('token {}'.format(idx), 'user {}'.format(idx))
+
+        threads = [threading.Thread(target=add, args=(100 * idx,)) for idx in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = cache.stats()
+        self.assertEqual(stats['size'], 10)
+        self.assertEqual(stats['evictions'], 390)
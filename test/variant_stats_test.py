@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from kb_variation_importer.Utils.genotype_stats import (GenotypeBlockReader,
+                                                        GenotypeStatsAccumulator,
+                                                        write_plink_frq,
+                                                        write_plink_hwe)
+from kb_variation_importer.Utils.variant_stats import VariantStats, write_stats_columns
+from kb_variation_importer.Utils.vcf_scanner import VCFScanner
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class VariantStatsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        reader = GenotypeBlockReader([GenotypeStatsAccumulator()], block_size=50)
+        results = VCFScanner(os.path.join(data_dir, 'test.vcf'), [reader]).scan()
+        cls.stats = results['genotypes']['stats']
+        with open(os.path.join(data_dir, 'test.vcf')) as vcf:
+            columns = next(line for line in vcf if line.startswith('#CHROM')).split('\t')
+        cls.num_samples = len(columns) - 9
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_round_trip_is_memory_mapped(self):
+        directory = write_stats_columns(self.stats, os.path.join(self.tmp_dir, 'round_trip'),
+                                        self.num_samples)
+        columns = VariantStats(directory)
+        self.assertEqual(columns.num_variants, 217)
+        self.assertEqual(sorted(columns.keys()),
+                         sorted(list(self.stats.keys()) + ['missing_rate']))
+        for name in self.stats:
+            np.testing.assert_array_equal(columns[name], np.asarray(self.stats[name]))
+        self.assertIsInstance(columns['maf'], np.memmap)
+        self.assertEqual(columns['pos'][0], 265099)
+        np.testing.assert_allclose(columns['missing_rate'],
+                                   np.asarray(self.stats['missing']) / float(self.num_samples))
+        self.assertIsNone(columns.get('dosage'))
+        with self.assertRaises(KeyError):
+            columns['dosage']
+
+    def test_text_export_from_columns(self):
+        directory = write_stats_columns(self.stats, os.path.join(self.tmp_dir, 'export'))
+        columns = VariantStats(directory)
+        self.assertNotIn('missing_rate', columns)
+        for write in (write_plink_frq, write_plink_hwe):
+            from_memory = os.path.join(self.tmp_dir, write.__name__ + '.memory')
+            from_columns = os.path.join(self.tmp_dir, write.__name__ + '.columns')
+            write(self.stats, from_memory)
+            write(columns, from_columns)
+            with open(from_memory) as expected, open(from_columns) as actual:
+                self.assertEqual(actual.read(), expected.read())
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from kb_variation_importer.Utils import variation_importer_utils
+
+
+class ShockDeduplicationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.vcf_filepath = os.path.join(self.tmp_dir, 'variations.vcf.gz')
+        with open(self.vcf_filepath, 'wb') as vcf:
+            vcf.write(b'not really bgzf')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def importer(self):
+        utility_params = {'scratch': self.tmp_dir, 'srv-wiz-url': 'http://localhost/wiz',
+                          'workspace-url': 'http://localhost/ws',
+                          'callback_url': 'http://localhost/callback', 'token': 'token'}
+        with patch.object(variation_importer_utils, 'DataFileUtil'), \
+                patch.object(variation_importer_utils, 'KBaseReport'), \
+                patch.object(variation_importer_utils, 'Workspace'), \
+                patch.object(variation_importer_utils, 'ServiceResolver'):
+            vu = variation_importer_utils.variation_importer_utils(utility_params)
+        vu.dfu = MagicMock()
+        vu.dfu.file_to_shock.return_value = {'shock_id': 'node1', 'handle': {'hid': 'KBH_1'}}
+        vu.dfu.own_shock_node.return_value = {'shock_id': 'node2', 'handle': {'hid': 'KBH_2'}}
+        return vu
+
+    def test_identical_file_reuses_node(self):
+        upload_params = {'file_path': self.vcf_filepath, 'make_handle': 1}
+        first = self.importer()
+        self.assertEqual(first._file_to_shock(dict(upload_params))['shock_id'], 'node1')
+
+        # A later import on the same host, e.g. under another object name.
+        second = self.importer()
+        self.assertEqual(second._file_to_shock(dict(upload_params))['shock_id'], 'node2')
+        second.dfu.file_to_shock.assert_not_called()
+        second.dfu.own_shock_node.assert_called_once_with({'shock_id': 'node1',
+                                                           'make_handle': 1})
+
+        # Packed differently, the content on shock differs.
+        second._file_to_shock(dict(upload_params, pack='gzip'))
+        self.assertEqual(second.dfu.file_to_shock.call_count, 1)
+
+    def test_unusable_node_is_uploaded_again(self):
+        upload_params = {'file_path': self.vcf_filepath, 'make_handle': 1}
+        self.importer()._file_to_shock(dict(upload_params))
+        vu = self.importer()
+        vu.dfu.own_shock_node.side_effect = ValueError('node not found')
+        self.assertEqual(vu._file_to_shock(dict(upload_params))['shock_id'], 'node1')
+        vu.dfu.file_to_shock.assert_called_once_with(upload_params)
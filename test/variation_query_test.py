@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from kb_variation_importer.Utils.tabix import BgzfVcfWriter, TabixIndex
+from kb_variation_importer.Utils.variation_query_utils import query_regions
+from kb_variation_importer.Utils.vcf_scanner import VCFScanner, genotype_code
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class CountingFile(object):
+    """Seekable file wrapper recording how many bytes were read."""
+
+    def __init__(self, filepath):
+        self.handle = open(filepath, 'rb')
+        self.bytes_read = 0
+
+    def seek(self, position):
+        self.handle.seek(position)
+
+    def read(self, size):
+        data = self.handle.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class VariationQueryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.bgzf_filepath = os.path.join(cls.tmp_dir, 'variations.vcf.gz')
+        result = VCFScanner(os.path.join(data_dir, 'test.vcf'),
+                            [BgzfVcfWriter(cls.bgzf_filepath)]).scan()['bgzf']
+        cls.index = TabixIndex.read(result['index_filepath'])
+        with open(os.path.join(data_dir, 'test.vcf')) as vcf:
+            lines = [line.rstrip('\n').split('\t') for line in vcf if not line.startswith('##')]
+        cls.samples = lines[0][9:]
+        cls.records = lines[1:]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_region_with_sample_subset(self):
+        target = self.records[100]
+        region = '{}:{}-{}'.format(target[0], int(target[1]) - 50000, int(target[1]) + 50000)
+        samples = [self.samples[5], self.samples[0]]
+        results = query_regions(self.bgzf_filepath, self.index, [region], samples=samples)
+
+        self.assertEqual(results['samples'], samples)
+        expected = [fields for fields in self.records
+                    if fields[0] == target[0] and
+                    abs(int(fields[1]) - int(target[1])) <= 50000]
+        variants = results['regions'][0]['variants']
+        self.assertEqual([variant['id'] for variant in variants],
+                         [fields[2] for fields in expected])
+        self.assertEqual([variant['genotypes'] for variant in variants],
+                         [[genotype_code(fields[14]), genotype_code(fields[9])]
+                          for fields in expected])
+
+    def test_unknown_sample(self):
+        with self.assertRaises(ValueError):
+            query_regions(self.bgzf_filepath, self.index, ['1'], samples=['no_such_sample'])
+
+    def test_reads_only_indexed_blocks(self):
+        source = CountingFile(self.bgzf_filepath)
+        contig = self.records[-1][0]
+        results = query_regions(source, self.index, ['{}:{}'.format(contig, self.records[-1][1])],
+                                include_genotypes=0)
+        self.assertEqual(len(results['regions'][0]['variants']), 1)
+        self.assertNotIn('genotypes', results['regions'][0]['variants'][0])
+        self.assertTrue(source.bytes_read < os.path.getsize(self.bgzf_filepath))
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from kb_variation_importer.Utils.vcf_scanner import (HeaderCollector,
+                                                     RecordCounter,
+                                                     StructuralChecker,
+                                                     VCFScanner,
+                                                     genotype_code)
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class VCFScannerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_genotype_code(self):
+        self.assertEqual(genotype_code('0/0'), 0)
+        self.assertEqual(genotype_code('0|1:12,3'), 1)
+        self.assertEqual(genotype_code('1/1'), 2)
+        self.assertEqual(genotype_code('./.'), -1)
+        self.assertEqual(genotype_code('10/0'), 1)
+
+    def test_single_pass_consumers(self):
+        consumers = [HeaderCollector(), RecordCounter(), StructuralChecker()]
+        results = VCFScanner(os.path.join(data_dir, 'test_with_chr.vcf.gz'), consumers).scan()
+
+        self.assertEqual(results['header']['version'], 4.1)
+        self.assertEqual(results['header']['contigs'], ['1', 'Chr2', 'Chr3', 'Chr4', 'Chr5'])
+        self.assertEqual(len(results['header']['genotypes']), 197)
+        self.assertEqual(results['counts']['num_variants'], 217)
+        self.assertEqual(results['structure']['error_count'], 0)
+        self.assertEqual(results['structure']['undeclared_contigs'], ['Chr1'])
+
+    def test_structural_errors(self):
+        vcf_filepath = os.path.join(self.tmp_dir, 'broken.vcf')
+        with open(vcf_filepath, 'w') as vcf:
+            vcf.write('##fileformat=VCFv4.1\n')
+            vcf.write('##contig=<ID=1,length=100>\n')
+            vcf.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ta\tb\n')
+            vcf.write('1\t20\t.\tA\tC\t.\tPASS\t.\tGT\t0/0\t0/1\n')
+            vcf.write('1\t10\t.\tA\tC\t.\tPASS\t.\tGT\t0/0\t0/1\n')
+            vcf.write('2\tx\t.\tA\tC\t.\tPASS\t.\tGT\t0/0\t0/1\n')
+            vcf.write('1\t30\t.\tA\tC\t.\tPASS\t.\tGT\t0/0\n')
+
+        results = VCFScanner(vcf_filepath, [StructuralChecker()]).scan()['structure']
+        self.assertEqual([e['line'] for e in results['errors']], [5, 6, 7])
+        self.assertEqual(results['undeclared_contigs'], ['2'])
+
+    def test_missing_fileformat(self):
+        vcf_filepath = os.path.join(self.tmp_dir, 'no_fileformat.vcf')
+        with open(vcf_filepath, 'w') as vcf:
+            vcf.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ta\n')
+
+        with self.assertRaises(ValueError):
+            VCFScanner(vcf_filepath, [HeaderCollector()]).scan()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import json
+import multiprocessing
+import os
+import threading
+import time
+import unittest
+
+import requests
+
+from kb_variation_importer.wsgi_workers import get_server_mode_params, make_wsgi_server
+
+
+def pid_app(environ, start_response):
+    if environ['PATH_INFO'] == '/slow':
+        time.sleep(1.0)
+    body = json.dumps({'pid': os.getpid()}).encode('utf-8')
+    start_response('200 OK', [('Content-Type', 'application/json'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def wait_for_background_work():
+    time.sleep(5.0)
+
+
+def serve(mode, port_queue, **kwargs):
+    httpd = make_wsgi_server('127.0.0.1', 0, pid_app, mode, **kwargs)
+    port_queue.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+class WSGIWorkersTest(unittest.TestCase):
+
+    def start(self, mode, **kwargs):
+        ports = multiprocessing.Queue()
+        process = multiprocessing.Process(target=serve, args=(mode, ports), kwargs=kwargs)
+        process.start()
+        self.addCleanup(process.join)
+        self.addCleanup(process.terminate)
+        return 'http://127.0.0.1:{}'.format(ports.get(timeout=10))
+
+    def get(self, url):
+        return requests.get(url, timeout=10, headers={'Connection': 'close'}).json()
+
+    def test_prefork_recycles_workers(self):
+        url = self.start('prefork', workers=2, max_requests=2)
+        ready = self.get(url + '/ready')
+        self.assertEqual(ready['state'], 'ready')
+        pids = [self.get(url + '/call')['pid'] for _ in range(5)]
+        # Each worker serves at most two requests before it is replaced.
+        self.assertTrue(len(set([ready['pid']] + pids)) >= 3)
+
+    def test_prefork_replaces_draining_workers(self):
+        url = self.start('prefork', workers=1, max_requests=1,
+                         on_worker_exit=wait_for_background_work)
+        pids = []
+        start = time.time()
+        for _ in range(3):
+            pids.append(self.get(url + '/call')['pid'])
+        # Retired workers are still waiting, yet their replacements serve.
+        self.assertEqual(len(set(pids)), 3)
+        self.assertTrue(time.time() - start < 3.0)
+
+    def test_slow_request_does_not_block_others(self):
+        for mode in ('threaded', 'prefork'):
+            url = self.start(mode, workers=2)
+            slow = threading.Thread(target=self.get, args=(url + '/slow',))
+            slow.start()
+            time.sleep(0.2)
+            start = time.time()
+            self.get(url + '/fast')
+            self.assertTrue(time.time() - start < 0.5, mode)
+            slow.join()
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            make_wsgi_server('127.0.0.1', 0, pid_app, 'forking')
+
+    def test_server_mode_params(self):
+        self.assertEqual(get_server_mode_params({}),
+                         {'mode': 'single', 'workers': 4, 'max_requests': 0})
+        config = {'server-mode': 'prefork', 'server-workers': '5',
+                  'server-max-requests': '1000'}
+        self.assertEqual(get_server_mode_params(config),
+                         {'mode': 'prefork', 'workers': 5, 'max_requests': 1000})